@@ -0,0 +1,80 @@
+#!/usr/bin/env python3.4
+# coding: utf-8
+
+"""
+Reports the memory taken by parsed ASTs, in bytes per node.
+
+Usage: python benchmarks/ast_memory.py [file.poop ...] [--repeat N]
+
+Without files, the statements of examples/test.poop are repeated to make a
+larger program. The memory counted is what the parsed programs keep alive:
+the nodes, their values and their locations, but not the sources.
+"""
+
+import os
+import sys
+import argparse
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from poop.parser import Parser, walk
+
+EXAMPLE = os.path.join(os.path.dirname(__file__), os.pardir,
+                       'examples', 'test.poop')
+
+
+def example_source(repeat):
+    """
+    Returns the example program with its statements repeated.
+    """
+
+    with open(EXAMPLE) as example:
+        header, body = example.read().split('\n', 1)
+
+    return '{}\n{}'.format(header, body * repeat)
+
+
+def measure(sources):
+    """
+    Parses the given sources, and returns the number of nodes and the number
+    of bytes allocated for the resulting programs.
+    """
+
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+
+    programs = [Parser(code, path).run() for path, code in sources]
+
+    size = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+
+    count = sum(1 for program in programs for node in walk(program))
+    return count, size
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.strip())
+    arg_parser.add_argument('files', nargs='*', help='poop source files')
+    arg_parser.add_argument('--repeat', type=int, default=1000,
+                            help='repetitions of the example statements')
+    args = arg_parser.parse_args()
+
+    if args.files:
+        sources = []
+
+        for path in args.files:
+            with open(path) as source:
+                sources.append((path, source.read()))
+    else:
+        sources = [(EXAMPLE, example_source(args.repeat))]
+
+    count, size = measure(sources)
+
+    print('nodes:          {}'.format(count))
+    print('bytes:          {}'.format(size))
+    print('bytes per node: {:.1f}'.format(size / count))
+
+
+if __name__ == '__main__':
+    main()
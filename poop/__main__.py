@@ -6,62 +6,125 @@ Entry for the poop parser/lexer/compiler/interpreter.
 """
 
 import os
+import sys
 import signal
 import argparse
+import functools
 
-from poop.parser import Parser, tokenize
+from poop.parser import Parser, ASTCache, tokenize_file, parse_parallel
 from poop.compiler import Compiler
+from poop.prelude import default_env
+from poop.optimizer import OPTIMIZATION_LEVELS
 from poop.exception import ParseError
 from poop.repl import REPL
 
 
 class Call(argparse.Action):
+	"""
+	Selects the function called with the argument values and the options,
+	once all the arguments are parsed.
+	"""
+
 	def __init__(self, func, *args, **kwds):
 		super().__init__(*args, **kwds)
 		self.func = func
 
 	def __call__(self, parser, namespace, values, option_string=None):
-		setattr(namespace, self.dest, self.func(values))
+		setattr(namespace, self.dest, values)
+		namespace.command = functools.partial(self.func, values)
+
+
+def compiler_options(args):
+	"""
+	Returns the compiler options given on the command line.
+	"""
+
+	return {
+		'optimize': args.optimize,
+		'report': sys.stderr if args.report_passes else None,
+	}
+
+
+def parse_file(path, jobs=None):
+	"""
+	Parses a file, through the AST cache named by POOP_AST_CACHE if it is set.
+	If `jobs` is given, the file is parsed in that many processes.
+	"""
+
+	cache = ASTCache.from_environment()
+
+	if jobs is None:
+		if cache is None:
+			return Parser.from_file(path).run()
+
+		return cache.parse_file(path)
+
+	with open(path) as file:
+		code = file.read()
+
+	program = None if cache is None else cache.load(code, path)
+
+	if program is None:
+		program = parse_parallel(code, path, jobs)
+
+		if cache is not None:
+			cache.store(code, program)
+
+	return program
+
 
+def execute(path, args):
+	options = compiler_options(args)
 
-def execute(path):
-	if path.endswith('.poopc'):
+	if path == '-':
+		Compiler.execute_stream(sys.stdin.buffer, '<stdin>', **options)
+	elif path.endswith('.poopc'):
 		Compiler.execute_compiled_file(path)
 	else:
-		compiler = Compiler.from_file(path)
+		# the environment is dropped once the program is run: the variables
+		# need not be left in it, and the optimizer may remove them
+		compiler = Compiler(
+			parse_file(path, args.jobs), path, prelude=default_env, exports=(),
+			**options)
 		compiler.execute()
 
 
-def lex(path):
-	with open(path) as file:
-		code = file.read()
+def stream(path, args):
+	options = compiler_options(args)
+
+	if path == '-':
+		Compiler.execute_stream(sys.stdin.buffer, '<stdin>', **options)
+	else:
+		with open(path, 'rb') as source:
+			Compiler.execute_stream(source, path, **options)
 
-		try:
-			token_queue = tokenize(code)
-		except ParseError as err:
-			print(err)
-		else:
-			for token in tokenize(code):
-				print(token)
 
+def lex(path, args):
+	try:
+		for token in tokenize_file(path):
+			print(token)
+	except ParseError as err:
+		print(err)
 
-def parse(path):
-	parser = Parser.from_file(path)
 
+def parse(path, args):
 	try:
-		tree = parser.run()
+		tree = parse_file(path, args.jobs)
 	except ParseError as err:
 		print(err)
 	else:
 		print(tree)
 
 
-def compile(path):
-	compiler = Compiler.from_file(path)
+def compile(path, args):
+	# the compiled files are run in environments dropped afterwards
+	compiler = Compiler(
+		parse_file(path, args.jobs), path, prelude=default_env, exports=(),
+		**compiler_options(args))
 	compiler.dump()
 
 
-def interactive(path=None):
+def interactive(path, args):
 	repl = REPL()
 	signal.signal(signal.SIGINT, lambda *_: repl.quit())
 
@@ -73,9 +136,36 @@ def interactive(path=None):
 
 arg_parser = argparse.ArgumentParser(
 	prog='acid',
-	description="Tokenize, parse, compile or execute the given input file"
+	description="Tokenize, parse, compile or execute the given input file",
+	epilog='Parsed files are cached in the directory named by the {} '
+		'environment variable, if it is set.'.format(ASTCache.ENV_VAR)
 )
 
+arg_parser.set_defaults(command=None)
+
+arg_parser.add_argument(
+	'-O',
+	dest='optimize',
+	metavar='LEVEL',
+	type=int,
+	choices=OPTIMIZATION_LEVELS,
+	default=0,
+	help='optimization level of the compiled code: 0 (default), 1 or 2')
+
+arg_parser.add_argument(
+	'--report-passes',
+	action='store_true',
+	help='print the time taken by each optimization pass and the nodes it '
+		'rewrote')
+
+arg_parser.add_argument(
+	'--jobs', '-j',
+	dest='jobs',
+	metavar='N',
+	type=int,
+	default=None,
+	help='parse the input file in N processes')
+
 action = arg_parser.add_mutually_exclusive_group()
 
 action.add_argument(
@@ -84,7 +174,16 @@ action.add_argument(
 	metavar='PATH',
 	action=Call,
 	func=execute,
-	help='executes the given file')
+	help='executes the given file, or the standard input if PATH is -')
+
+action.add_argument(
+	'--stream', '-s',
+	dest='path',
+	metavar='PATH',
+	action=Call,
+	func=stream,
+	help='executes the given file, or the standard input if PATH is -, '
+		'one statement at a time as it is read')
 
 action.add_argument(
 	'--lex', '-l',
@@ -122,4 +221,10 @@ action.add_argument(
 
 
 if __name__ == '__main__':
-	arg_parser.parse_args()
+	args = arg_parser.parse_args()
+
+	if args.jobs is not None and args.jobs < 1:
+		arg_parser.error('the number of jobs must be at least 1')
+
+	if args.command is not None:
+		args.command(args)
@@ -3,3 +3,8 @@
 
 from poop.compiler.compiler import *
 from poop.compiler.translations import *
+from poop.compiler.pyast import *
+from poop.compiler.scopes import *
+from poop.compiler.strings import *
+from poop.compiler.invariants import *
+from poop.compiler.loops import *
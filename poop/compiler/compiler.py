@@ -11,32 +11,269 @@ import sys
 import ast
 import marshal
 import inspect
+import threading
 from functools import wraps
 
-from poop.parser import Parser
+from poop.parser import Parser, Program
 from poop.prelude import default_env
+from poop.registry import Registry
+from poop.optimizer import PassManager, DeadStoreElimination
+from poop.compiler.scopes import resolve_names, check_loop_depth
+from poop.compiler.scopes import wrap_in_function
+
+
+def _set_lineno(py_node, node):
+	"""
+	Gives a Python AST node the lines of the poop node it translates.
+	"""
+
+	if node.start is not None:
+		py_node.lineno = node.lines.locate(node.start)[0]
+		py_node.end_lineno = node.lines.locate(node.end)[0]
+
+	return py_node
+
+
+def fix_locations(py_ast):
+	"""
+	Iterative version of `ast.fix_missing_locations`: sets the missing
+	locations of the nodes of a Python AST to those of their parent, in a
+	single pass. Returns the number of levels of the AST.
+	"""
+
+	depth = 0
+	stack = [(py_ast, 1, 1, 0, 1, 0)]
+
+	while stack:
+		node, level, lineno, col_offset, end_lineno, end_col_offset = stack.pop()
+		attributes = node._attributes
+
+		if level > depth:
+			depth = level
+
+		if 'lineno' in attributes:
+			if getattr(node, 'lineno', None) is None:
+				node.lineno = lineno
+			else:
+				lineno = node.lineno
+
+		if 'end_lineno' in attributes:
+			if getattr(node, 'end_lineno', None) is None:
+				node.end_lineno = end_lineno
+			else:
+				end_lineno = node.end_lineno
+
+		if 'col_offset' in attributes:
+			if getattr(node, 'col_offset', None) is None:
+				node.col_offset = col_offset
+			else:
+				col_offset = node.col_offset
+
+		if 'end_col_offset' in attributes:
+			if getattr(node, 'end_col_offset', None) is None:
+				node.end_col_offset = end_col_offset
+			else:
+				end_col_offset = node.end_col_offset
+
+		for child in ast.iter_child_nodes(node):
+			stack.append((child, level + 1, lineno, col_offset, end_lineno,
+				end_col_offset))
+
+	return depth
+
+
+# stack size reserved per level of the Python ASTs compiled in a thread
+STACK_PER_LEVEL = 1 << 10
+
+# The recursion limit and the stack size of new threads are process-wide: the
+# threads compiling deep ASTs raise the limit while any of them runs, and the
+# last one restores it. Thread stack sizes are only set to start a thread.
+_limit_lock = threading.Lock()
+_limit_users = 0
+_base_limit = None
+
+
+def _recursion_limit():
+	"""
+	Returns the recursion limit, as it was before deep ASTs raised it.
+	"""
+
+	with _limit_lock:
+		return _base_limit if _limit_users else sys.getrecursionlimit()
+
+
+def _raise_recursion_limit(depth):
+	"""
+	Raises the recursion limit for an AST of `depth` levels, until
+	`_restore_recursion_limit` is called.
+	"""
+
+	global _limit_users, _base_limit
+
+	with _limit_lock:
+		if not _limit_users:
+			_base_limit = sys.getrecursionlimit()
+
+		_limit_users += 1
+		sys.setrecursionlimit(
+			max(sys.getrecursionlimit(), _base_limit + depth))
+
+
+def _restore_recursion_limit():
+	global _limit_users, _base_limit
+
+	with _limit_lock:
+		_limit_users -= 1
+
+		if not _limit_users:
+			sys.setrecursionlimit(_base_limit)
+			_base_limit = None
+
+
+def _start_thread(thread, stack_size):
+	"""
+	Starts a thread with a given stack size.
+	"""
+
+	with _limit_lock:
+		previous_size = threading.stack_size(stack_size)
+
+		try:
+			thread.start()
+		finally:
+			threading.stack_size(previous_size)
+
+
+def compile_ast(py_ast, filename, depth):
+	"""
+	Compiles a Python AST of `depth` levels to a code object. The builtin
+	`compile` recurses once per level of the AST: deep ASTs are compiled in a
+	thread with a stack large enough for them, under a raised recursion limit.
+	"""
+
+	limit = _recursion_limit()
+
+	if depth < limit // 2:
+		return compile(py_ast, filename, mode='exec')
+
+	# the compiled code, or the raised exception
+	result = []
+
+	def _compile():
+		try:
+			result.append(compile(py_ast, filename, mode='exec'))
+		except Exception as exc:
+			result.append(exc)
+
+	stack_size = (limit + depth) * STACK_PER_LEVEL
+	stack_size += -stack_size % 4096
+
+	_raise_recursion_limit(depth)
+
+	try:
+		thread = threading.Thread(target=_compile)
+		_start_thread(thread, stack_size)
+		thread.join()
+	finally:
+		_restore_recursion_limit()
+
+	if isinstance(result[0], Exception):
+		raise result[0]
+
+	return result[0]
 
 
 class Compiler:
 	"""
 	Compiles an poop AST to a Python AST.
+
+	The translations are read from the frozen registry, or from the table
+	given to the compiler, so that compilers can run in several threads.
+
+	The AST is first optimized by the passes of the optimization level
+	`optimize`, or by the given `passes`, and the Python AST translated from
+	it by their Python passes. If `report` is a file, the time taken by each
+	pass and the nodes it rewrote are printed to it.
+
+	From level 2, the Python passes build the strings which loops build by
+	concatenation from lists of parts instead, compute loop invariants before
+	their loops, and compile counter loops to `for` loops over ranges. With
+	`fast_locals`, which is also the default from level 2, the program is
+	compiled into the body of a function so that its variables are locals.
+
+	Only the variables among `exports`, or all of them if it is None, are left
+	in the environment: the passes may remove the others, and with
+	`fast_locals`, they are not written to the environment.
+
+	If `prelude` is given, it holds the names of the environment the code will
+	run in: reading any other name which the program does not declare raises
+	CompileError, and with `fast_locals`, the prelude functions are read once
+	instead of at each call.
 	"""
 
-	translations = {}
+	# node type -> registered translation, frozen by the first compiler created
+	translations = Registry('compiler translations')
 
-	def __init__(self, ast, path=None):
+	def __init__(self, ast, path=None, translations=None, optimize=0,
+			report=None, fast_locals=None, exports=None, prelude=None,
+			passes=None):
 		self.ast = ast
 		self.path = path
+		self.optimize = optimize
+		self.report = report
+
+		if fast_locals is None:
+			fast_locals = optimize >= 2
+
+		self.fast_locals = fast_locals
+		self.exports = exports
+		self.prelude = prelude
+		self.passes = passes
+
+		# the translations used by this compiler, the registered ones by default
+		if translations is None:
+			translations = Compiler.translations.freeze()
+
+		self.translations = translations
 
 	@classmethod
-	def from_file(cls, path):
+	def from_file(cls, path, **options):
 		"""
-		Loads the poop AST from a given path.
+		Loads the poop AST from a given path. `options` are given to the
+		compiler.
 		"""
 
 		parser = Parser.from_file(path)
 		ast = parser.run()
-		return cls(ast, path)
+		return cls(ast, path, **options)
+
+	@classmethod
+	def execute_stream(cls, stream, path=None, prelude=default_env,
+			mute_env=False, **options):
+		"""
+		Executes a poop program read from a stream, compiling and running each
+		top-level statement in the same environment as soon as it is parsed.
+		`options` are given to the compiler of each statement.
+
+		The variables declared by a statement may be read by the following
+		ones, which the compiler of the statement does not see: dead stores are
+		not eliminated.
+		"""
+
+		if mute_env:
+			env = prelude
+		else:
+			env = prelude.copy()
+
+		if options.get('passes') is None:
+			level = PassManager(options.get('optimize', 0))
+			options['passes'] = [
+				pass_type for pass_type in level.pipeline
+				if pass_type is not DeadStoreElimination
+			]
+
+		for stmt in Parser.parse_stream(stream, path):
+			cls(Program([stmt], path), path, **options).load(env)
 
 	@classmethod
 	def execute_compiled_file(cls, path, prelude=default_env, mute_env=False):
@@ -60,20 +297,24 @@ class Compiler:
 	def register(cls, *node_types):
 		"""
 		Registers a translation from an poop AST node to a Python AST node.
+
+		A translation can be a generator function yielding the poop nodes it
+		needs translated, which receives their Python nodes in return.
 		"""
 
 		def _decorator_wrapper(translation):
-			@wraps(translation)
-			def _translation_wrapper(self, node):
-				py_node = translation(self, node)
-
-				if node.pos is not None:
-					py_node.lineno = node.pos.line
-
-				return py_node
+			if inspect.isgeneratorfunction(translation):
+				@wraps(translation)
+				def _translation_wrapper(self, node):
+					py_node = yield from translation(self, node)
+					return _set_lineno(py_node, node)
+			else:
+				@wraps(translation)
+				def _translation_wrapper(self, node):
+					return _set_lineno(translation(self, node), node)
 
 			for node_type in node_types:
-				cls.translations[node_type] = _translation_wrapper
+				cls.translations.add(node_type, _translation_wrapper)
 
 			return _translation_wrapper
 
@@ -82,19 +323,59 @@ class Compiler:
 	def translate(self, node):
 		"""
 		Translates an poop AST node into a Python AST node.
+
+		Generator translations are run on an explicit stack, so that the
+		nesting depth of the AST does not grow the Python stack. The locations
+		of the resulting nodes are not fixed.
 		"""
 
-		py_ast = self.translations[type(node)](self, node)
-		return ast.fix_missing_locations(py_ast)
+		# the running generator translations
+		stack = []
+		py_node = self.translations[type(node)](self, node)
+
+		while True:
+			if inspect.isgenerator(py_node):
+				stack.append(py_node)
+				py_node = None
+			elif not stack:
+				return py_node
+
+			try:
+				sub_node = stack[-1].send(py_node)
+			except StopIteration as stop:
+				stack.pop()
+				py_node = stop.value
+			else:
+				py_node = self.translations[type(sub_node)](self, sub_node)
 
 	def compile(self):
 		"""
 		Compiles the poop AST to a Python code object.
 		"""
 
-		py_ast = self.translate(self.ast)
+		# undefined names are reported whatever code the optimizer removes
+		bound = ()
+
+		if self.prelude is not None:
+			bound = resolve_names(self.ast, self.prelude)
+
+		passes = PassManager(self.optimize, self.passes, self.exports)
+		program = passes.run(self.ast)
+		check_loop_depth(program)
+
+		py_ast = self.translate(program)
+		py_ast = passes.run(py_ast, stage='python')
+
+		if self.report is not None:
+			passes.report(self.report)
+
+		if self.fast_locals:
+			py_ast = wrap_in_function(
+				py_ast, program, self.exports, bound)
+
+		depth = fix_locations(py_ast)
 
-		code = compile(py_ast, self.path or '<string>', mode='exec')
+		code = compile_ast(py_ast, self.path or '<string>', depth)
 		return code
 
 	def dump(self, target=None):
@@ -0,0 +1,291 @@
+#!/usr/bin/env python3.4
+# coding: utf-8
+
+"""
+This module defines the hoisting of loop invariants out of compiled loops.
+
+An invariant of a loop is an operation on literals and on variables which the
+loop does not assign, such as `((limit * 2 tons of shit) - offset)`: it has
+the same value each time the loop computes it. The invariants of a loop are
+computed once, into temporaries read by the loop instead.
+
+Operations on the values of poop have no side effects, but may raise, so the
+invariants are only computed if the loop runs, and when it would first compute
+them:
+
+ - the invariants of the condition of a loop are computed by a first
+   evaluation of the condition, which skips the loop if it is false. Those
+   which the condition may not evaluate are not hoisted;
+
+ - the invariants of its body are then computed. If one of them raises, the
+   loop falls back to computing them itself, and raises when it would.
+"""
+
+__all__ = ['LoopInvariantHoisting']
+
+import ast as python_ast
+import itertools
+
+from poop.optimizer import PassManager
+from poop.compiler.pyast import PythonPass, parse_stmts, copy_tree
+from poop.compiler.pyast import stored_names
+
+
+# prefix of the names of the temporaries holding invariants
+INVARIANT_PREFIX = '__poop_invariant_'
+
+# Python expressions which may be invariant operations
+OPERATION_TYPES = (python_ast.BinOp, python_ast.Compare, python_ast.UnaryOp)
+
+
+def _name(name, ctx=python_ast.Load):
+	return python_ast.Name(id=name, ctx=ctx())
+
+
+def _is_fallback(node):
+	"""
+	Returns whether an expression reads a hoisted invariant, or computes it if
+	it raised when it was hoisted.
+	"""
+
+	return isinstance(node, python_ast.IfExp) and \
+		isinstance(node.test, python_ast.Name) and \
+		node.test.id.startswith(INVARIANT_PREFIX)
+
+
+def _invariants(loop, stored):
+	"""
+	Returns the set of the ids of the invariant nodes of the expressions of a
+	loop, which does not assign the names of `stored`.
+	"""
+
+	invariant = set()
+
+	# postorder traversal: the children of a node are visited before it
+	stack = [(loop, False)]
+
+	while stack:
+		node, visited = stack.pop()
+
+		if not visited:
+			stack.append((node, True))
+			stack.extend(
+				(child, False) for child in python_ast.iter_child_nodes(node))
+			continue
+
+		if isinstance(node, python_ast.Constant):
+			invariant.add(id(node))
+		elif isinstance(node, python_ast.Name):
+			if isinstance(node.ctx, python_ast.Load) and node.id not in stored:
+				invariant.add(id(node))
+		elif isinstance(node, OPERATION_TYPES):
+			if all(id(child) in invariant
+					for child in python_ast.iter_child_nodes(node)
+					if isinstance(child, python_ast.expr)):
+				invariant.add(id(node))
+		elif isinstance(node, (python_ast.operator, python_ast.cmpop,
+				python_ast.unaryop, python_ast.expr_context)):
+			invariant.add(id(node))
+
+	return invariant
+
+
+def _evaluated(expr):
+	"""
+	Returns the set of the ids of the nodes of an expression which are
+	evaluated whenever the expression is, unless it raises.
+	"""
+
+	evaluated = set()
+	stack = [expr]
+
+	while stack:
+		node = stack.pop()
+		evaluated.add(id(node))
+
+		# the comparisons of a chain stop at the first one which is false
+		if isinstance(node, (python_ast.BinOp, python_ast.UnaryOp)) or \
+				isinstance(node, python_ast.Compare) and len(node.ops) == 1:
+			stack.extend(python_ast.iter_child_nodes(node))
+
+	return evaluated
+
+
+def _hoist(node, fields, invariant, numbers, replace):
+	"""
+	Replaces the largest invariant operations in the given fields of a node,
+	whose ids are in `invariant`, by the expressions which `replace` returns
+	for them and for a temporary named from the numbers of the iterator
+	`numbers`. Returns the list of the temporaries and of the invariants they
+	hold.
+	"""
+
+	hoisted = []
+	stack = [(node, fields)]
+
+	while stack:
+		node, fields = stack.pop()
+
+		for field in fields:
+			value = getattr(node, field)
+			items = value if isinstance(value, list) else [value]
+
+			for index, item in enumerate(items):
+				if not isinstance(item, python_ast.AST) or _is_fallback(item):
+					continue
+				elif not isinstance(item, OPERATION_TYPES) or \
+						id(item) not in invariant:
+					stack.append((item, item._fields))
+					continue
+
+				temporary = INVARIANT_PREFIX + str(next(numbers))
+				hoisted.append((temporary, item))
+
+				new_item = replace(temporary, item)
+				python_ast.copy_location(new_item, item)
+
+				if isinstance(value, list):
+					value[index] = new_item
+				else:
+					setattr(node, field, new_item)
+
+	return hoisted
+
+
+def _bind(test, hoisted):
+	"""
+	Returns a copy of the condition of a loop where the reads of the hoisted
+	temporaries are replaced by assignments of the invariants they hold.
+	"""
+
+	hoisted = dict(hoisted)
+	root = python_ast.Expression(body=copy_tree(test))
+
+	for node in python_ast.walk(root):
+		for field, value in python_ast.iter_fields(node):
+			items = value if isinstance(value, list) else [value]
+
+			for index, item in enumerate(items):
+				if not isinstance(item, python_ast.Name) or \
+						item.id not in hoisted:
+					continue
+
+				binding = python_ast.NamedExpr(
+					target=_name(item.id, python_ast.Store),
+					value=hoisted[item.id])
+
+				if isinstance(value, list):
+					value[index] = binding
+				else:
+					setattr(node, field, binding)
+
+	return root.body
+
+
+def _hoist_loop(loop, numbers):
+	"""
+	Returns the statements replacing a loop whose invariants are hoisted, or
+	None if the loop has no invariants.
+	"""
+
+	invariant = _invariants(loop, stored_names(loop))
+
+	# the invariants of the condition, computed by its first evaluation
+	hoisted_test = _hoist(loop, ['test'], invariant & _evaluated(loop.test),
+		numbers, lambda temporary, item: _name(temporary))
+
+	# the invariants of the body, computed by the loop if one of them raises
+	flag = INVARIANT_PREFIX + str(next(numbers))
+	hoisted_body = _hoist(loop, ['body'], invariant, numbers,
+		lambda temporary, item: python_ast.IfExp(
+			test=_name(flag), body=_name(temporary), orelse=copy_tree(item)))
+
+	if not hoisted_test and not hoisted_body:
+		return None
+
+	guard = python_ast.If(
+		test=_bind(loop.test, hoisted_test),
+		body=[loop], orelse=[])
+	lowered = [guard]
+
+	if hoisted_body:
+		names = ', '.join(name for name, value in hoisted_body)
+
+		compute = parse_stmts('''
+try:
+    ({names},) = VALUES
+except Exception:
+    {flag} = False
+else:
+    {flag} = True
+''', names=names, flag=flag)
+
+		compute[0].body[0].value = python_ast.Tuple(
+			elts=[value for name, value in hoisted_body],
+			ctx=python_ast.Load())
+
+		guard.body[:0] = compute
+		guard.body.extend(parse_stmts('''
+if {flag}:
+    del {names}
+del {flag}
+''', names=names, flag=flag))
+
+	if hoisted_test:
+		lowered.extend(parse_stmts('del {}'.format(
+			', '.join(name for name, value in hoisted_test))))
+
+	for stmt in lowered:
+		python_ast.copy_location(stmt, loop)
+
+	return lowered
+
+
+@PassManager.register(level=2)
+class LoopInvariantHoisting(PythonPass):
+	"""
+	Hoists the invariants of the loops of a compiled Python module. The loops
+	nested in a loop are processed first, so that the invariants hoisted into
+	its body may be hoisted out of it in turn.
+	"""
+
+	def transform(self, module):
+		# `Exception` is caught by the generated code
+		if 'Exception' in stored_names(module):
+			return module
+
+		# numbers of the temporaries, unique in the module
+		numbers = itertools.count()
+
+		# the blocks of the module, the blocks nesting others first
+		blocks = []
+		stack = [module]
+
+		while stack:
+			node = stack.pop()
+
+			for field in ('body', 'orelse', 'finalbody'):
+				stmts = getattr(node, field, None)
+
+				if stmts:
+					blocks.append((node, field))
+					stack.extend(stmts)
+
+		for node, field in reversed(blocks):
+			new_stmts = []
+
+			for stmt in getattr(node, field):
+				lowered = None
+
+				if isinstance(stmt, python_ast.While):
+					lowered = _hoist_loop(stmt, numbers)
+
+				if lowered is None:
+					new_stmts.append(stmt)
+				else:
+					new_stmts.extend(lowered)
+					self.rewrites += 1
+
+			setattr(node, field, new_stmts)
+
+		return module
@@ -0,0 +1,360 @@
+#!/usr/bin/env python3.4
+# coding: utf-8
+
+"""
+This module defines the lowering of counter loops to `for` loops over ranges.
+
+A counter loop is a loop of the form:
+
+	constipated while (i < n)
+		...
+		stinky i is (i + 1 tons of shit)
+	splosh
+
+where the last statement of the body is its only assignment to `i`, and `n`
+is not assigned by the loop. When `i` and `n` are integers, the loop runs the
+body with `i` in `range(i, n)`, and leaves `i` equal to `n` if it ran. The
+loop is thus compiled to a `for` loop, which counts without evaluating poop
+operations.
+
+The types of the counters and bounds of the loops nested in a lowered loop
+are checked once, before it: the original loops, compiled once, run instead
+if one of them is not an integer.
+
+The builtin `range` is imported under a reserved name, so that the loops run
+whatever `range` the program or its environment binds.
+"""
+
+__all__ = ['CounterLoopLowering']
+
+import ast as python_ast
+import copy
+
+from poop.optimizer import PassManager
+from poop.compiler.pyast import PythonPass, parse_stmts, copy_tree
+from poop.compiler.pyast import stored_names
+from poop.compiler.scopes import RANGE_NAME
+
+
+# Python operators whose results on integers are integers
+INT_OPERATORS = (python_ast.Add, python_ast.Sub, python_ast.Mult)
+
+
+def _int_constant(node):
+	return isinstance(node, python_ast.Constant) and type(node.value) is int
+
+
+def _int_expr(expr, known_ints):
+	"""
+	Returns whether a Python expression is made of integer constants and of
+	variables known to be integers, which it adds, subtracts or multiplies.
+	"""
+
+	return all(
+		_int_constant(node) or
+		isinstance(node, python_ast.Name) and node.id in known_ints or
+		isinstance(node, python_ast.BinOp) and
+			isinstance(node.op, INT_OPERATORS) or
+		isinstance(node, (INT_OPERATORS, python_ast.expr_context))
+		for node in python_ast.walk(expr)
+	)
+
+
+def _test_ints(test, known_ints):
+	"""
+	Returns the names which the test of an `if` statement, if it is a single
+	comparison, assigns integers known from `known_ints`.
+	"""
+
+	if not isinstance(test, python_ast.Compare) or len(test.ops) != 1:
+		return set()
+
+	return {
+		operand.target.id for operand in [test.left] + test.comparators
+		if isinstance(operand, python_ast.NamedExpr) and
+			_int_expr(operand.value, known_ints)
+	}
+
+
+def _counter(loop):
+	"""
+	Returns the counter of a counter loop, its bound and whether the bound is
+	included, or None if the loop is not a counter loop.
+	"""
+
+	cond = loop.test
+
+	if not isinstance(cond, python_ast.Compare) or len(cond.ops) != 1 or \
+			not isinstance(cond.ops[0], (python_ast.Lt, python_ast.LtE)):
+		return None
+
+	counter, bound = cond.left, cond.comparators[0]
+
+	if not isinstance(counter, python_ast.Name) or \
+			not (isinstance(bound, python_ast.Name) or _int_constant(bound)):
+		return None
+
+	last = loop.body[-1]
+
+	if not isinstance(last, python_ast.Assign) or len(last.targets) != 1:
+		return None
+
+	target, value = last.targets[0], last.value
+
+	if not isinstance(target, python_ast.Name) or target.id != counter.id or \
+			not isinstance(value, python_ast.BinOp) or \
+			not isinstance(value.op, python_ast.Add) or \
+			not isinstance(value.left, python_ast.Name) or \
+			value.left.id != counter.id or \
+			not _int_constant(value.right) or value.right.value != 1:
+		return None
+
+	stored = _block_stored_names(loop.body[:-1])
+
+	if counter.id in stored or \
+			getattr(bound, 'id', None) in stored | {counter.id}:
+		return None
+
+	return counter.id, bound, isinstance(cond.ops[0], python_ast.LtE)
+
+
+def _block_stored_names(stmts):
+	"""
+	Returns the names which a block of Python statements may assign.
+	"""
+
+	stored = set()
+
+	for stmt in stmts:
+		stored |= stored_names(stmt)
+
+	return stored
+
+
+class _Substitution(python_ast.NodeTransformer):
+	"""
+	Replaces the names `BOUND` of a template by copies of a node.
+	"""
+
+	def __init__(self, bound):
+		self.bound = bound
+
+	def visit_Name(self, name):
+		if name.id == 'BOUND':
+			return copy.copy(self.bound)
+
+		return name
+
+
+class _Nest:
+	"""
+	The outermost lowered loop of a nest of loops, the names of the variables
+	it may assign, and those assigned before it. The types of the variables
+	of `checked` are checked once, before the loop runs.
+	"""
+
+	def __init__(self, loop, assigned):
+		self.stored = stored_names(loop)
+		self.assigned = assigned
+		self.checked = []
+
+	def check(self, names):
+		"""
+		Checks the types of the given names before the loop, and returns
+		whether they keep their values while it runs.
+		"""
+
+		if any(name in self.stored or name not in self.assigned
+				for name in names):
+			return False
+
+		self.checked.extend(name for name in names if name not in self.checked)
+		return True
+
+
+def _lower_loop(loop, counter, bound, inclusive):
+	"""
+	Returns the statements replacing a counter loop, and the `for` loop they
+	contain.
+	"""
+
+	if inclusive:
+		op, stop = '<=', 'BOUND + 1'
+	else:
+		op, stop = '<', 'BOUND'
+
+	lowered = parse_stmts('''
+if {counter} {op} BOUND:
+    for {counter} in {range}({counter}, {stop}):
+        pass
+    {counter} = {stop}
+''', counter=counter, op=op, stop=stop, range=RANGE_NAME)
+
+	lowered = [_Substitution(bound).visit(stmt) for stmt in lowered]
+	loop_for = lowered[0].body[0]
+	loop_for.body = loop.body[:-1] or [python_ast.Pass()]
+
+	for stmt in lowered:
+		python_ast.copy_location(stmt, loop)
+
+	return lowered, loop_for
+
+
+def _guard(guard, nest, stmts):
+	"""
+	Sets the test of the `if` statement which runs the lowered loops of a nest
+	or the original ones, or replaces it in `stmts` by the lowered loops if
+	there are no types to check.
+	"""
+
+	if nest.checked:
+		test = ' and '.join(
+			'{}.__class__ is 0 .__class__'.format(name)
+			for name in nest.checked)
+		guard.test = parse_stmts(test)[0].value
+		return
+
+	index = next(
+		index for index, stmt in enumerate(stmts) if stmt is guard)
+	stmts[index:index + 1] = guard.body
+
+
+@PassManager.register(level=2)
+class CounterLoopLowering(PythonPass):
+	"""
+	Lowers the counter loops of a compiled Python module.
+
+	A variable is known to be an integer before a loop if the last statement
+	assigning it, in the same block, assigns it the sum, difference or product
+	of integer constants and of variables known to be integers. Otherwise, its
+	type is checked before the outermost lowered loop which contains the loop
+	runs, and the original loops run if it is not an integer: the loops nested
+	in a lowered loop are only lowered if the variables they check are
+	assigned before it, and not by it.
+	"""
+
+	def transform(self, module):
+		if RANGE_NAME in stored_names(module):
+			return module
+
+		# the `if` statements running lowered nests, in their blocks
+		guards = []
+
+		# the blocks to lower, with the names of the variables known to hold
+		# integers and of those assigned when they start, and the lowered
+		# nest they are in
+		stack = [(module, 'body', frozenset(), frozenset(), None)]
+
+		while stack:
+			node, field, known_ints, assigned, nest = stack.pop()
+			known_ints = set(known_ints)
+			assigned = set(assigned)
+			new_stmts = []
+
+			for stmt in getattr(node, field):
+				counter = None
+
+				if isinstance(stmt, python_ast.While):
+					counter = _counter(stmt)
+
+				if counter is not None:
+					counter_name, bound, inclusive = counter
+
+					# names of the variables whose type must be checked
+					checked = [
+						name
+						for name in (counter_name, getattr(bound, 'id', None))
+						if name is not None and name not in known_ints
+					]
+
+					if nest is not None and not nest.check(checked):
+						counter = None
+
+				if counter is None:
+					new_stmts.append(stmt)
+
+					# the blocks of loops may run after their own assignments,
+					# and those of other statements after the blocks before
+					# them
+					if isinstance(stmt, (python_ast.While, python_ast.For)):
+						block_ints = known_ints - stored_names(stmt)
+						block_assigned = assigned - stored_names(stmt)
+					elif isinstance(stmt, python_ast.If):
+						bound_ints = _test_ints(stmt.test, known_ints)
+						block_ints = known_ints | bound_ints
+						block_assigned = assigned | bound_ints
+					else:
+						block_ints = set(known_ints)
+						block_assigned = set(assigned)
+
+					for block_field in ('body', 'orelse', 'finalbody'):
+						block = getattr(stmt, block_field, None)
+
+						if block:
+							stack.append((
+								stmt, block_field, frozenset(block_ints),
+								frozenset(block_assigned), nest))
+							block_ints -= _block_stored_names(block)
+							block_assigned -= _block_stored_names(block)
+				else:
+					loop_nest = nest
+
+					if nest is None:
+						# the original loops, run if a type check fails, are
+						# copied before the nested loops are lowered
+						loop_nest = _Nest(stmt, assigned)
+						loop_nest.checked.extend(checked)
+						original = copy_tree(stmt)
+
+					lowered, loop_for = _lower_loop(stmt, *counter)
+					self.rewrites += 1
+
+					if nest is None:
+						guard = python_ast.If(
+							test=None, body=lowered, orelse=[original])
+						python_ast.copy_location(guard, stmt)
+						guards.append((guard, loop_nest, new_stmts))
+						lowered = [guard]
+
+					new_stmts.extend(lowered)
+
+					# the counter and the bound are integers in the `for`
+					# loop
+					block_ints = known_ints | {counter_name}
+					block_assigned = assigned | {counter_name}
+
+					if isinstance(bound, python_ast.Name):
+						block_ints.add(bound.id)
+
+					block_ints -= _block_stored_names(loop_for.body)
+					block_assigned -= _block_stored_names(loop_for.body)
+					stack.append((
+						loop_for, 'body', block_ints, block_assigned,
+						loop_nest))
+
+				int_value = isinstance(stmt, python_ast.Assign) and \
+					_int_expr(stmt.value, known_ints)
+
+				known_ints -= stored_names(stmt)
+				assigned -= stored_names(stmt)
+
+				if isinstance(stmt, python_ast.Assign):
+					targets = [
+						target.id for target in stmt.targets
+						if isinstance(target, python_ast.Name)
+					]
+					assigned.update(targets)
+
+					if int_value:
+						known_ints.update(targets)
+
+			setattr(node, field, new_stmts)
+
+		for guard, nest, stmts in guards:
+			_guard(guard, nest, stmts)
+
+		if self.rewrites:
+			module.body[:0] = parse_stmts(
+				'from builtins import range as {}'.format(RANGE_NAME))
+
+		return module
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3.4
+# coding: utf-8
+
+"""
+This module defines helpers for the passes rewriting the Python AST compiled
+from a poop AST, and the base class of these passes. To define a pass run
+from a given optimization level, use this snippet as a template:
+
+	@PassManager.register(level=[n])
+	class [PassName](PythonPass):
+		def transform(self, module):
+			...  # Rewriting the module
+
+			self.rewrites += 1
+			return module
+
+Python passes run after the passes on the poop AST, and in registration order
+within a level.
+"""
+
+__all__ = [
+	'PythonPass', 'MAX_NESTED_BLOCKS', 'BLOCK_TYPES',
+	'parse_stmts', 'copy_tree', 'stored_names', 'block_depth',
+]
+
+import ast as python_ast
+import copy
+
+
+# CPython cannot compile more nested loops and `try` blocks
+MAX_NESTED_BLOCKS = 20
+
+# Python statements which nest blocks
+BLOCK_TYPES = (python_ast.While, python_ast.For, python_ast.Try,
+	python_ast.With)
+
+
+class PythonPass:
+	"""
+	Rewrites the Python AST of a compiled module with `transform`.
+
+	`rewrites` counts the nodes rewritten, as reported by `transform`.
+	`exports` holds the names of the variables which the program must leave in
+	its environment, or is None if all of them must be left.
+	"""
+
+	# the AST the pass runs on, as named by the pass manager
+	stage = 'python'
+
+	def __init__(self, exports=None):
+		self.rewrites = 0
+		self.exports = exports
+
+	def transform(self, module):
+		"""
+		Transforms a Python module, and returns it.
+		"""
+
+		raise NotImplementedError
+
+
+def parse_stmts(template, **names):
+	"""
+	Parses the statements of a template where the given names are formatted.
+	The nodes have no location, so that they are given those of their parent.
+	"""
+
+	stmts = python_ast.parse(template.format(**names)).body
+
+	for stmt in stmts:
+		for node in python_ast.walk(stmt):
+			for attribute in node._attributes:
+				setattr(node, attribute, None)
+
+	return stmts
+
+
+def copy_tree(tree):
+	"""
+	Iterative version of `copy.deepcopy` for Python ASTs, whose depth is not
+	limited by the Python stack.
+	"""
+
+	root = copy.copy(tree)
+	stack = [root]
+
+	while stack:
+		node = stack.pop()
+
+		for field, value in python_ast.iter_fields(node):
+			if isinstance(value, python_ast.AST):
+				value = copy.copy(value)
+				stack.append(value)
+			elif isinstance(value, list):
+				value = [
+					copy.copy(item) if isinstance(item, python_ast.AST) else item
+					for item in value
+				]
+				stack.extend(
+					item for item in value if isinstance(item, python_ast.AST))
+			else:
+				continue
+
+			setattr(node, field, value)
+
+	return root
+
+
+def stored_names(stmt):
+	"""
+	Returns the names which a Python statement may assign or delete.
+	"""
+
+	return {
+		node.id for node in python_ast.walk(stmt)
+		if isinstance(node, python_ast.Name) and
+			not isinstance(node.ctx, python_ast.Load)
+	}
+
+
+def block_depth(stmt):
+	"""
+	Returns the number of nested blocks of a Python statement.
+	"""
+
+	depth = 0
+	stack = [(stmt, 0)]
+
+	while stack:
+		node, level = stack.pop()
+
+		if isinstance(node, BLOCK_TYPES):
+			level += 1
+			depth = max(depth, level)
+
+		stack.extend(
+			(child, level) for child in python_ast.iter_child_nodes(node)
+			if isinstance(child, python_ast.stmt))
+
+	return depth
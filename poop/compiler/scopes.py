@@ -0,0 +1,264 @@
+#!/usr/bin/env python3.4
+# coding: utf-8
+
+"""
+This module defines the compilation of programs into the body of a function,
+so that their variables are Python locals instead of entries of the module
+environment.
+
+A variable can only be a local if the program declares it before each of its
+reads: otherwise, the read would find the value of the environment in the
+module, but raise UnboundLocalError in a function. The other variables are
+declared global in the function.
+
+When the names of the environment are known at compile time, the names read
+by a program are resolved statically: those which are undefined are reported,
+and the prelude functions which the program never rebinds are bound once, as
+default arguments of the function.
+"""
+
+__all__ = [
+	'find_fast_locals', 'resolve_names', 'check_loop_depth', 'wrap_in_function'
+]
+
+import ast as python_ast
+import keyword
+
+from poop.parser.ast import *
+from poop.exception import CompileError
+from poop.compiler.pyast import MAX_NESTED_BLOCKS, parse_stmts
+
+
+# name of the generated function
+FUNCTION_NAME = '__poop_program__'
+
+# name of the builtin `range`, bound by the code of counter loops
+RANGE_NAME = '__poop_range__'
+
+# names that the program must not declare, since the generated code uses them
+RESERVED_NAMES = frozenset([FUNCTION_NAME, RANGE_NAME, 'globals', 'locals'])
+
+
+def _check_reads(expr, assigned, unsafe):
+	"""
+	Adds the variables read by an expression which may not be assigned yet to
+	the set `unsafe`.
+	"""
+
+	stack = [expr]
+
+	while stack:
+		node = stack.pop()
+
+		if isinstance(node, Variable):
+			if node.name not in assigned:
+				unsafe.add(node.name)
+		elif isinstance(node, Call):
+			if node.func not in assigned:
+				unsafe.add(node.func)
+
+		stack.extend(iter_child_nodes(node))
+
+
+def _analyze_block(stmts, assigned, unsafe):
+	"""
+	Checks the reads of a block of statements, run after the variables of
+	`assigned` are declared. Yields the nested blocks to analyze, and returns
+	the variables declared once the block has run.
+	"""
+
+	assigned = set(assigned)
+
+	for stmt in stmts:
+		if isinstance(stmt, Declaration):
+			_check_reads(stmt.value, assigned, unsafe)
+			assigned.add(stmt.name)
+		elif isinstance(stmt, StmtExpr):
+			_check_reads(stmt.expr, assigned, unsafe)
+		elif isinstance(stmt, While):
+			# the condition and the body are first run with the variables
+			# declared before the loop, which may not run its body at all
+			_check_reads(stmt.cond, assigned, unsafe)
+			yield stmt.body, assigned
+		elif isinstance(stmt, IfStmt):
+			_check_reads(stmt.cond, assigned, unsafe)
+			body = yield stmt.body, assigned
+			else_body = yield stmt.else_body, assigned
+			assigned = body & else_body
+
+	return assigned
+
+
+def find_fast_locals(program):
+	"""
+	Returns the set of the variables of a program which are declared before
+	each of their reads, and the set of the other declared variables.
+	"""
+
+	unsafe = set()
+
+	# runs the analysis of nested blocks on an explicit stack
+	stack = [_analyze_block(program.instructions, set(), unsafe)]
+	result = None
+
+	while stack:
+		try:
+			stmts, assigned = stack[-1].send(result)
+		except StopIteration as stop:
+			stack.pop()
+			result = stop.value
+		else:
+			stack.append(_analyze_block(stmts, assigned, unsafe))
+			result = None
+
+	declared = {
+		node.name for node in walk(program) if isinstance(node, Declaration)
+	}
+
+	return declared - unsafe, declared & unsafe
+
+
+def resolve_names(program, prelude):
+	"""
+	Returns the names of `prelude` read by a program which never declares
+	them, and which can thus be bound before it runs. Raises CompileError for
+	the first name read which is neither declared nor in `prelude`.
+	"""
+
+	declared = set()
+	reads = []
+
+	for node in walk(program):
+		if isinstance(node, Variable):
+			reads.append((node.name, node))
+		elif isinstance(node, Call):
+			reads.append((node.func, node))
+		elif isinstance(node, Declaration):
+			declared.add(node.name)
+
+	undefined = [
+		node for name, node in reads
+		if name not in declared and name not in prelude
+	]
+
+	if undefined:
+		# reports the name read first in the source
+		node = min(undefined, key=lambda node: (
+			node.start is None,
+			node.lines.absolute(node.start) if node.start is not None else 0
+		))
+		name = node.name if isinstance(node, Variable) else node.func
+		raise CompileError(node.pos, 'Undefined name {!r}'.format(name))
+
+	return {
+		name for name, node in reads
+		if name not in declared and name.isidentifier() and
+			not keyword.iskeyword(name) and name not in RESERVED_NAMES
+	}
+
+
+def _loop_depth(program):
+	"""
+	Returns the largest number of nested loops of a program.
+	"""
+
+	depth = 0
+	stack = [(stmt, 0) for stmt in program.instructions]
+
+	while stack:
+		stmt, level = stack.pop()
+
+		if isinstance(stmt, While):
+			level += 1
+			depth = max(depth, level)
+
+		for field in stmt._fields:
+			value = getattr(stmt, field)
+
+			if isinstance(value, (list, tuple)):
+				stack.extend(
+					(item, level) for item in value if isinstance(item, Stmt))
+
+	return depth
+
+
+def check_loop_depth(program):
+	"""
+	Raises a CompileError at the first loop of a program nested in
+	MAX_NESTED_BLOCKS other loops, since CPython cannot compile it.
+	"""
+
+	stack = [(stmt, 0) for stmt in reversed(program.instructions)]
+
+	while stack:
+		stmt, level = stack.pop()
+
+		if isinstance(stmt, While):
+			level += 1
+
+			if level > MAX_NESTED_BLOCKS:
+				raise CompileError(stmt.pos, (
+					'Too many nested loops: Python compiles at most {} '
+					'nested blocks'
+				).format(MAX_NESTED_BLOCKS))
+
+		for field in reversed(stmt._fields):
+			value = getattr(stmt, field)
+
+			if isinstance(value, (list, tuple)):
+				stack.extend(
+					(item, level) for item in reversed(value)
+					if isinstance(item, Stmt))
+
+
+def wrap_in_function(module, program, exports=None, bound=()):
+	"""
+	Moves the body of the Python module compiled from a program into a
+	function run by the module. When the function returns or raises, the
+	locals among `exports`, or all of them if it is None, are written to the
+	environment. The names of `bound`, which the program must not declare, are
+	read from the environment once, when the function is defined.
+
+	Returns the module unchanged if the program has no locals nor bound names,
+	or cannot be compiled as a function.
+	"""
+
+	fast_locals, global_names = find_fast_locals(program)
+
+	if not (fast_locals or bound) or \
+			(fast_locals | global_names) & RESERVED_NAMES or \
+			_loop_depth(program) >= MAX_NESTED_BLOCKS:
+		return module
+
+	exported = fast_locals if exports is None else fast_locals & set(exports)
+	params = ', '.join('{0}={0}'.format(name) for name in sorted(bound))
+
+	wrapper = parse_stmts('''
+def {function}({params}):
+    try:
+        pass
+    finally:
+        globals().update(
+            (name, value) for name, value in locals().items()
+            if name in EXPORTS)
+
+try:
+    {function}()
+finally:
+    del {function}
+''', function=FUNCTION_NAME, params=params)
+
+	function = wrapper[0]
+	function.body[0].body = module.body or [python_ast.Pass()]
+
+	if global_names:
+		function.body.insert(0, python_ast.Global(names=sorted(global_names)))
+
+	# the names of the exported variables, as a tuple of strings
+	write_back = function.body[-1].finalbody[0].value.args[0].generators[0]
+	write_back.ifs[0].comparators[0] = python_ast.Tuple(
+		elts=[python_ast.Str(name) for name in sorted(exported)],
+		ctx=python_ast.Load())
+
+	module.body = wrapper
+	return module
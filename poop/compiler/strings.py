@@ -0,0 +1,211 @@
+#!/usr/bin/env python3.4
+# coding: utf-8
+
+"""
+This module defines the lowering of string accumulators in compiled loops.
+
+A variable holding a string which a loop only extends, as in
+`stinky report is (report + line)`, is copied by each concatenation, so that
+building the string takes a quadratic time. The parts of such a string are
+instead appended to a list, which is joined once the loop ends, even if it
+raises.
+
+Values which are not strings are still concatenated to the parts joined so
+far, so that the errors raised are those of the concatenation. The values of
+poop are strings, numbers and booleans, whose sums with strings are strings
+or errors.
+"""
+
+__all__ = ['StringAccumulatorLowering']
+
+import ast as python_ast
+from collections import deque
+
+from poop.optimizer import PassManager
+from poop.compiler.pyast import PythonPass, MAX_NESTED_BLOCKS, BLOCK_TYPES
+from poop.compiler.pyast import parse_stmts, stored_names, block_depth
+
+
+# prefix of the names of the lists of parts of the accumulators
+PARTS_PREFIX = '__poop_parts_'
+
+
+def _name(name, ctx=python_ast.Load):
+	return python_ast.Name(id=name, ctx=ctx())
+
+
+def _is_append(stmt, name):
+	"""
+	Returns whether a statement is of the form `name = name + value`, where
+	`value` does not read `name`.
+	"""
+
+	if not isinstance(stmt, python_ast.Assign) or len(stmt.targets) != 1:
+		return False
+
+	target, value = stmt.targets[0], stmt.value
+
+	return isinstance(target, python_ast.Name) and target.id == name and \
+		isinstance(value, python_ast.BinOp) and \
+		isinstance(value.op, python_ast.Add) and \
+		isinstance(value.left, python_ast.Name) and value.left.id == name and \
+		not any(
+			isinstance(node, python_ast.Name) and node.id == name
+			for node in python_ast.walk(value.right))
+
+
+def _accumulators(loop, candidates):
+	"""
+	Returns the names among `candidates` which a loop reads and assigns only
+	through statements of the form `name = name + value`.
+	"""
+
+	# name -> statements assigning it, and number of uses
+	appends = {name: [] for name in candidates}
+	uses = dict.fromkeys(candidates, 0)
+
+	for node in python_ast.walk(loop):
+		if isinstance(node, python_ast.Assign):
+			for name in appends:
+				if _is_append(node, name):
+					appends[name].append(node)
+		elif isinstance(node, python_ast.Name) and node.id in uses:
+			uses[node.id] += 1
+
+	# each append reads and assigns the name once
+	return [
+		name for name in candidates
+		if appends[name] and uses[name] == 2 * len(appends[name])
+	]
+
+
+def _lower_appends(loop, names):
+	"""
+	Replaces the appends to the given accumulators in the body of a loop.
+	"""
+
+	todo = deque([loop])
+
+	while todo:
+		node = todo.popleft()
+
+		for field in ('body', 'orelse', 'finalbody'):
+			stmts = getattr(node, field, None)
+
+			if stmts is None:
+				continue
+
+			new_stmts = []
+
+			for stmt in stmts:
+				name = next((name for name in names if _is_append(stmt, name)),
+					None)
+
+				if name is None:
+					new_stmts.append(stmt)
+					todo.append(stmt)
+					continue
+
+				append = parse_stmts('''
+{parts}.append(VALUE)
+if {parts}[-1].__class__ is not ''.__class__:
+    {parts}[:] = [''.join({parts}[:-1]) + {parts}.pop()]
+''', parts=PARTS_PREFIX + name)
+
+				append[0].value.args[0] = stmt.value.right
+
+				for new_stmt in append:
+					python_ast.copy_location(new_stmt, stmt)
+
+				new_stmts.extend(append)
+
+			setattr(node, field, new_stmts)
+
+
+def _lower_loop(loop, names):
+	"""
+	Returns the statements replacing a loop whose accumulators are lowered.
+	"""
+
+	_lower_appends(loop, names)
+
+	lowered = [
+		python_ast.Assign(
+			targets=[_name(PARTS_PREFIX + name, python_ast.Store)],
+			value=python_ast.List(elts=[_name(name)], ctx=python_ast.Load()))
+		for name in names
+	]
+
+	finalbody = []
+
+	for name in names:
+		finalbody.extend(parse_stmts('''
+{name} = ''.join({parts})
+del {parts}
+''', name=name, parts=PARTS_PREFIX + name))
+
+	lowered.append(
+		python_ast.Try(body=[loop], handlers=[], orelse=[],
+			finalbody=finalbody))
+
+	for stmt in lowered:
+		python_ast.copy_location(stmt, loop)
+
+	return lowered
+
+
+@PassManager.register(level=2)
+class StringAccumulatorLowering(PythonPass):
+	"""
+	Lowers the string accumulators of the loops of a compiled Python module.
+
+	An accumulator is a variable which a loop only extends, and which holds a
+	string when the loop starts: the last statement assigning it before the
+	loop, in the same block, assigns it a string constant or is a loop which
+	accumulates it.
+	"""
+
+	def transform(self, module):
+		# the blocks to lower, with their number of nested blocks
+		stack = [(module, 'body', 0)]
+
+		while stack:
+			node, field, depth = stack.pop()
+
+			# names of the variables known to hold strings
+			strings = set()
+			new_stmts = []
+
+			for stmt in getattr(node, field):
+				names = []
+
+				if isinstance(stmt, python_ast.While) and strings and \
+						depth + 1 + block_depth(stmt) < MAX_NESTED_BLOCKS:
+					names = _accumulators(stmt, sorted(strings))
+
+				strings -= stored_names(stmt)
+
+				if isinstance(stmt, python_ast.Assign) and \
+						isinstance(stmt.value, python_ast.Constant) and \
+						isinstance(stmt.value.value, str):
+					strings.update(target.id for target in stmt.targets)
+
+				if not names:
+					new_stmts.append(stmt)
+					block, nested_depth = stmt, depth
+				else:
+					new_stmts.extend(_lower_loop(stmt, names))
+					strings.update(names)
+					block, nested_depth = new_stmts[-1], depth + 1
+					self.rewrites += 1
+
+				if isinstance(block, BLOCK_TYPES):
+					nested_depth += 1
+
+				for block_field in ('body', 'orelse', 'finalbody'):
+					if getattr(block, block_field, None):
+						stack.append((block, block_field, nested_depth))
+
+			setattr(node, field, new_stmts)
+
+		return module
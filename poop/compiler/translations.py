@@ -14,16 +14,38 @@ from poop.parser.ast import *
 
 @Compiler.register(Program)
 def translate_program(compiler, program):
-	instrs = map(compiler.translate, program.instructions)
-	module = python_ast.Module(body=list(instrs))
+	instrs = yield from _translate_block(program.instructions)
+	module = python_ast.Module(body=instrs, type_ignores=[])
 	return module
 
 
+def _translate_block(nodes):
+	"""
+	Translates a list of nodes.
+	"""
+
+	py_nodes = []
+
+	for node in nodes:
+		py_nodes.append((yield node))
+
+	return py_nodes
+
+
+def _translate_body(nodes):
+	"""
+	Translates the statements of a block, which cannot be empty in Python.
+	"""
+
+	py_nodes = yield from _translate_block(nodes)
+	return py_nodes or [python_ast.Pass()]
+
+
 @Compiler.register(While)
 def translate_while(compiler, while_):
-    instrs = list(map(compiler.translate, while_.body))
+    instrs = yield from _translate_body(while_.body)
     return python_ast.While(
-        test=compiler.translate(while_.cond),
+        test=(yield while_.cond),
         body=instrs,
         orelse=[]
     )
@@ -31,10 +53,10 @@ def translate_while(compiler, while_):
 
 @Compiler.register(IfStmt)
 def translate_while(compiler, if_):
-    instrs = list(map(compiler.translate, if_.body))
-    else_instrs = list(map(compiler.translate, if_.else_body))
+    instrs = yield from _translate_body(if_.body)
+    else_instrs = yield from _translate_block(if_.else_body)
     return python_ast.If(
-        test=compiler.translate(if_.cond),
+        test=(yield if_.cond),
         body=instrs,
         orelse=else_instrs
     )
@@ -43,7 +65,7 @@ def translate_while(compiler, if_):
 @Compiler.register(StmtExpr)
 def translate_stmt_expr(compiler, stmt):
     return python_ast.Expr(
-        value=compiler.translate(stmt.expr)
+        value=(yield stmt.expr)
     )
 
 
@@ -53,15 +75,16 @@ def translate_declaration(compiler, declaration):
 	assign.targets = [
 		python_ast.Name(id=declaration.name, ctx=python_ast.Store())
 	]
-	assign.value = compiler.translate(declaration.value)
+	assign.value = yield declaration.value
 	return assign
 
 
 @Compiler.register(Call)
 def translate_call(compiler, call):
+	args = yield from _translate_block(call.args)
 	return python_ast.Call(
 		func=python_ast.Name(call.func, python_ast.Load()),
-		args=list(map(compiler.translate, call.args)),
+		args=args,
 		keywords=[]
 	)
 
@@ -69,17 +92,17 @@ def translate_call(compiler, call):
 @Compiler.register(BinOp)
 def translate_binop(compiler, binop):
     return python_ast.BinOp(
-        left=compiler.translate(binop.lhs),
+        left=(yield binop.lhs),
         op=BIN_OP[binop.op](),
-        right=compiler.translate(binop.rhs)
+        right=(yield binop.rhs)
     )
 
 @Compiler.register(CmpOp)
 def translate_cmpop(compiler, cmpop):
     return python_ast.Compare(
-        left=compiler.translate(cmpop.lhs),
+        left=(yield cmpop.lhs),
         ops=[CMP_OP[cmpop.op]()],
-        comparators=[compiler.translate(cmpop.rhs)]
+        comparators=[(yield cmpop.rhs)]
     )
 
 @Compiler.register(Variable)
@@ -95,3 +118,8 @@ def translate_num(compiler, num):
 @Compiler.register(CharLiteral, StringLiteral)
 def translate_string_or_char(compiler, string_or_char):
 	return python_ast.Str(string_or_char.value)
+
+
+@Compiler.register(BoolLiteral)
+def translate_bool(compiler, bool_):
+	return python_ast.Constant(value=bool_.value)
@@ -19,6 +19,10 @@ class ParseError(ValueError):
 
 	@property
 	def line(self):
+		# positions created from a source offset know their line table
+		if self.pos.lines is not None:
+			return self.pos.lines.line_text(self.pos.line)
+
 		lines = self.code.splitlines()
 		return lines[self.pos.line - 1]
 
@@ -29,3 +33,29 @@ class ParseError(ValueError):
 Parser failed to parse the code at {err.pos}:
 {err.msg}
 """.format(err=self, cursor_margin=' ' * self.pos.column)
+
+
+class CompileError(ValueError):
+	"""
+	Raised when the compiler rejects a parsed code. `pos` is None for the
+	nodes of the code which have no location.
+	"""
+
+	def __init__(self, pos, msg):
+		self.pos = pos
+		self.msg = msg
+
+	@property
+	def line(self):
+		return self.pos.lines.line_text(self.pos.line)
+
+	def __str__(self):
+		if self.pos is None:
+			return '\nCompiler rejected the code:\n{}\n'.format(self.msg)
+
+		return """
+`{err.line}`
+{cursor_margin}^
+Compiler rejected the code at {err.pos}:
+{err.msg}
+""".format(err=self, cursor_margin=' ' * self.pos.column)
@@ -0,0 +1,8 @@
+#!/usr/bin/env python3.4
+# coding: utf-8
+
+from poop.optimizer.visitor import *
+from poop.optimizer.manager import *
+from poop.optimizer.folding import *
+from poop.optimizer.effects import *
+from poop.optimizer.deadcode import *
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3.4
+# coding: utf-8
+
+"""
+This module defines the elimination of dead branches and dead stores.
+
+Branches of `if` statements with constant conditions are replaced by the
+branch taken, and loops whose condition is constant and false are removed.
+
+Declarations of variables which the program never reads, and which it does
+not export to its environment, are removed, or replaced by their value when it
+has side effects. Every variable is exported unless the exported ones are
+given.
+"""
+
+__all__ = ['DeadBranchElimination', 'DeadStoreElimination']
+
+from poop.parser.ast import *
+from poop.optimizer.visitor import NodeTransformer, replace
+from poop.optimizer.manager import PassManager
+from poop.optimizer.effects import has_side_effects
+
+
+@PassManager.register(level=1)
+class DeadBranchElimination(NodeTransformer):
+	"""
+	Removes the branches which are never run.
+	"""
+
+	def visit_IfStmt(self, if_):
+		if not isinstance(if_.cond, Literal):
+			return (yield from self.generic_visit(if_))
+
+		self.rewrites += 1
+
+		# the statements of the branch taken replace the `if` statement
+		branch = if_.body if if_.cond.value else if_.else_body
+		return (yield list(branch))
+
+	def visit_While(self, while_):
+		if isinstance(while_.cond, Literal) and not while_.cond.value:
+			self.rewrites += 1
+			return None
+
+		return (yield from self.generic_visit(while_))
+
+
+@PassManager.register(level=1)
+class DeadStoreElimination(NodeTransformer):
+	"""
+	Removes the declarations of the variables which are never read nor
+	exported.
+	"""
+
+	def __init__(self, exports=None):
+		super().__init__(exports)
+
+		# names of the variables read or exported, and declared, by the program
+		self.live = self.declared = frozenset()
+
+		# variables declared by the previous top-level statements
+		self.defined = set()
+
+	def visit_Program(self, program):
+		# every variable is left in the environment, and thus live
+		if self.exports is None:
+			return program
+
+		# removing a declaration may leave other variables unread: repeats
+		# until no declaration is removed
+		while True:
+			rewrites = self.rewrites
+
+			self.live = set()
+			self.declared = set()
+
+			for node in walk(program):
+				if isinstance(node, Variable):
+					self.live.add(node.name)
+				elif isinstance(node, Call):
+					# calls read the functions from the variables too
+					self.live.add(node.func)
+				elif isinstance(node, Declaration):
+					self.declared.add(node.name)
+
+			self.live.update(self.exports)
+
+			self.defined = set()
+			instrs = []
+
+			for stmt in program.instructions:
+				new_stmt = yield stmt
+
+				if isinstance(new_stmt, Stmt):
+					instrs.append(new_stmt)
+
+					if isinstance(new_stmt, Declaration):
+						self.defined.add(new_stmt.name)
+
+			if self.rewrites == rewrites:
+				return program
+
+			program = replace(program, instructions=instrs)
+
+	def visit_Declaration(self, decl):
+		if decl.name in self.live:
+			return decl
+
+		self.rewrites += 1
+
+		if not has_side_effects(decl.value, self.defined, self.declared):
+			return None
+
+		# keeps evaluating the value
+		stmt = StmtExpr(decl.value)
+		stmt.set_span(decl)
+		return stmt
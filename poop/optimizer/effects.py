@@ -0,0 +1,77 @@
+#!/usr/bin/env python3.4
+# coding: utf-8
+
+"""
+This module defines the side-effect analysis of expressions used by the
+optimization passes. An expression has no side effects if evaluating it can
+neither raise nor change any state, so that it can be removed when its value
+is unused.
+
+Calls are analyzed against the functions of the default prelude: the compiled
+code is assumed to run with them.
+"""
+
+__all__ = ['PURE_FUNCTIONS', 'has_side_effects']
+
+import math
+
+from poop.parser.ast import *
+
+
+def _converts_to_int(args):
+	"""
+	Returns whether `int` cannot raise when called with the given arguments.
+	"""
+
+	if len(args) != 1:
+		return False
+
+	arg = args[0]
+
+	if isinstance(arg, (IntLiteral, BoolLiteral)):
+		return True
+
+	return isinstance(arg, FloatLiteral) and math.isfinite(arg.value)
+
+
+# prelude function -> predicate telling whether it has no side effects when
+# called with the given arguments. `shitspray` and `eat` write and read the
+# console, and `random` changes the state of the generator.
+PURE_FUNCTIONS = {
+	'tonumericpoop': _converts_to_int,
+}
+
+
+def has_side_effects(expr, defined=frozenset(), declared=frozenset()):
+	"""
+	Returns whether an expression may have side effects. `defined` is the set
+	of the variables known to be defined where the expression is evaluated,
+	whose reads cannot raise, and `declared` that of the names declared by the
+	program, which may shadow prelude functions.
+	"""
+
+	stack = [expr]
+
+	while stack:
+		node = stack.pop()
+
+		if isinstance(node, Literal):
+			continue
+		elif isinstance(node, Variable):
+			if node.name not in defined:
+				return True
+		elif isinstance(node, Call):
+			pure = PURE_FUNCTIONS.get(node.func)
+
+			if pure is None or node.func in declared or not pure(node.args):
+				return True
+
+			stack.extend(node.args)
+		elif isinstance(node, CmpOp) and node.op in ('==', '!='):
+			# equality never raises on the values of poop
+			stack.extend((node.lhs, node.rhs))
+		else:
+			# arithmetic and ordering may raise on the operand types
+			return True
+
+	return False
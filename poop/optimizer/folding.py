@@ -0,0 +1,168 @@
+#!/usr/bin/env python3.4
+# coding: utf-8
+
+"""
+This module defines constant folding and constant propagation.
+
+Operations on literals are computed at compile time, unless they raise, in
+which case they are left to raise at run time, or unless their result would
+be too large to be stored in the compiled code.
+
+Variables declared once in a program, by a top-level declaration of a
+constant, are replaced by that constant in the statements following the
+declaration. The functions called by poop code are assumed not to rebind
+poop variables, since they have no access to them.
+"""
+
+__all__ = ['ConstantFolding', 'fold_operation', 'literal_node']
+
+import operator
+from collections import Counter
+
+from poop.parser.ast import *
+from poop.optimizer.visitor import NodeTransformer, replace
+from poop.optimizer.manager import PassManager
+
+
+OPERATIONS = {
+	'+': operator.add,
+	'-': operator.sub,
+	'*': operator.mul,
+	'/': operator.truediv,
+	'^': operator.pow,
+	'==': operator.eq,
+	'!=': operator.ne,
+	'<': operator.lt,
+	'>': operator.gt,
+	'<=': operator.le,
+	'>=': operator.ge,
+}
+
+# largest folded integers and strings, as in CPython's optimizer
+MAX_INT_BITS = 128
+MAX_STR_LENGTH = 4096
+
+# type of folded values -> literal node type
+LITERAL_TYPES = {
+	bool: BoolLiteral,
+	int: IntLiteral,
+	float: FloatLiteral,
+	str: StringLiteral,
+}
+
+
+def _too_large(op, lhs, rhs):
+	"""
+	Returns whether an operation may have a result too large to be folded,
+	without computing it.
+	"""
+
+	if type(lhs) is int and type(rhs) is int:
+		if op == '*':
+			return lhs.bit_length() + rhs.bit_length() > MAX_INT_BITS
+		elif op == '^':
+			return rhs > 0 and lhs.bit_length() * rhs > MAX_INT_BITS
+	elif op == '*' and isinstance(lhs, str) and type(rhs) is int:
+		return len(lhs) * rhs > MAX_STR_LENGTH
+	elif op == '*' and type(lhs) is int and isinstance(rhs, str):
+		return len(rhs) * lhs > MAX_STR_LENGTH
+
+	return False
+
+
+def fold_operation(op, lhs, rhs):
+	"""
+	Computes a binary operation or comparison on two constants. Returns None
+	if it cannot be folded: if it raises, or has an unexpected or too large
+	result.
+	"""
+
+	if _too_large(op, lhs, rhs):
+		return None
+
+	try:
+		value = OPERATIONS[op](lhs, rhs)
+	except Exception:
+		# raised again at run time
+		return None
+
+	if type(value) not in LITERAL_TYPES:
+		return None
+	elif type(value) is int and value.bit_length() > MAX_INT_BITS:
+		return None
+	elif type(value) is str and len(value) > MAX_STR_LENGTH:
+		return None
+
+	return value
+
+
+def literal_node(value, location):
+	"""
+	Returns the literal node of a folded value, at the location of a node.
+	"""
+
+	literal = LITERAL_TYPES[type(value)](value)
+	literal.set_span(location)
+	return literal
+
+
+@PassManager.register(level=1)
+class ConstantFolding(NodeTransformer):
+	"""
+	Folds operations on constants, and propagates the constants declared once.
+	"""
+
+	def __init__(self, exports=None):
+		super().__init__(exports)
+
+		# name -> literal of the constants declared by the previous statements
+		self.constants = {}
+
+	def visit_Program(self, program):
+		declarations = Counter(
+			node.name for node in walk(program)
+			if isinstance(node, Declaration))
+
+		instrs = []
+
+		# top-level statements are run in order: the constants they declare
+		# are known in the following ones
+		for stmt in program.instructions:
+			stmt = yield stmt
+			instrs.append(stmt)
+
+			if isinstance(stmt, Declaration) and \
+					declarations[stmt.name] == 1 and \
+					isinstance(stmt.value, Literal):
+				self.constants[stmt.name] = stmt.value
+
+		if all(new is old for new, old in zip(instrs, program.instructions)):
+			return program
+
+		return replace(program, instructions=instrs)
+
+	def visit_Variable(self, var):
+		try:
+			constant = self.constants[var.name]
+		except KeyError:
+			return var
+
+		self.rewrites += 1
+		return replace(constant, start=var.start, end=var.end, lines=var.lines)
+
+	def visit_BinOp(self, binop):
+		binop = yield from self.generic_visit(binop)
+
+		if not isinstance(binop.lhs, Literal) or \
+				not isinstance(binop.rhs, Literal):
+			return binop
+
+		value = fold_operation(binop.op, binop.lhs.value, binop.rhs.value)
+
+		if value is None:
+			return binop
+
+		self.rewrites += 1
+		return literal_node(value, binop)
+
+	visit_CmpOp = visit_BinOp
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3.4
+# coding: utf-8
+
+"""
+This module defines the pass manager, which runs the optimization passes of
+an optimization level on poop ASTs before they are compiled. To define a pass
+run from a given level, use this snippet as a template:
+
+	@PassManager.register(level=[n])
+	class [PassName](NodeTransformer):
+		...
+
+Passes run from the lowest level to the highest, and in registration order
+within a level. The passes of the 'poop' stage run on the poop AST, and those
+of the 'python' stage, which subclass `poop.compiler.pyast.PythonPass`, on the
+Python AST compiled from it.
+"""
+
+__all__ = ['PassManager', 'PassStats', 'OPTIMIZATION_LEVELS']
+
+import sys
+import time
+from collections import namedtuple
+
+from poop.registry import Registry
+
+
+OPTIMIZATION_LEVELS = (0, 1, 2)
+
+# time taken by a pass in seconds, and number of nodes it rewrote
+PassStats = namedtuple('PassStats', ['name', 'seconds', 'rewrites'])
+
+
+class PassManager:
+	"""
+	Runs the passes of an optimization level, or the given passes, and records
+	the time each pass takes and the number of nodes it rewrites in `stats`.
+	`exports` is given to the passes.
+
+	Each pass runs at the stage named by its `stage` attribute: see `run`.
+	"""
+
+	STAGES = ('poop', 'python')
+
+	# level -> passes run from that level, frozen by the first manager created
+	passes = Registry('optimization passes', multiple=True)
+
+	def __init__(self, level=0, passes=None, exports=None):
+		if level not in OPTIMIZATION_LEVELS:
+			raise ValueError('invalid optimization level {!r}'.format(level))
+
+		if passes is None:
+			registered = PassManager.passes.freeze()
+			passes = [
+				pass_type
+				for pass_level in sorted(registered) if pass_level <= level
+				for pass_type in registered[pass_level]
+			]
+
+		self.level = level
+		self.pipeline = tuple(passes)
+		self.exports = exports
+		self.stats = []
+
+	@classmethod
+	def register(cls, level):
+		"""
+		Registers a NodeTransformer or PythonPass subclass as a pass run from a
+		given optimization level.
+		"""
+
+		def _decorator_wrapper(pass_type):
+			if pass_type.stage not in cls.STAGES:
+				raise ValueError('invalid stage {!r}'.format(pass_type.stage))
+
+			cls.passes.add(level, pass_type)
+			return pass_type
+
+		return _decorator_wrapper
+
+	def run(self, tree, stage='poop'):
+		"""
+		Runs the passes of a stage on a tree, and returns the optimized tree:
+		the 'poop' stage runs on the poop AST of a program, and the 'python'
+		stage on the Python module compiled from it.
+		"""
+
+		for pass_type in self.pipeline:
+			if pass_type.stage != stage:
+				continue
+
+			transformer = pass_type(self.exports)
+
+			start = time.perf_counter()
+			tree = transformer.transform(tree)
+			seconds = time.perf_counter() - start
+
+			self.stats.append(
+				PassStats(pass_type.__name__, seconds, transformer.rewrites))
+
+		return tree
+
+	def report(self, file=sys.stderr):
+		"""
+		Prints the time taken by each pass run, and the nodes it rewrote.
+		"""
+
+		print('Optimization level {}:'.format(self.level), file=file)
+
+		if not self.stats:
+			print('  no passes run', file=file)
+
+		for stats in self.stats:
+			print('  {0.name:<30} {1:>10.3f} ms {0.rewrites:>8} rewrites'.format(
+				stats, stats.seconds * 1000), file=file)
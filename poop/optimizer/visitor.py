@@ -0,0 +1,188 @@
+#!/usr/bin/env python3.4
+# coding: utf-8
+
+"""
+This module defines a generic transformer of poop ASTs, on which optimization
+passes are built. To define a transformation, use this snippet as a template:
+
+	class [PassName](NodeTransformer):
+		def visit_[NodeType](self, node):
+			# To transform the children of the node first:
+			node = yield from self.generic_visit(node)
+
+			# To transform a single child, or a list of statements:
+			child = yield node.[field]
+
+			...  # Rewriting the node
+
+			self.rewrites += 1
+			return [new node]
+
+Visit methods are looked up along the MRO of the node types, so that
+`visit_Literal` applies to every literal, and `visit_Node` to every node.
+Nodes without a visit method are visited by `generic_visit`.
+
+Visit methods yielding the nodes they transform are run on an explicit stack,
+so that the nesting depth of the AST does not grow the Python stack. Nodes are
+never modified in place, since interned nodes may be shared: use `replace` to
+build a modified copy.
+"""
+
+__all__ = ['NodeTransformer', 'replace']
+
+import inspect
+
+from poop.parser.ast import Node
+
+
+def _node_slots(node_type):
+	"""
+	Returns all the slots of a node class, location included.
+	"""
+
+	slots = []
+
+	for base in reversed(node_type.__mro__):
+		slots.extend(base.__dict__.get('__slots__', ()))
+
+	return slots
+
+
+def replace(node, **fields):
+	"""
+	Returns a copy of a node, at the same location, with some fields replaced.
+	"""
+
+	node_type = type(node)
+	copy = node_type.__new__(node_type)
+
+	for slot in _node_slots(node_type):
+		setattr(copy, slot, fields[slot] if slot in fields else getattr(node, slot))
+
+	return copy
+
+
+class NodeTransformer:
+	"""
+	Rewrites a poop AST with the `visit_[NodeType]` methods of the subclass.
+	A visit method returns the node replacing the given one, which can be the
+	node itself; in a list of statements, it can also return None to remove
+	the statement, or a list of statements to put in its place.
+
+	`rewrites` counts the nodes rewritten, as reported by the visit methods.
+	`exports` holds the names of the variables which the program must leave in
+	its environment, or is None if all of them must be left.
+	"""
+
+	# the AST the pass runs on, as named by the pass manager
+	stage = 'poop'
+
+	def __init__(self, exports=None):
+		self.rewrites = 0
+		self.exports = exports
+
+		# node type -> visit method, resolved on the first visit
+		self._dispatch = {}
+
+	def get_visitor(self, node_type):
+		"""
+		Returns the method visiting the nodes of a given type.
+		"""
+
+		try:
+			return self._dispatch[node_type]
+		except KeyError:
+			pass
+
+		visitor = self.generic_visit
+
+		for base in node_type.__mro__:
+			method = getattr(self, 'visit_' + base.__name__, None)
+
+			if method is not None:
+				visitor = method
+				break
+
+		self._dispatch[node_type] = visitor
+		return visitor
+
+	def generic_visit(self, node):
+		"""
+		Transforms the children of a node, and returns a copy of the node with
+		the transformed children, or the node itself if none has changed.
+		"""
+
+		changes = {}
+
+		for field in node._fields:
+			value = getattr(node, field)
+
+			if isinstance(value, (Node, list, tuple)):
+				new_value = yield value
+
+				if isinstance(value, Node):
+					if new_value is not value:
+						changes[field] = new_value
+				elif len(new_value) != len(value) or any(
+						new is not old for new, old in zip(new_value, value)):
+					changes[field] = type(value)(new_value)
+
+		if not changes:
+			return node
+
+		return replace(node, **changes)
+
+	def _visit(self, item):
+		"""
+		Starts the visit of a node or of a list of nodes. Returns the running
+		visit, or its result if it is already done.
+		"""
+
+		if isinstance(item, Node):
+			return self.get_visitor(type(item))(item)
+		elif isinstance(item, (list, tuple)):
+			return self._visit_list(item)
+
+		return item
+
+	def _visit_list(self, items):
+		"""
+		Transforms the nodes of a list. Removed nodes are dropped from the
+		result, and lists replacing a node are spliced into it.
+		"""
+
+		result = []
+
+		for item in items:
+			new_item = yield item
+
+			if isinstance(new_item, list):
+				result.extend(new_item)
+			elif new_item is not None:
+				result.append(new_item)
+
+		return result
+
+	def transform(self, node):
+		"""
+		Transforms a tree, and returns its new root.
+		"""
+
+		# the running visits
+		stack = []
+		result = self._visit(node)
+
+		while True:
+			if inspect.isgenerator(result):
+				stack.append(result)
+				result = None
+			elif not stack:
+				return result
+
+			try:
+				item = stack[-1].send(result)
+			except StopIteration as stop:
+				stack.pop()
+				result = stop.value
+			else:
+				result = self._visit(item)
@@ -6,3 +6,7 @@ from poop.parser.ast import *
 from poop.parser.syntax import *
 from poop.parser.lexer import *
 from poop.parser.types import *
+from poop.parser.incremental import *
+from poop.parser.parallel import *
+from poop.parser.serialize import *
+from poop.parser.hashcons import *
@@ -8,28 +8,73 @@ Defines the AST structure of programs and expressions.
 __all__ = [
     'Node',                              # Base node
     'Program',                           # program AST
-    'Stmt', 'Expr', 'Literal',           # abstract AST nodes
+    'Stmt', 'Expr', 'Atom', 'Literal',   # abstract AST nodes
     'While', 'IfStmt',                   # control flow
     'Declaration', 'StmtExpr',           # statements
     'Call', 'BinOp', 'CmpOp',            # calls
     'Variable',                          # atom
     'IntLiteral', 'FloatLiteral',        # numeric literal
-    'CharLiteral', 'StringLiteral'       # string-related literals
+    'CharLiteral', 'StringLiteral',      # string-related literals
+    'BoolLiteral',                       # folded comparisons
+    'iter_child_nodes', 'walk'           # traversal
 ]
 
+from collections import deque
+
+from poop.parser.types import SourcePos, SourceSpan
+
 
 class Node:
     """
     Abstract Acid AST node.
+
+    `_fields` lists the attributes holding the node's children and values.
+
+    Nodes are slotted. Their location is stored as the `start` and `end`
+    offsets in the source indexed by `lines`, which are None for nodes without
+    location; `span` and `pos` are computed from them when read.
     """
 
+    __slots__ = ('start', 'end', 'lines')
+
+    _fields = ()
+
     def __init__(self):
-        self.span = None
+        self.start = self.end = self.lines = None
+
+    @property
+    def span(self):
+        if self.start is not None:
+            return SourceSpan(SourcePos.at(self.lines, self.start),
+                              SourcePos.at(self.lines, self.end))
+
+    @span.setter
+    def span(self, span):
+        if span is None:
+            self.start = self.end = self.lines = None
+        elif span.start.offset is None or span.end.offset is None:
+            raise ValueError('node spans must be offsets in a source')
+        else:
+            self.start, self.end = span.start.offset, span.end.offset
+            self.lines = span.start.lines
 
     @property
     def pos(self):
-        if self.span is not None:
-            return self.span.start
+        if self.start is not None:
+            return SourcePos.at(self.lines, self.start)
+
+    def set_span(self, first, last=None):
+        """
+        Locates the node from the first and last tokens or nodes it is made
+        of, and returns it.
+        """
+
+        if last is None:
+            last = first
+
+        self.start, self.end = first.start, last.end
+        self.lines = first.lines
+        return self
 
     @classmethod
     def sub_types(cls):
@@ -41,12 +86,20 @@ class Node:
 class Program(Node):
     """
     Represents a sequence of instructions.
+
+    The expressions of a program parsed with a NodeInterner are shared and
+    have no location: their locations are stored in `spans` instead.
     """
 
+    __slots__ = ('path', 'instructions', 'spans')
+
+    _fields = ('instructions',)
+
     def __init__(self, instructions, path=None):
         super().__init__()
         self.path = path
         self.instructions = instructions
+        self.spans = None
 
     def __repr__(self):
         fmt = 'Program(path={0.path!r}, instructions={0.instructions})'
@@ -58,13 +111,20 @@ class Stmt(Node):
     Abstract AST element representing a top-level statement.
     """
 
+    __slots__ = ()
+
 
 class StmtExpr(Stmt):
     """
     An expression statement.
     """
 
+    __slots__ = ('expr',)
+
+    _fields = ('expr',)
+
     def __init__(self, expr):
+        super().__init__()
         self.expr = expr
 
     def __repr__(self):
@@ -76,7 +136,12 @@ class While(Stmt):
     Looping while a condition is verified.
     """
 
+    __slots__ = ('cond', 'body')
+
+    _fields = ('cond', 'body')
+
     def __init__(self, cond, body):
+        super().__init__()
         self.cond = cond
         self.body = body
 
@@ -89,6 +154,10 @@ class Declaration(Stmt):
     Declaring a name.
     """
 
+    __slots__ = ('name', 'value')
+
+    _fields = ('name', 'value')
+
     def __init__(self, name, value):
         super().__init__()
         self.name = name
@@ -103,6 +172,10 @@ class IfStmt(Stmt):
     Conditional control structure.
     """
 
+    __slots__ = ('cond', 'body', 'else_body')
+
+    _fields = ('cond', 'body', 'else_body')
+
     def __init__(self, cond, body, else_body=()):
         super().__init__()
         self.cond = cond
@@ -118,12 +191,26 @@ class Expr(Node):
     Abstract AST element representing an expression node.
     """
 
+    __slots__ = ()
+
+
+class Atom(Expr):
+    """
+    Abstract AST element representing an operand of infix operators.
+    """
+
+    __slots__ = ()
 
-class Call(Expr):
+
+class Call(Atom):
     """
     Function call.
     """
 
+    __slots__ = ('func', 'args')
+
+    _fields = ('func', 'args')
+
     def __init__(self, func, args):
         super().__init__()
         self.func = func
@@ -138,7 +225,12 @@ class BinOp(Expr):
     Binary infix operation.
     """
 
+    __slots__ = ('lhs', 'op', 'rhs')
+
+    _fields = ('lhs', 'op', 'rhs')
+
     def __init__(self, lhs, op, rhs):
+        super().__init__()
         self.lhs, self.rhs =lhs, rhs
         self.op = op
 
@@ -151,7 +243,12 @@ class CmpOp(Expr):
     Binary infix comparison.
     """
 
+    __slots__ = ('lhs', 'op', 'rhs')
+
+    _fields = ('lhs', 'op', 'rhs')
+
     def __init__(self, lhs, op, rhs):
+        super().__init__()
         self.lhs, self.rhs =lhs, rhs
         self.op = op
 
@@ -159,11 +256,15 @@ class CmpOp(Expr):
         return 'CmpOp(lhs={0.lhs!r}, op={0.op!r}, rhs={0.rhs!r})'.format(self)
 
 
-class Variable(Expr):
+class Variable(Atom):
     """
     Variable name.
     """
 
+    __slots__ = ('name',)
+
+    _fields = ('name',)
+
     def __init__(self, name):
         super().__init__()
         self.name = name
@@ -172,11 +273,15 @@ class Variable(Expr):
         return 'Variable(name={0.name!r})'.format(self)
 
 
-class Literal(Expr):
+class Literal(Atom):
     """
     Abstract literal expression.
     """
 
+    __slots__ = ('value',)
+
+    _fields = ('value',)
+
     def __init__(self, value):
         super().__init__()
         self.value = value
@@ -190,20 +295,65 @@ class IntLiteral(Literal):
     Integer literal expression.
     """
 
+    __slots__ = ()
+
 
 class FloatLiteral(Literal):
     """
     Floating point number literal expression.
     """
 
+    __slots__ = ()
+
 
 class CharLiteral(Literal):
     """
     Literal character. May be escaped.
     """
 
+    __slots__ = ()
+
 
 class StringLiteral(Literal):
     """
     Literal sequence of potentially escaped characters.
     """
+
+    __slots__ = ()
+
+
+class BoolLiteral(Literal):
+    """
+    Boolean value. Has no syntax: only produced by folding comparisons.
+    """
+
+    __slots__ = ()
+
+
+def iter_child_nodes(node):
+    """
+    Yields the direct children of a node, in field order.
+    """
+
+    for field in node._fields:
+        value = getattr(node, field, None)
+
+        if isinstance(value, Node):
+            yield value
+        elif isinstance(value, (list, tuple)):
+            for item in value:
+                if isinstance(item, Node):
+                    yield item
+
+
+def walk(node):
+    """
+    Yields a node and all its descendants, breadth first.
+    """
+
+    todo = deque([node])
+
+    while todo:
+        node = todo.popleft()
+        todo.extend(iter_child_nodes(node))
+        yield node
@@ -0,0 +1,321 @@
+#!/usr/bin/env python3.4
+# coding: utf-8
+
+"""
+Defines hash-consing of ASTs: structurally equal expressions are replaced by
+a single shared node, so that repeated literals, variables and sub-expressions
+are only stored once, and structurally equal interned expressions are the same
+object.
+
+Shared nodes cannot be located, since they occur at several places. The
+locations of the expressions of an interned program are kept in its `spans`
+array instead, in the preorder of the expressions.
+
+Structural hashes are built from the builtin `hash` of the values of the
+nodes, which is randomized for strings: they are only comparable within a
+process, and must not be stored.
+"""
+
+__all__ = [
+    'NodeInterner', 'structural_hash', 'structurally_equal', 'expr_spans',
+]
+
+from array import array
+
+from poop.parser.ast import Node, Stmt, Expr, iter_child_nodes
+
+
+def _value_key(value):
+    """
+    Returns the key comparing a field value which is not a node. Values of
+    different types never compare equal, nor do 0.0 and -0.0.
+    """
+
+    if isinstance(value, float):
+        return float, value.hex()
+
+    return type(value), value
+
+
+def _field_hashes(node, hashes):
+    """
+    Returns the hashes of the fields of a node, reading the hashes of its
+    child nodes from `hashes`.
+    """
+
+    result = [type(node).__name__]
+
+    for field in node._fields:
+        value = getattr(node, field)
+
+        if isinstance(value, Node):
+            result.append(hashes[id(value)])
+        elif isinstance(value, (list, tuple)):
+            result.append(tuple(
+                hashes[id(item)] if isinstance(item, Node) else
+                _value_key(item) for item in value))
+        else:
+            result.append(_value_key(value))
+
+    return hash(tuple(result))
+
+
+def structural_hash(node):
+    """
+    Returns a hash of a node which only depends on its structure: its type,
+    its values and those of its descendants, but not its location. The hash
+    changes between processes.
+    """
+
+    hashes = {}
+    stack = [(node, False)]
+
+    while stack:
+        item, done = stack.pop()
+
+        if id(item) in hashes:
+            continue
+
+        if done:
+            hashes[id(item)] = _field_hashes(item, hashes)
+        else:
+            stack.append((item, True))
+            stack.extend((child, False) for child in iter_child_nodes(item))
+
+    return hashes[id(node)]
+
+
+def structurally_equal(lhs, rhs):
+    """
+    Returns whether two nodes have the same type and values, and structurally
+    equal children. Interned nodes are compared in constant time.
+    """
+
+    pairs = [(lhs, rhs)]
+
+    while pairs:
+        lhs, rhs = pairs.pop()
+
+        if lhs is rhs:
+            continue
+
+        if type(lhs) is not type(rhs):
+            return False
+
+        for field in lhs._fields:
+            lhs_value, rhs_value = getattr(lhs, field), getattr(rhs, field)
+
+            if isinstance(lhs_value, Node):
+                pairs.append((lhs_value, rhs_value))
+            elif isinstance(lhs_value, (list, tuple)):
+                if not isinstance(rhs_value, (list, tuple)) or \
+                        len(lhs_value) != len(rhs_value):
+                    return False
+
+                for lhs_item, rhs_item in zip(lhs_value, rhs_value):
+                    if isinstance(lhs_item, Node):
+                        pairs.append((lhs_item, rhs_item))
+                    elif _value_key(lhs_item) != _value_key(rhs_item):
+                        return False
+            elif isinstance(rhs_value, Node) or \
+                    _value_key(lhs_value) != _value_key(rhs_value):
+                return False
+
+    return True
+
+
+class NodeInterner:
+    """
+    Hash-consing table of expressions. Interned expressions have no location,
+    their lists of children are tuples, and they must not be modified: passes
+    rewriting them must create new nodes.
+
+    An interner can be shared by the parsers of several programs, so that
+    their expressions are shared too, but not by several threads at once.
+    """
+
+    def __init__(self):
+        # structural key -> interned node
+        self._nodes = {}
+
+        # id of an interned node -> structural hash
+        self._hashes = {}
+
+    def __len__(self):
+        return len(self._nodes)
+
+    def __contains__(self, node):
+        # interned nodes are alive, so no other object can have their id
+        return id(node) in self._hashes
+
+    def _key(self, node):
+        """
+        Returns the key of a node whose children are interned.
+        """
+
+        key = [type(node)]
+
+        for field in node._fields:
+            value = getattr(node, field)
+
+            if isinstance(value, Node):
+                key.append(value)
+            elif isinstance(value, (list, tuple)):
+                key.append(tuple(
+                    item if isinstance(item, Node) else _value_key(item)
+                    for item in value))
+            else:
+                key.append(_value_key(value))
+
+        return tuple(key)
+
+    def structural_hash(self, node):
+        """
+        Returns the structural hash of an interned node, without walking it.
+        """
+
+        return self._hashes[id(node)]
+
+    def intern(self, expr, spans=None):
+        """
+        Returns the interned expression structurally equal to `expr`, which is
+        not modified. The locations of `expr` and of its descendants are
+        appended to the array `spans` if given, in preorder, as pairs of start
+        and end offsets, or -1 for nodes without location.
+        """
+
+        results = []
+        stack = [(expr, False)]
+
+        while stack:
+            node, done = stack.pop()
+
+            if not done:
+                if spans is not None:
+                    if node.start is None:
+                        spans.extend((-1, -1))
+                    else:
+                        spans.extend((node.start, node.end))
+
+                stack.append((node, True))
+                stack.extend(
+                    (child, False) for child in
+                    reversed(list(iter_child_nodes(node))))
+                continue
+
+            node_type = type(node)
+            copy = node_type.__new__(node_type)
+            copy.start = copy.end = copy.lines = None
+
+            # the interned children are the last results, in field order
+            children = sum(1 for _ in iter_child_nodes(node))
+            interned = iter(results[len(results) - children:])
+            del results[len(results) - children:]
+
+            for field in node._fields:
+                value = getattr(node, field)
+
+                if isinstance(value, Node):
+                    value = next(interned)
+                elif isinstance(value, (list, tuple)):
+                    value = tuple(
+                        next(interned) if isinstance(item, Node) else item
+                        for item in value)
+
+                setattr(copy, field, value)
+
+            key = self._key(copy)
+            shared = self._nodes.get(key)
+
+            if shared is None:
+                shared = self._nodes[key] = copy
+                self._hashes[id(copy)] = _field_hashes(copy, self._hashes)
+
+            results.append(shared)
+
+        return results[0]
+
+    def intern_stmt(self, stmt):
+        """
+        Replaces the expressions of a statement by interned ones, in place;
+        the expressions of its nested statements are left as they are.
+        Returns the array of the locations of the replaced expressions, as
+        filled by `intern`.
+        """
+
+        spans = array('q')
+
+        for field in stmt._fields:
+            value = getattr(stmt, field)
+
+            if isinstance(value, Expr):
+                setattr(stmt, field, self.intern(value, spans))
+
+        return spans
+
+    def intern_program(self, program, interned=None):
+        """
+        Replaces the expressions of the statements of a program by interned
+        ones, in place, and stores their locations in the `spans` array of
+        the program, in the order of `expr_spans`.
+
+        `interned` maps the statements whose expressions are already interned
+        to the locations returned by `intern_stmt`.
+        """
+
+        spans = array('q')
+
+        for stmt in _iter_stmts(program):
+            if interned is not None and stmt in interned:
+                spans.extend(interned[stmt])
+            else:
+                spans.extend(self.intern_stmt(stmt))
+
+        program.spans = spans
+
+
+def _iter_stmts(program):
+    """
+    Yields the statements of a program, nested ones included, in preorder.
+    """
+
+    stack = list(reversed(program.instructions))
+
+    while stack:
+        stmt = stack.pop()
+        yield stmt
+
+        for field in reversed(stmt._fields):
+            value = getattr(stmt, field)
+
+            if isinstance(value, (list, tuple)):
+                stack.extend(
+                    item for item in reversed(value) if isinstance(item, Stmt))
+
+
+def expr_spans(program):
+    """
+    Yields the expressions of a program interned by `intern_program`, with
+    their start and end offsets, or -1 if they have none.
+
+    Expressions are yielded in preorder, statement by statement, and shared
+    expressions once for each place they occur at.
+    """
+
+    spans = program.spans
+    index = 0
+
+    for stmt in _iter_stmts(program):
+        for field in stmt._fields:
+            value = getattr(stmt, field)
+
+            if not isinstance(value, Expr):
+                continue
+
+            stack = [value]
+
+            while stack:
+                node = stack.pop()
+                yield node, spans[index], spans[index + 1]
+                index += 2
+                stack.extend(reversed(list(iter_child_nodes(node))))
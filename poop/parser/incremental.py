@@ -0,0 +1,221 @@
+#!/usr/bin/env python3.4
+# coding: utf-8
+
+"""
+Defines incremental reparsing: after an edit of a parsed source, only the
+top-level statements touched by the edit are lexed and parsed again.
+"""
+
+__all__ = ['TextEdit', 'reparse']
+
+from bisect import bisect_left, bisect_right
+from collections.abc import Sequence
+
+from poop.parser.parser import Parser
+from poop.parser.lexer import TokenType, TokenStream
+from poop.parser.types import LineIndex
+from poop.parser.ast import Program, Stmt
+from poop.exception import ParseError
+
+
+# number of characters compared at once when diffing two sources
+_DIFF_CHUNK = 4096
+
+
+class TextEdit:
+    """
+    Replacement of the text between the offsets `start` and `end` of a source
+    string by `text`.
+    """
+
+    def __init__(self, start, end, text):
+        self.start, self.end = start, end
+        self.text = text
+
+    def __repr__(self):
+        return 'TextEdit(start={0.start}, end={0.end}, text={0.text!r})'.format(self)
+
+    @property
+    def delta(self):
+        """
+        Difference between the lengths of the edited and original sources.
+        """
+
+        return len(self.text) - (self.end - self.start)
+
+    def apply(self, code):
+        """
+        Returns the edited version of a source string.
+        """
+
+        return code[:self.start] + self.text + code[self.end:]
+
+    @classmethod
+    def diff(cls, old, new):
+        """
+        Returns the smallest single edit turning `old` into `new`.
+        """
+
+        prefix = _common_prefix(old, new)
+        suffix = _common_suffix(old, new, min(len(old), len(new)) - prefix)
+        return cls(prefix, len(old) - suffix, new[prefix:len(new) - suffix])
+
+
+def _common_prefix(a, b):
+    """
+    Returns the length of the common prefix of two strings.
+    """
+
+    limit = min(len(a), len(b))
+    length = 0
+
+    # skips equal chunks, then equal characters
+    while length + _DIFF_CHUNK <= limit and \
+            a[length:length + _DIFF_CHUNK] == b[length:length + _DIFF_CHUNK]:
+        length += _DIFF_CHUNK
+
+    while length < limit and a[length] == b[length]:
+        length += 1
+
+    return length
+
+
+def _common_suffix(a, b, limit):
+    """
+    Returns the length, up to `limit`, of the common suffix of two strings.
+    """
+
+    length = 0
+
+    while length + _DIFF_CHUNK <= limit and \
+            a[len(a) - length - _DIFF_CHUNK:len(a) - length] == \
+            b[len(b) - length - _DIFF_CHUNK:len(b) - length]:
+        length += _DIFF_CHUNK
+
+    while length < limit and a[len(a) - length - 1] == b[len(b) - length - 1]:
+        length += 1
+
+    return length
+
+
+def _parse_region(code, start, end, lines, path):
+    """
+    Lexes and parses the statements between two offsets of a source. Returns
+    None if the region is not a sequence of complete statements.
+    """
+
+    try:
+        tokens = TokenStream.from_code(code, start, end, lines)
+    except ParseError:
+        return None
+
+    # the region must end with a newline, followed by blanks at most, for its
+    # last token not to be continued by the following source
+    if tokens:
+        if tokens.type(len(tokens) - 1) != TokenType.NEWLINE:
+            return None
+
+        tail = code[tokens.ends[-1]:end]
+    else:
+        tail = code[start:end]
+
+    if tail and not tail.isspace():
+        return None
+
+    parser = Parser(code, path, tokens=tokens)
+    stmts = parser.many(Stmt)
+
+    if not parser.at_end():
+        return None
+
+    return stmts
+
+
+def reparse(program, code, edit):
+    """
+    Parses the source `code`, obtained by applying `edit` to the source of
+    `program`, reusing the statements of `program` that the edit does not
+    touch.
+
+    Statements are only lexed and parsed again from the first statement
+    touched by the edit to the first untouched statement able to follow the
+    parsed ones. Falls back to parsing the whole source when that is not
+    possible.
+
+    The statements after the edit are kept as they are: the line index of the
+    previous source is forwarded to the new one once the reparse succeeds, and
+    moves their offsets when they are located. `program` must not be used
+    afterwards.
+    """
+
+    instrs = program.instructions
+
+    if not instrs or instrs[0].lines is None:
+        return Parser(code, program.path).run()
+
+    # the statements kept by previous reparses may use older line indexes,
+    # which all end up forwarded to the index of the previous source
+    lines, _ = instrs[0].lines.resolve(0)
+
+    def start(index):
+        stmt = instrs[index]
+        return stmt.lines.absolute(stmt.start)
+
+    def end(index):
+        return start(index + 1) if index + 1 < len(instrs) else \
+            len(code) - edit.delta
+
+    # statement i spans from its start to the start of the next one
+    starts = _Offsets(start, len(instrs))
+    first = max(bisect_left(starts, edit.start) - 1, 0)
+    last = bisect_right(starts, edit.end) - 1
+
+    # edits of the program header
+    if edit.start < starts[0]:
+        return Parser(code, program.path).run()
+
+    region_start = starts[first]
+    new_lines = LineIndex(code)
+
+    # widens the region until its statements parse
+    for after in range(last + 1, len(instrs) + 1):
+        region_end = end(after - 1) + edit.delta
+        stmts = _parse_region(code, region_start, region_end, new_lines,
+                              program.path)
+
+        if stmts is not None:
+            break
+    else:
+        # reports errors as a complete parse would
+        return Parser(code, program.path).run()
+
+    new_instrs = instrs[:first] + stmts + instrs[after:]
+
+    if not new_instrs:
+        return Parser(code, program.path).run()
+
+    # the offsets from the end of the region are the ones moved by the edit
+    lines.forward(new_lines, region_end - edit.delta, edit.delta)
+
+    first_stmt, last_stmt = new_instrs[0], new_instrs[-1]
+    new_program = Program(new_instrs, program.path)
+    new_program.start = first_stmt.lines.absolute(first_stmt.start)
+    new_program.end = last_stmt.lines.absolute(last_stmt.end)
+    new_program.lines = new_lines
+    return new_program
+
+
+class _Offsets(Sequence):
+    """
+    Sequence of the offsets of the statements of a program, computed as they
+    are read by a binary search.
+    """
+
+    def __init__(self, offset, length):
+        self.offset, self.length = offset, length
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, index):
+        return self.offset(index)
@@ -5,15 +5,24 @@
 Defines some types and functions for tokenizing a given code string.
 """
 
-__all__ = ['TokenType', 'Token', 'tokenize', 'BIN_OP', 'CMP_OP']
+__all__ = [
+    'TokenType', 'Token', 'TokenStream',
+    'tokenize', 'tokenize_stream', 'tokenize_file',
+    'BIN_OP', 'CMP_OP'
+]
 
 
 import re
+import sys
 import ast
+import mmap
+import codecs
+from array import array
+from collections.abc import Sequence
+from contextlib import contextmanager
 from enum import Enum
-from itertools import dropwhile
 
-from poop.parser.types import SourcePos, SourceSpan
+from poop.parser.types import LineIndex, SourcePos, SourceSpan
 from poop.exception import ParseError
 
 BIN_OP = {
@@ -57,12 +66,14 @@ class TokenType(Enum):
 
     COMMA = r','
 
-    BIN_OP = '(' + '|'.join(map(re.escape, BIN_OP)) + ')'
-    CMP_OP = '(' + '|'.join(map(re.escape, CMP_OP)) + ')'
-
+    # comments must be tried before BIN_OP, which would match the leading `/`
     LINE_COMMENT = r'//'
     COMMENT_START, COMMENT_END = r'/\*', r'\*/'
 
+    # longest operators first, so that `<=` is not lexed as `<` followed by `=`
+    BIN_OP = '(' + '|'.join(map(re.escape, sorted(BIN_OP, key=len, reverse=True))) + ')'
+    CMP_OP = '(' + '|'.join(map(re.escape, sorted(CMP_OP, key=len, reverse=True))) + ')'
+
     LPAREN, RPAREN = r'\(', r'\)'
 
     CHAR_LITERAL = r"'([^'\\]|\\.)'"
@@ -78,13 +89,15 @@ class TokenType(Enum):
 
 class Token:
     """
-    Concrete lexeme type.
+    Concrete lexeme type. `start` and `end` are offsets in the source indexed
+    by `lines`, from which the span is computed on demand.
     """
 
-    def __init__(self, type, value, span):
+    def __init__(self, type, value, start, end, lines):
         self.type = type
         self.value = value
-        self.span = span
+        self.start, self.end = start, end
+        self.lines = lines
 
     def __repr__(self):
         fmt = 'Token(type={tok.type}, value={tok.value!r}, span={tok.span!r})'
@@ -92,7 +105,229 @@ class Token:
 
     @property
     def pos(self):
-        return self.span.start
+        return SourcePos.at(self.lines, self.start)
+
+    @property
+    def span(self):
+        end = SourcePos.at(self.lines, self.end)
+        return SourceSpan(self.pos, end)
+
+
+# every token type as a named alternative of a single pattern; alternatives
+# are tried from left to right, in the declaration order of TokenType
+TOKEN_REGEX = re.compile('|'.join(
+    '(?P<{}>{})'.format(token_type.name, token_type.regex.pattern)
+    for token_type in TokenType
+))
+
+# token kinds are the indices of the token types in declaration order
+_TOKEN_TYPES = list(TokenType)
+
+# group index of the master pattern -> token kind
+_GROUP_KINDS = {
+    TOKEN_REGEX.groupindex[token_type.name]: kind
+    for kind, token_type in enumerate(_TOKEN_TYPES)
+}
+
+# kinds that are never stored in a token stream
+_WHITESPACE = _TOKEN_TYPES.index(TokenType.WHITESPACE)
+_LINE_COMMENT = _TOKEN_TYPES.index(TokenType.LINE_COMMENT)
+_COMMENT_START = _TOKEN_TYPES.index(TokenType.COMMENT_START)
+
+# kinds whose values are interned: keywords and identifiers
+_INTERNED_KINDS = frozenset(
+    _TOKEN_TYPES.index(token_type) for token_type in (
+        TokenType.UNZIP_PANTS, TokenType.FLUSH_TOILETS,
+        TokenType.CONSTIPATED_WHILE, TokenType.WIPE, TokenType.STINKY,
+        TokenType.IS, TokenType.READ, TokenType.IF, TokenType.ELSEIF,
+        TokenType.ELSE, TokenType.SPLOSH, TokenType.IDENT
+    )
+)
+
+# how far the buffered source must extend past the end of a token before the
+# token is known to be complete; longer than any keyword or literal suffix
+_LOOKAHEAD = 64
+
+# default number of characters (or bytes) read at once by tokenize_stream
+CHUNK_SIZE = 1 << 16
+
+
+def _scan(code, pos, kinds, starts, ends, final=True, lines=None, endpos=None):
+    """
+    Appends the kind, start and end offsets of the tokens of `code`, from
+    offset `pos` to offset `endpos` (the end by default), to the given arrays.
+
+    Unless `final` is true, `code` is a buffer that may be continued later:
+    scanning stops before the first token that could still extend past its end,
+    and the offset where scanning must resume is returned. `lines` is the line
+    index of the buffer, used for error messages.
+    """
+
+    if lines is None:
+        lines = LineIndex(code)
+
+    match_token = TOKEN_REGEX.match
+    add_kind, add_start, add_end = kinds.append, starts.append, ends.append
+    length = len(code) if endpos is None else endpos
+
+    # tokens ending after this offset might be cut by the end of the buffer
+    limit = length if final else length - _LOOKAHEAD
+
+    while pos < length:
+        match = match_token(code, pos, length)
+
+        if match is None:
+            # an unterminated string literal may be completed by the next chunk
+            if not final and (pos > limit or code[pos] == '"'):
+                return pos
+
+            # when no token type matches the code at the cursor
+            pos = SourcePos.at(lines, pos)
+            raise ParseError(code, pos, "Failed to tokenize code")
+
+        end = match.end()
+
+        if end > limit:
+            return pos
+
+        kind = _GROUP_KINDS[match.lastindex]
+
+        if kind == _LINE_COMMENT:
+            # jump to the newline, which is lexed as a regular token
+            end = code.find('\n', end, length)
+
+            if end == -1:
+                if not final:
+                    return pos
+
+                end = length
+
+        elif kind == _COMMENT_START:
+            # jump past the comment ending token
+            comment_end = code.find('*/', end, length)
+
+            if comment_end == -1:
+                if not final:
+                    return pos
+
+                pos = SourcePos.at(lines, end)
+                raise ParseError(code, pos, "Unterminated comment")
+
+            end = comment_end + len('*/')
+
+        # skipping whitespace
+        elif kind != _WHITESPACE:
+            add_kind(kind)
+            add_start(pos)
+            add_end(end)
+
+        pos = end
+
+    return pos
+
+
+class TokenStream(Sequence):
+    """
+    Compact sequence of the tokens of a source string.
+
+    Token kinds, start and end offsets are stored in arrays; token values are
+    only sliced from the source when they are read, and Token instances are
+    only created when the stream is indexed or iterated.
+    """
+
+    def __init__(self, code, lines=None):
+        self.code = code
+        self.lines = lines or LineIndex(code)
+        self.kinds = array('B')
+        self.starts = array('I')
+        self.ends = array('I')
+
+    @classmethod
+    def from_code(cls, code, start=0, end=None, lines=None, final=True):
+        """
+        Tokenizes an entire source string, or the part of it between the
+        offsets `start` and `end`.
+
+        Unless `final` is true, `code` may be continued later, and the tokens
+        which could still extend past its end are left out.
+        """
+
+        stream = cls(code, lines)
+        _scan(code, start, stream.kinds, stream.starts, stream.ends, final,
+              stream.lines, end)
+        return stream
+
+    @classmethod
+    def from_file(cls, path, chunk_size=CHUNK_SIZE, encoding='utf-8'):
+        """
+        Tokenizes the file at `path`, memory-mapped and lexed as it is decoded
+        by chunks, as by `tokenize_file`. The stream holds the decoded source.
+        """
+
+        stream = cls('')
+        parts = []
+
+        with _mapped_file(path) as source:
+            for chunk, tokens, base in _scan_stream(source, chunk_size,
+                                                    encoding):
+                parts.append(chunk)
+                stream.kinds.extend(tokens.kinds)
+                stream.starts.extend(start + base for start in tokens.starts)
+                stream.ends.extend(end + base for end in tokens.ends)
+
+        stream.code = ''.join(parts)
+        stream.lines = LineIndex(stream.code)
+        return stream
+
+    def __repr__(self):
+        return 'TokenStream(tokens={})'.format(len(self))
+
+    def __len__(self):
+        return len(self.kinds)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+
+        if index < 0:
+            index += len(self)
+
+        return Token(self.type(index), self.value(index),
+                     self.starts[index], self.ends[index], self.lines)
+
+    def type(self, index):
+        """
+        Returns the type of the token at `index`.
+        """
+
+        return _TOKEN_TYPES[self.kinds[index]]
+
+    def value(self, index):
+        """
+        Returns the source string of the token at `index`.
+        """
+
+        value = self.code[self.starts[index]:self.ends[index]]
+
+        if self.kinds[index] in _INTERNED_KINDS:
+            value = sys.intern(value)
+
+        return value
+
+    def pos(self, index):
+        """
+        Returns the source position of the token at `index`.
+        """
+
+        return SourcePos.at(self.lines, self.starts[index])
+
+    def span(self, index):
+        """
+        Returns the source span of the token at `index`.
+        """
+
+        end = SourcePos.at(self.lines, self.ends[index])
+        return SourceSpan(self.pos(index), end)
 
 
 def tokenize(code):
@@ -100,58 +335,78 @@ def tokenize(code):
     Chop the given string in Token instances.
     """
 
-    cursor = SourcePos(line=1, column=1)
+    yield from TokenStream.from_code(code)
+
+
+def _scan_stream(stream, chunk_size, encoding):
+    """
+    Tokenizes the content of a readable object, read in chunks of
+    `chunk_size`. Yields, for each chunk, the decoded chunk, the TokenStream
+    of the tokens it completes, whose source is the unconsumed part of the
+    content, and the offset of this source in the content.
+    """
+
+    decoder = codecs.getincrementaldecoder(encoding)()
+    buffer, pos, first_line, base = '', 0, 1, 0
+    final = False
 
-    while code:
-        # iterates over all TokenType instances in order
-        for token_type in TokenType:
-            match = token_type.regex.match(code)
+    while not final:
+        chunk = stream.read(chunk_size)
+        final = not chunk
 
-            if match is not None:
-                # source position before the code is consumed
-                startpos = cursor.copy()
+        if isinstance(chunk, bytes):
+            chunk = decoder.decode(chunk, final)
 
-                # pop the matched string
-                code = code[match.end():]
+        # drop the consumed source, but keep the current line for errors
+        line_start = buffer.rfind('\n', 0, pos) + 1
+        first_line += buffer.count('\n', 0, line_start)
+        base += line_start
+        buffer = buffer[line_start:] + chunk
+        pos -= line_start
 
-                # value is assigned to the entire match string
-                value = match.group(0)
+        tokens = TokenStream(buffer, LineIndex(buffer, first_line))
+        pos = _scan(buffer, pos, tokens.kinds, tokens.starts, tokens.ends,
+                    final, tokens.lines)
 
-                # update cursor position (line and column index)
-                cursor.feed(value)
+        yield chunk, tokens, base
 
-                if token_type == TokenType.LINE_COMMENT:
-                    # drop every character until newline
-                    code = ''.join(dropwhile(lambda c: c != '\n', code))
 
-                elif token_type == TokenType.COMMENT_START:
-                    # test if the code matches a comment ending token
-                    m = TokenType.COMMENT_END.regex.match(code)
+@contextmanager
+def _mapped_file(path):
+    """
+    Opens the file at `path` as a read-only memory map.
+    """
 
-                    # while the comment block is not ended
-                    while m is None:
-                        # feed a character from the comment string
-                        cursor.feed(code[0])
+    with open(path, 'rb') as file:
+        try:
+            source = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # empty files cannot be mapped
+            source = file
 
-                        # pop a single character
-                        code = code[1:]
+        with source:
+            yield source
 
-                        # retest if the code matches a comment ending token
-                        m = TokenType.COMMENT_END.regex.match(code)
 
-                    # pop the matched string
-                    code = code[m.end():]
+def tokenize_stream(stream, chunk_size=CHUNK_SIZE, encoding='utf-8'):
+    """
+    Chop the content of a readable object in Token instances, reading it in
+    chunks of `chunk_size`.
 
-                # skipping whitespace
-                elif token_type is not TokenType.WHITESPACE:
-                        # copy the cursor to avoid unwanted reference
-                        endpos = cursor.copy()
+    `stream` may be a text file, a binary file or a `mmap` object; binary
+    content is decoded using `encoding`. Only the unconsumed part of the
+    current line is kept in memory.
+    """
 
-                        span = SourceSpan(startpos, endpos)
-                        tok = Token(token_type, value, span)
-                        yield tok
+    for chunk, tokens, base in _scan_stream(stream, chunk_size, encoding):
+        yield from tokens
+
+
+def tokenize_file(path, chunk_size=CHUNK_SIZE, encoding='utf-8'):
+    """
+    Chop the content of the file at `path` in Token instances. The file is
+    memory-mapped and never entirely loaded.
+    """
 
-                break
-        else:
-            # when every token type has been tried
-            raise ParseError(code, cursor, "Failed to tokenize code")
+    with _mapped_file(path) as source:
+        yield from tokenize_stream(source, chunk_size, encoding)
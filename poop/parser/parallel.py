@@ -0,0 +1,197 @@
+#!/usr/bin/env python3.4
+# coding: utf-8
+
+"""
+Defines parallel parsing: a source is split at top-level statement boundaries
+and its chunks are lexed and parsed in separate processes.
+"""
+
+__all__ = ['split_points', 'parse_parallel', 'parse_file_parallel']
+
+import re
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from poop.parser.parser import Parser
+from poop.parser.lexer import TokenType, TokenStream
+from poop.parser.ast import Program, Stmt
+from poop.parser.types import LineIndex
+from poop.parser.serialize import dump_ast, load_ast
+
+
+# sources shorter than this are parsed in the current process
+MIN_CHUNK_SIZE = 1 << 16
+
+# number of chunks per worker, to balance the load between workers
+CHUNKS_PER_WORKER = 4
+
+# what the pre-scan looks at: strings, characters and comments, which are
+# skipped, and the keywords opening and closing blocks at the start of a line
+_SCAN_REGEX = re.compile(
+	r'(?P<quote>["\'])|(?P<comment>/\*)|(?P<line_comment>//)'
+	r'|^[ \t]*(?:(?P<open>{}|{})|(?P<close>{}))'.format(
+		TokenType.IF.regex.pattern,
+		TokenType.CONSTIPATED_WHILE.regex.pattern,
+		TokenType.SPLOSH.regex.pattern),
+	re.MULTILINE
+)
+
+_QUOTED = {
+	'"': TokenType.STRING_LITERAL.regex,
+	"'": TokenType.CHAR_LITERAL.regex,
+}
+
+
+def _next_line_start(code, offset):
+	"""
+	Returns the offset of the first non-blank line starting at or after
+	`offset`, or -1 if there is none.
+	"""
+
+	if offset > 0 and code[offset - 1] != '\n':
+		offset = code.find('\n', offset)
+
+		if offset == -1:
+			return -1
+
+		offset += 1
+
+	# blank lines would start the chunk with a newline token
+	while offset < len(code) and code[offset] in '\r\n':
+		offset += 1
+
+	return offset if offset < len(code) else -1
+
+
+def split_points(code, count):
+	"""
+	Returns at most `count - 1` offsets splitting the source into chunks of
+	similar sizes made of complete top-level statements.
+
+	The offsets are starts of lines at block nesting depth 0, outside of
+	strings and comments; the pre-scan only looks at these and at the block
+	keywords starting a line.
+	"""
+
+	targets = [len(code) * i // count for i in range(count - 1, 0, -1)]
+	points = []
+	depth = 0
+
+	# the source is plain code from `pos` to the next match
+	pos = 0
+
+	while targets:
+		match = _SCAN_REGEX.search(code, pos)
+		event = len(code) if match is None else match.start()
+
+		# splits the plain code before the match at the next targets
+		while depth == 0 and targets and targets[-1] < event:
+			split = _next_line_start(code, max(targets[-1], pos, 1))
+
+			if split == -1 or split > event:
+				break
+
+			if not points or split > points[-1]:
+				points.append(split)
+
+			targets.pop()
+
+		if match is None:
+			break
+
+		kind = match.lastgroup
+
+		if kind == 'quote':
+			literal = _QUOTED[match.group(kind)].match(code, event)
+			pos = event + 1 if literal is None else literal.end()
+		elif kind == 'comment':
+			end = code.find('*/', match.end())
+			pos = len(code) if end == -1 else end + len('*/')
+		elif kind == 'line_comment':
+			end = code.find('\n', match.end())
+			pos = len(code) if end == -1 else end
+		else:
+			depth += 1 if kind == 'open' else -1
+			depth = max(depth, 0)
+			pos = match.end()
+
+	return points
+
+
+def _parse_chunk(chunk):
+	"""
+	Parses the statements of a chunk of a source, the first one starting with
+	the program header. Returns them serialized by `dump_ast`, which is much
+	cheaper to send back than the nodes, or None if the chunk does not parse
+	entirely.
+	"""
+
+	code, first_line, path, header = chunk
+	tokens = TokenStream.from_code(code, lines=LineIndex(code, first_line))
+	parser = Parser(code, path, tokens=tokens)
+
+	if header and (
+			parser.accept(TokenType.UNZIP_PANTS) is None or
+			parser.accept(TokenType.NEWLINE) is None):
+		return None
+
+	stmts = parser.many(Stmt)
+
+	if not parser.at_end():
+		return None
+
+	return dump_ast(stmts)
+
+
+def parse_parallel(code, path=None, workers=None):
+	"""
+	Parses a source into a Program, lexing and parsing chunks of it in
+	`workers` processes (the number of CPUs by default).
+
+	Falls back to parsing the whole source in the current process when it is
+	too short to be split, or when a chunk does not parse, so that errors are
+	reported exactly as by `Parser.run`.
+	"""
+
+	if workers is None:
+		workers = os.cpu_count() or 1
+
+	count = min(workers * CHUNKS_PER_WORKER, len(code) // MIN_CHUNK_SIZE)
+	points = split_points(code, count) if count > 1 else []
+
+	if not points:
+		return Parser(code, path).run()
+
+	lines = LineIndex(code)
+	bounds = [0] + points + [len(code)]
+	chunks = [
+		(code[start:end], lines.locate(start)[0], path, start == 0)
+		for start, end in zip(bounds, bounds[1:])
+	]
+
+	with ProcessPoolExecutor(workers) as executor:
+		results = list(executor.map(_parse_chunk, chunks))
+
+	if any(data is None for data in results):
+		return Parser(code, path).run()
+
+	instrs = []
+
+	for start, data in zip(bounds, results):
+		instrs.extend(load_ast(data, code, lines, start))
+
+	if not instrs:
+		return Parser(code, path).run()
+
+	program = Program(instrs, path)
+	program.set_span(instrs[0], instrs[-1])
+	return program
+
+
+def parse_file_parallel(path, workers=None):
+	"""
+	Parses the file at `path` with `parse_parallel`.
+	"""
+
+	with open(path) as file:
+		return parse_parallel(file.read(), path, workers)
@@ -5,54 +5,486 @@
 Declares the Parser class, which can transform a code string into an AST.
 """
 
+import codecs
+import inspect
 import functools
-from collections import defaultdict
+import threading
+from types import MappingProxyType
 
 from poop.parser.ast import *
-from poop.parser.lexer import TokenType, tokenize
-from poop.parser.types import SourcePos
+from poop.parser.lexer import TokenType, TokenStream, CHUNK_SIZE
+from poop.parser.types import SourcePos, LineIndex
 from poop.exception import ParseError
+from poop.registry import Registry
 
 
 # todo: refactor consume_stmt and consume_expr, register_stmt and register_expr
 
+class TokenQueue:
+    """
+    View of the tokens remaining after the cursor of a parser, supporting the
+    list operations consumers used on the former token queue. Popping the
+    first token advances the cursor.
+    """
+
+    def __init__(self, parser):
+        self.parser = parser
+
+    def __len__(self):
+        return len(self.parser.tokens) - self.parser.index
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+
+        if not 0 <= index < len(self):
+            raise IndexError('token queue index out of range')
+
+        return self.parser.tokens[self.parser.index + index]
+
+    def pop(self, index=0):
+        if index != 0:
+            raise ValueError('only the first token can be popped')
+
+        token = self[0]
+        self.parser.index += 1
+        return token
+
+
+class _ProbeStream(TokenStream):
+    """
+    Token stream holding a single token of a given type, or none, which
+    records whether its token was consumed. Used to infer FIRST sets.
+    """
+
+    def __init__(self, token_type):
+        super().__init__('')
+        self.consumed = False
+
+        if token_type is not None:
+            self.kinds.append(list(TokenType).index(token_type))
+            self.starts.append(0)
+            self.ends.append(0)
+
+    def __getitem__(self, index):
+        self.consumed = True
+        return super().__getitem__(index)
+
+
+class _Frame:
+    """
+    Consumption of a node type in progress: the consumers left to try, and the
+    running generator consumer, if any. `key` is the memo key of the node type
+    and cursor position in packrat mode.
+    """
+
+    __slots__ = ('key', 'consumers', 'position', 'running')
+
+    def __init__(self, key, consumers):
+        self.key = key
+        self.consumers = consumers
+        self.position = 0
+        self.running = None
+
+
+def make_consumer(consumer, priority=1, first=None):
+    """
+    Wraps a consumer function so that it restores the cursor when it fails,
+    and records its failures. See `Parser.register` for the arguments.
+    """
+
+    is_generator = inspect.isgeneratorfunction(consumer)
+
+    if is_generator:
+        @functools.wraps(consumer)
+        def _consumer_wrapper(self):
+            # saves the cursor
+            start = self.index
+
+            try:
+                node = yield from consumer(self)
+            except (ParseError, IndexError) as err:
+                node = self._consumer_error(err)
+
+            if node is None:
+                # restore previous cursor value
+                self.index = start
+
+            return node
+    else:
+        @functools.wraps(consumer)
+        def _consumer_wrapper(self):
+            # saves the cursor
+            start = self.index
+
+            try:
+                node = consumer(self)
+            except (ParseError, IndexError) as err:
+                node = self._consumer_error(err)
+
+            if node is None:
+                # restore previous cursor value
+                self.index = start
+
+            return node
+
+    _consumer_wrapper.is_generator = is_generator
+    # decrement because highest priority is 1, not 0
+    _consumer_wrapper.priority = priority - 1
+    _consumer_wrapper.first = None if first is None else frozenset(first)
+    return _consumer_wrapper
+
+
+class Grammar:
+    """
+    Immutable set of consumers by node type, with the tables dispatching
+    them, which are all computed when the grammar is created. A grammar can
+    be shared by parsers running in several threads.
+
+    `consumers` maps node types to consumers wrapped by `make_consumer`.
+    """
+
+    def __init__(self, consumers):
+        self.consumers = MappingProxyType(
+            {node_type: tuple(cons) for node_type, cons in consumers.items()})
+
+        # the node types that can be consumed: the registered ones, and the
+        # node types they derive from
+        node_types = set(Node.sub_types())
+        node_types.add(Node)
+
+        for node_type in self.consumers:
+            node_types.update(
+                base for base in node_type.__mro__ if issubclass(base, Node))
+
+        # node type -> consumers sorted by priority
+        self.consumer_queues = MappingProxyType({
+            node_type: self._sort_consumers(node_type)
+            for node_type in node_types
+        })
+
+        # consumer -> set of the token types it can start with, or None
+        self.firsts = MappingProxyType({
+            consumer: self.infer_first(consumer)
+            if consumer.first is None else consumer.first
+            for queue in self.consumer_queues.values()
+            for consumer in queue
+        })
+
+        # node type -> (consumers sorted by priority, {token type: consumers})
+        self.dispatch_tables = MappingProxyType({
+            node_type: (queue, self._dispatch(queue))
+            for node_type, queue in self.consumer_queues.items()
+        })
+
+    def extended(self, node_type, consumer, priority=1, first=None):
+        """
+        Returns a new grammar, with a consumer of `node_type` added. See
+        `Parser.register` for the arguments.
+        """
+
+        consumers = dict(self.consumers)
+        consumers[node_type] = consumers.get(node_type, ()) + (
+            make_consumer(consumer, priority, first),)
+        return Grammar(consumers)
+
+    def _sort_consumers(self, node_type):
+        """
+        Returns the consumers of a node type and of its subtypes, sorted by
+        priority.
+        """
+
+        consumers = list(self.consumers.get(node_type, ()))
+
+        # reverse MRO: walks down the subclass tree
+        for sub_node_type in node_type.sub_types():
+            consumers.extend(self.consumers.get(sub_node_type, ()))
+
+        # sort the list by priority
+        consumers.sort(key=lambda cons: cons.priority)
+        return tuple(consumers)
+
+    def _dispatch(self, consumers):
+        """
+        Maps each token type, or None for the end of the input, to the given
+        consumers which can start with it.
+        """
+
+        return MappingProxyType({
+            token_type: tuple(
+                consumer for consumer in consumers
+                if self.firsts[consumer] is None or
+                token_type in self.firsts[consumer]
+            )
+            for token_type in [None] + list(TokenType)
+        })
+
+    def infer_first(self, consumer):
+        """
+        Infers the set of token types a consumer can start with, by running it
+        on every single-token input and watching whether it consumes the
+        token. Returns None if the consumer may succeed without consuming
+        anything, in which case it must always be tried.
+        """
+
+        probe = Parser('', grammar=self)
+        probe.lookahead = False
+
+        first = set()
+
+        for token_type in [None] + list(TokenType):
+            probe.tokens = _ProbeStream(token_type)
+            probe.index = 0
+
+            try:
+                node = probe.run_consumer(consumer)
+            except Exception:
+                node = None
+
+            if node is not None and probe.index == 0:
+                return None
+
+            if probe.tokens.consumed:
+                first.add(token_type)
+
+        return frozenset(first)
+
+    def get_consumer_queue(self, node_type):
+        """
+        Returns the consumers of a node type sorted by priority.
+        """
+
+        try:
+            return self.consumer_queues[node_type]
+        except KeyError:
+            return ()
+
+    def get_dispatch_table(self, node_type):
+        """
+        Returns the consumers of a node type sorted by priority, and a dict
+        mapping each token type, or None for the end of the input, to those
+        of these consumers which can start with it.
+        """
+
+        try:
+            return self.dispatch_tables[node_type]
+        except KeyError:
+            return (), _NO_DISPATCH
+
+
+# dispatch table of the node types without consumers
+_NO_DISPATCH = MappingProxyType(
+    {token_type: () for token_type in [None] + list(TokenType)})
+
+# serializes the creation of the default grammar
+_default_grammar_lock = threading.Lock()
+
+
 class Parser:
     """
     Registers some consumers to parse the AST.
+
+    The parser reads an immutable TokenStream through an integer cursor,
+    `index`, so that backtracking only restores the cursor.
+
+    Consumers are dispatched on the type of the next token: each consumer is
+    only tried if that token type is in its FIRST set.
+
+    Packrat mode is off by default, and must be enabled with `packrat`. In
+    this mode, the result of consuming a node type at a given cursor position
+    is memoized for the duration of a parse, so that no token range is parsed
+    twice as the same node type. The grammar of poop hardly backtracks since
+    expressions are parsed by precedence and consumers dispatched on the next
+    token, so the memo only pays off for grammars extended with consumers
+    which backtrack over the same nodes; `memo_stats` tells whether it does.
+
+    Inside a parse, failures do not raise: `accept` and `try_consume` return
+    None, consumers return None to fail, and only the furthest failure is
+    recorded. A single ParseError is built from it when the parse fails.
+
+    Generator consumers yield the node types they consume instead of calling
+    `try_consume`. They are run on an explicit stack of frames, so that the
+    nesting depth of the parsed code does not grow the Python stack.
+
+    Consumers are read from an immutable Grammar, that of the registered
+    consumers by default, so that parsers can run in several threads at once.
     """
 
-    consumers = defaultdict(list)
+    # node type -> registered consumers, frozen by the first parser created
+    consumers = Registry('parser consumers', multiple=True)
 
-    def __init__(self, code, path=None):
+    # grammar of the registered consumers, used by default
+    _default_grammar = None
+
+    def __init__(self, code, path=None, packrat=False, tokens=None,
+                 grammar=None, interner=None):
         self.path = path
         self.code = code
-        self.token_queue = list(tokenize(self.code))  # the tokenized string
 
-        if self.token_queue:
-            self.end_pos = self.token_queue[-1].pos
+        # NodeInterner sharing the expressions of the parsed program, if any,
+        # and the statements it interned, with the locations of their
+        # expressions
+        self.interner = interner
+        self.interned = {}
+
+        # the consumers and dispatch tables, shared by parsers in any thread
+        if grammar is None:
+            grammar = self.default_grammar()
+
+        self.grammar = grammar
+
+        # the tokenized string, unless tokens of the code are given
+        if tokens is None:
+            tokens = TokenStream.from_code(self.code)
+
+        self.tokens = tokens
+        self.index = 0
+
+        # only tries the consumers that can start with the next token
+        self.lookahead = True
+
+        # (node_type, start index) -> (node or None, end index)
+        self.packrat = packrat
+        self.memo = {}
+        self.memo_hits = self.memo_misses = 0
+
+        if self.tokens:
+            self.end_pos = self.tokens.pos(len(self.tokens) - 1)
         else:
             self.end_pos = SourcePos(1, 1)
 
+        # furthest failure: token index, message and ParseError, if a consumer
+        # raised one
+        self.failure_index = -1
+        self.failure_msg = None
         self.error = None
 
+    @property
+    def token_queue(self):
+        """
+        The tokens remaining after the cursor.
+        """
+
+        return TokenQueue(self)
+
     @classmethod
-    def from_file(cls, path):
-        with open(path) as file:
-            code = file.read()
-            return cls(code, path)
+    def from_file(cls, path, packrat=False):
+        """
+        Creates a parser of the file at `path`, tokenized from a memory map.
+        """
+
+        tokens = TokenStream.from_file(path)
+        return cls(tokens.code, path, packrat, tokens=tokens)
 
     @classmethod
-    def from_string(cls, code, path=None):
+    def from_string(cls, code, path=None, packrat=False):
         """
         Parses the given code, without needing to instantiate a Parser object.
         """
 
-        parser = cls(code, path)
+        parser = cls(code, path, packrat)
         ast = parser.run()
         return ast
 
     @classmethod
-    def register(cls, node_type, priority=1):
+    def parse_stream(cls, stream, path=None, chunk_size=CHUNK_SIZE,
+                     encoding='utf-8'):
+        """
+        Parses a program read from a text or binary stream, and yields its
+        top-level statements one at a time, as soon as they are complete.
+
+        Only the source of the statement being parsed is kept in memory. When
+        a statement is longer than the source read so far, the amount read
+        next is doubled, so that parsing it again stays linear.
+
+        When the stream has no more input available, as on a pipe waiting for
+        the next line, the statements ended by the last newline read are
+        yielded without waiting for more source; the span of such a statement
+        does not include the blank lines which may follow it.
+        """
+
+        # buffered binary streams return what is available without waiting
+        # for a whole chunk, e.g. on pipes
+        read = getattr(stream, 'read1', stream.read)
+        decoder = codecs.getincrementaldecoder(encoding)()
+
+        # the unparsed source, which starts at the beginning of a line
+        source, first_line = '', 1
+        header = True
+        final = False
+
+        # whether the source follows the newline ending a statement parsed
+        # early, which the newlines starting the source continue
+        continued = False
+
+        while not final:
+            size = max(chunk_size, len(source))
+            chunk = read(size)
+            final = not chunk
+
+            # a short read, ending a line, may be all the input there is until
+            # the statements it ends have run
+            early = not final and len(chunk) < size
+
+            if isinstance(chunk, bytes):
+                chunk = decoder.decode(chunk, final)
+
+            source += chunk
+            lines = LineIndex(source, first_line)
+            tokens = None
+
+            if early and source.endswith('\n'):
+                try:
+                    tokens = TokenStream.from_code(source, lines=lines)
+                except ParseError:
+                    # strings and comments which more source may end
+                    pass
+
+            early = tokens is not None
+
+            if not early:
+                tokens = TokenStream.from_code(source, lines=lines,
+                                               final=final)
+
+            parser = cls(source, path, tokens=tokens)
+
+            # number of tokens of the parsed statements
+            consumed = 0
+
+            if continued and tokens and tokens.starts[0] == 0:
+                if parser.accept(TokenType.NEWLINE) is not None:
+                    consumed = parser.index
+
+            if header:
+                if parser.accept(TokenType.UNZIP_PANTS) is not None and \
+                        parser.accept(TokenType.NEWLINE) is not None:
+                    header = False
+                    consumed = parser.index
+
+            if not header:
+                while not parser.at_end():
+                    stmt = parser.try_consume(Stmt)
+
+                    if stmt is None:
+                        break
+
+                    consumed = parser.index
+                    yield stmt
+
+            # fails unless the next statement may be completed by more source
+            if header or not parser.at_end():
+                if final or parser.failure_index < len(tokens):
+                    raise parser.failure_error()
+
+            # drops the parsed statements; their last token is a newline
+            if consumed:
+                cut = tokens.ends[consumed - 1]
+                continued = early and cut == len(source)
+                first_line += source.count('\n', 0, cut)
+                source = source[cut:]
+
+    @classmethod
+    def register(cls, node_type, priority=1, first=None):
         """
         Registers a given consumer function with a priority. `priority` is an
         integer defining the order in which expression types try to parse from
@@ -60,45 +492,61 @@ class Parser:
         its priority.
 
         `priority` must be greater than one (not strictly).
+
+        `first` is the set of token types the consumer can start with. The
+        consumer is only tried when the next token is of one of these types.
+        When omitted, the set is inferred with `Grammar.infer_first`.
+
+        A consumer fails by returning None, or by raising a ParseError. It can
+        be a generator function yielding the node types it consumes, which
+        receives the consumed nodes, or None on failure, in return.
         """
 
         def _decorator_wrapper(consumer):
-            @functools.wraps(consumer)
-            def _consumer_wrapper(self):
-                # copies the token list
-                tmp_queue = self.token_queue[:]
+            cls.consumers.add(node_type, make_consumer(consumer, priority, first))
 
-                try:
-                    node = consumer(self)
+        return _decorator_wrapper
 
-                    if node is None:
-                        raise ParseError(self.code, pos, 'Consumer returned None')
+    @classmethod
+    def default_grammar(cls):
+        """
+        Returns the grammar of the registered consumers. The registry is
+        frozen the first time: consumers cannot be registered afterwards.
+        """
 
-                except ParseError:
-                    # restore previous token list value
-                    # assign tmp_queue to reference token_queue
-                    self.token_queue[:] = tmp_queue
-
-                    raise
-                except IndexError:
-                    # assign tmp_queue to reference token_queue
-                    self.token_queue[:] = tmp_queue
-
-                    # when the user tries to call token_queue.pop(0) but all
-                    # tokens were consumed
-                    raise ParseError(
-                        self.code,
-                        self.end_pos,
-                        'Unexpected EOF') from None
-                else:
-                    return node
+        grammar = Parser._default_grammar
 
-            # decrement because highest priority is 1, not 0
-            _consumer_wrapper.priority = priority - 1
-            cls.consumers[node_type].append(_consumer_wrapper)
+        if grammar is None:
+            with _default_grammar_lock:
+                if Parser._default_grammar is None:
+                    Parser._default_grammar = Grammar(cls.consumers.freeze())
 
-        return _decorator_wrapper
+                grammar = Parser._default_grammar
+
+        return grammar
+
+    def _consumer_error(self, err):
+        """
+        Records the failure of a consumer which raised `err`, and returns None.
+        """
+
+        if isinstance(err, ParseError):
+            self.fail(err.msg, self.index, err)
+        else:
+            # when the user tries to call token_queue.pop(0) but all tokens
+            # were consumed
+            self.fail('Unexpected EOF', len(self.tokens))
 
+        return None
+
+    def get_dispatch_table(self, node_type):
+        """
+        Returns the consumers of a node type sorted by priority, and a dict
+        mapping each token type, or None for the end of the input, to those
+        of these consumers which can start with it.
+        """
+
+        return self.grammar.get_dispatch_table(node_type)
 
     def get_consumer_queue(self, node_type):
         """
@@ -106,37 +554,188 @@ class Parser:
         into account the priorities.
         """
 
-        consumers = list(self.consumers[node_type])
+        return self.grammar.get_consumer_queue(node_type)
 
-        # reverse MRO: walks down the subclass tree
-        for sub_node_type in node_type.sub_types():
-            consumers.extend(self.consumers[sub_node_type])
+    def get_candidates(self, node_type):
+        """
+        Returns the consumers of a node type that may succeed on the next
+        token, sorted by priority. Records a failure if there are none.
+        """
 
-        # sort the list by priority
-        consumers.sort(key=lambda cons: cons.priority)
+        if not self.lookahead:
+            return self.get_consumer_queue(node_type)
+
+        _, by_token = self.get_dispatch_table(node_type)
+        token_type = self.peek()
+        consumers = by_token[token_type]
+
+        if not consumers and self.index >= self.failure_index:
+            if token_type is None:
+                self.fail('Unexpected EOF')
+            else:
+                self.fail('Expected {}, got {}'.format(
+                    node_type.__name__, token_type.name))
 
         return consumers
 
+    def fail(self, msg, index=None, error=None):
+        """
+        Records a failure at a token index, the cursor by default. Only the
+        furthest failure is kept; `error` is the ParseError raised by a
+        consumer, if any.
+        """
+
+        if index is None:
+            index = self.index
+
+        if index >= self.failure_index:
+            self.failure_index = index
+            self.failure_msg = msg
+            self.error = error
+
+    def failure_error(self):
+        """
+        Builds the ParseError of the furthest recorded failure.
+        """
+
+        if self.error is not None:
+            return self.error
+
+        if self.failure_index < 0:
+            return ParseError(self.code, self.current_pos(), 'Failed to parse')
+
+        if self.failure_index < len(self.tokens):
+            pos = self.tokens.pos(self.failure_index)
+        else:
+            pos = self.end_pos
+
+        return ParseError(self.code, pos, self.failure_msg)
+
+    def memo_stats(self):
+        """
+        Returns the number of memo hits and misses in packrat mode, and the
+        resulting hit rate.
+        """
+
+        lookups = self.memo_hits + self.memo_misses
+        return {
+            'hits': self.memo_hits,
+            'misses': self.memo_misses,
+            'hit_rate': self.memo_hits / lookups if lookups else 0.0,
+        }
+
     def consume(self, node_type):
         """
         Tries to consume a node of type `node_type` from the token list.
-        This does not affect the list if the function failed to parse.
+        This does not affect the list if the function failed to parse, in which
+        case the ParseError of the furthest failure is raised.
         """
 
-        consumers = self.get_consumer_queue(node_type)
+        node = self.try_consume(node_type)
+
+        if node is None:
+            raise self.failure_error()
+
+        return node
+
+    def try_consume(self, node_type):
+        """
+        Tries to consume a node of type `node_type` from the token list.
+        Returns None if the function failed to parse, without affecting the
+        list.
+        """
+
+        return self._run(node_type, [])
+
+    def run_consumer(self, consumer):
+        """
+        Runs a single consumer at the cursor, and returns its node or None.
+        """
+
+        return self._run(None, [_Frame(None, [consumer])])
+
+    def _run(self, request, frames):
+        """
+        Runs consumers on a stack of frames until the bottom one is done, then
+        returns its node. `request` is a node type to consume on top of the
+        stack, if any.
+
+        Each frame tries the consumers of a node type in turn. A generator
+        consumer yielding a node type pushes a frame consuming it; the frame
+        is popped when one of its consumers succeeds or all of them failed,
+        and its node, or None, is sent to the consumer below.
+        """
+
+        # the node sent to the running consumer of the top frame
+        node = None
+        interner = self.interner
+
+        while True:
+            if request is not None:
+                key = None
+
+                if self.packrat:
+                    key = (request, self.index)
+                    memoized = self.memo.get(key)
+
+                    if memoized is not None:
+                        self.memo_hits += 1
+                        node, self.index = memoized
+                        request = None
+
+                        if not frames:
+                            return node
+
+                        continue
+
+                    self.memo_misses += 1
+
+                frames.append(_Frame(key, self.get_candidates(request)))
+                request = None
+
+            frame = frames[-1]
+
+            if frame.running is not None:
+                try:
+                    request = frame.running.send(node)
+                except StopIteration as stop:
+                    frame.running = None
+                    node = stop.value
+                else:
+                    continue
+            elif frame.position < len(frame.consumers):
+                consumer = frame.consumers[frame.position]
+                frame.position += 1
+
+                if consumer.is_generator:
+                    frame.running = consumer(self)
+                    node = None
+                    continue
 
-        # tries every concrete nodes of type node_type
-        for consumer in consumers:
-            try:
                 node = consumer(self)
-            except ParseError as e:
-                error = e
-                continue
             else:
+                # no consumer can start with the next token
+                node = None
+
+            if node is None and frame.position < len(frame.consumers):
+                # tries the next consumer
+                continue
+
+            # a consumer succeeded, or none did
+
+            frames.pop()
+
+            # statements are interned once complete, so that the expressions
+            # of a single statement at most are held before being shared
+            if interner is not None and isinstance(node, Stmt) and \
+                    node not in self.interned:
+                self.interned[node] = interner.intern_stmt(node)
+
+            if frame.key is not None:
+                self.memo[frame.key] = (node, self.index)
+
+            if not frames:
                 return node
-        else:
-            # when every node has been tried, but none succeeded to parse
-            raise error
 
     def parse(self, node_type):
         """
@@ -145,31 +744,105 @@ class Parser:
         Fails if the entire token list is not matched.
         """
 
-        consumers = self.get_consumer_queue(node_type)
+        # memoized results and failures only hold for a single parse
+        self.memo.clear()
+        self.memo_hits = self.memo_misses = 0
+        self.failure_index, self.failure_msg, self.error = -1, None, None
+
+        start = self.index
 
         # tries every concrete nodes of type node_type
-        for consumer in consumers:
-            try:
-                tmp_queue = self.token_queue[:]
-                node = consumer(self)
+        for consumer in self.get_candidates(node_type):
+            node = self.run_consumer(consumer)
 
-                # raises a ParseError if tokens are remaining unconsumed
-                if self.token_queue:
-                    err = ParseError(
-                        self.code,
-                        self.token_queue[0].pos,
-                        'The entire code could not be consumed.')
-                    self.token_queue[:] = tmp_queue
-                    raise err
-
-            except ParseError as e:
-                error = e
+            if node is None:
                 continue
-            else:
+
+            # fails if tokens are remaining unconsumed
+            if self.at_end():
                 return node
-        else:
-            # when every node has been tried, but none succeeded to parse
-            raise error
+
+            self.fail('The entire code could not be consumed.')
+            self.index = start
+
+        # when every node has been tried, but none succeeded to parse
+        raise self.failure_error()
+
+    def mark(self):
+        """
+        Returns the cursor position, to be restored with `reset`.
+        """
+
+        return self.index
+
+    def reset(self, mark):
+        """
+        Moves the cursor back to a position returned by `mark`.
+        """
+
+        self.index = mark
+
+    def at_end(self):
+        """
+        Returns True if every token has been consumed.
+        """
+
+        return self.index >= len(self.tokens)
+
+    def peek(self):
+        """
+        Returns the type of the next token, or None if every token has been
+        consumed.
+        """
+
+        if self.index < len(self.tokens):
+            return self.tokens.type(self.index)
+
+    def current_pos(self):
+        """
+        Returns the source position of the next token.
+        """
+
+        if self.index < len(self.tokens):
+            return self.tokens.pos(self.index)
+
+        return self.end_pos
+
+    def advance(self):
+        """
+        Consumes the next token, whatever its type, and returns it.
+        """
+
+        if self.index >= len(self.tokens):
+            raise ParseError(self.code, self.end_pos, 'Unexpected EOF')
+
+        token = self.tokens[self.index]
+        self.index += 1
+        return token
+
+    def accept(self, token_type):
+        """
+        Tries to consume a single token from the token queue.
+        Returns the token if the next token is of the given type, records a
+        failure and returns None otherwise.
+        """
+
+        index = self.index
+
+        if index >= len(self.tokens):
+            self.fail('Unexpected EOF')
+            return None
+
+        if self.tokens.type(index) != token_type:
+            # skips formatting the message of failures that are not kept
+            if index >= self.failure_index:
+                self.fail('Expected {}, got {}'.format(
+                    token_type.name, self.tokens.type(index).name))
+
+            return None
+
+        self.index += 1
+        return self.tokens[index]
 
     def expect(self, token_type):
         """
@@ -178,14 +851,19 @@ class Parser:
         ParseError otherwise.
         """
 
-        token = self.token_queue.pop(0)
+        index = self.index
+
+        if index >= len(self.tokens):
+            raise ParseError(self.code, self.end_pos, 'Unexpected EOF')
 
         # if the next token is not of the expected type
-        if token.type != token_type:
-            msg = 'Expected {}, got {}'.format(token_type.name, token.type.name)
-            raise ParseError(self.code, token.pos, msg)
+        if self.tokens.type(index) != token_type:
+            msg = 'Expected {}, got {}'.format(
+                token_type.name, self.tokens.type(index).name)
+            raise ParseError(self.code, self.tokens.pos(index), msg)
 
-        return token
+        self.index += 1
+        return self.tokens[index]
 
     def many(self, node_type):
         """
@@ -195,12 +873,12 @@ class Parser:
         consumed = []
 
         while True:
-            try:
-                nxt = self.consume(node_type)
-            except ParseError:
+            nxt = self.try_consume(node_type)
+
+            if nxt is None:
                 break
-            else:
-                consumed.append(nxt)
+
+            consumed.append(nxt)
 
         return consumed
 
@@ -209,30 +887,43 @@ class Parser:
         Consumes zero or more occurences of a node separated by a token.
         """
 
-        consumed = []
+        first = self.try_consume(node_type)
 
-        try:
-            first = self.consume(node_type)
-        except ParseError:
+        if first is None:
             return []
-        else:
-            consumed.append(first)
+
+        consumed = [first]
 
         while True:
-            try:
-                self.expect(sep)
-                nxt = self.consume(node_type)
-            except ParseError:
+            start = self.index
+
+            if self.accept(sep) is None:
+                break
+
+            nxt = self.try_consume(node_type)
+
+            if nxt is None:
+                # leaves the separator unconsumed
+                self.index = start
                 break
-            else:
-                consumed.append(nxt)
+
+            consumed.append(nxt)
 
         return consumed
 
     def run(self):
         """
         Parses a given string into a Program object.
+
+        With an interner, the expressions of each statement are interned as
+        soon as the statement is parsed, and their locations are stored in the
+        `spans` array of the program.
         """
 
         program = self.parse(Program)
+
+        if self.interner is not None:
+            self.interner.intern_program(program, self.interned)
+            self.interned.clear()
+
         return program
@@ -0,0 +1,375 @@
+#!/usr/bin/env python3.4
+# coding: utf-8
+
+"""
+Defines a compact binary serialization of ASTs, and a cache of the ASTs of
+sources, keyed by a hash of the source, from which a program can be loaded
+instead of being parsed again.
+
+A serialized AST is a header, a table of the strings it uses, and its nodes
+in postorder. Each item is a tag byte followed by its operands, which are
+varints: a node has the index of its class name in the string table and its
+location, and takes the values of its fields from the preceding items.
+"""
+
+__all__ = ['dump_ast', 'load_ast', 'ASTCache']
+
+import os
+import struct
+import hashlib
+import tempfile
+
+from poop.parser.parser import Parser
+from poop.parser.ast import Node, Program
+from poop.parser.types import LineIndex
+
+
+MAGIC = b'PAST'
+
+# bumped when the format or the AST classes change
+FORMAT_VERSION = 1
+
+# item tags
+_NONE, _TRUE, _FALSE, _INT, _FLOAT, _STR, _LIST, _TUPLE, _NODE = range(9)
+
+_FLOAT_STRUCT = struct.Struct('<d')
+
+def _node_fields(node_type):
+    """
+    Returns the attributes of a node class which are serialized: its slots,
+    except for the location, and for the locations of the interned
+    expressions of a program.
+    """
+
+    fields = []
+
+    for base in reversed(node_type.__mro__):
+        if base is not Node and issubclass(base, Node):
+            fields.extend(base.__dict__.get('__slots__', ()))
+
+    if node_type is Program:
+        fields.remove('spans')
+
+    return tuple(fields)
+
+
+# node class name -> (node class, serialized attributes)
+_NODE_CLASSES = {
+    node_type.__name__: (node_type, _node_fields(node_type))
+    for node_type in Node.sub_types()
+}
+
+
+def _write_varint(out, value):
+    """
+    Appends an unsigned integer to a bytearray, 7 bits per byte.
+    """
+
+    while value >= 0x80:
+        out.append(value & 0x7f | 0x80)
+        value >>= 7
+
+    out.append(value)
+
+
+def dump_ast(node):
+    """
+    Serializes an AST, usually a Program, to bytes.
+    """
+
+    out = bytearray()
+    strings = {}
+
+    def string_index(string):
+        try:
+            return strings[string]
+        except KeyError:
+            strings[string] = len(strings)
+            return strings[string]
+
+    # (item, whether its children are serialized)
+    stack = [(node, False)]
+
+    while stack:
+        item, done = stack.pop()
+
+        if isinstance(item, Node):
+            node_type = type(item)
+
+            if not done:
+                stack.append((item, True))
+                stack.extend(
+                    (getattr(item, field), False)
+                    for field in reversed(_NODE_CLASSES[node_type.__name__][1]))
+                continue
+
+            out.append(_NODE)
+            _write_varint(out, string_index(node_type.__name__))
+
+            # no location is written as 0, offsets are shifted by one; nodes
+            # kept by a reparse are moved to the current source
+            if item.start is None:
+                out.append(0)
+            else:
+                _write_varint(out, item.lines.absolute(item.start) + 1)
+                _write_varint(out, item.end - item.start)
+        elif isinstance(item, (list, tuple)):
+            if not done:
+                stack.append((item, True))
+                stack.extend((child, False) for child in reversed(item))
+                continue
+
+            out.append(_LIST if isinstance(item, list) else _TUPLE)
+            _write_varint(out, len(item))
+        elif item is None:
+            out.append(_NONE)
+        elif item is True or item is False:
+            out.append(_TRUE if item else _FALSE)
+        elif isinstance(item, int):
+            # zigzag encoding of signed integers
+            out.append(_INT)
+            _write_varint(out, item * 2 if item >= 0 else -item * 2 - 1)
+        elif isinstance(item, float):
+            out.append(_FLOAT)
+            out += _FLOAT_STRUCT.pack(item)
+        elif isinstance(item, str):
+            out.append(_STR)
+            _write_varint(out, string_index(item))
+        else:
+            raise TypeError('cannot serialize {!r}'.format(item))
+
+    header = bytearray(MAGIC)
+    _write_varint(header, FORMAT_VERSION)
+    _write_varint(header, len(strings))
+
+    for string in strings:
+        encoded = string.encode('utf-8', 'surrogatepass')
+        _write_varint(header, len(encoded))
+        header += encoded
+
+    return bytes(header + out)
+
+
+def load_ast(data, code, lines=None, base=0):
+    """
+    Deserializes an AST serialized by `dump_ast`. `code` is the source the
+    AST was parsed from, in which its nodes are located, and `lines` its line
+    index if it is already built. The offsets of the nodes are shifted by
+    `base`, for ASTs of a part of the source.
+
+    Raises a ValueError if the data is not a valid serialized AST.
+    """
+
+    if lines is None:
+        lines = LineIndex(code)
+
+    try:
+        node = _load(data, lines, base)
+    except (IndexError, TypeError, UnicodeDecodeError, struct.error) as err:
+        raise ValueError('invalid serialized AST') from err
+
+    # the loaded expressions are not interned
+    if isinstance(node, Program):
+        node.spans = None
+
+    return node
+
+
+def _read_varint(data, index):
+    """
+    Reads an unsigned integer at an index of bytes. Returns it with the index
+    following it.
+    """
+
+    value = shift = 0
+
+    while True:
+        byte = data[index]
+        index += 1
+        value |= (byte & 0x7f) << shift
+
+        if byte < 0x80:
+            return value, index
+
+        shift += 7
+
+
+def _load(data, lines, base):
+    if data[:len(MAGIC)] != MAGIC:
+        raise ValueError('invalid serialized AST')
+
+    version, index = _read_varint(data, len(MAGIC))
+
+    if version != FORMAT_VERSION:
+        raise ValueError('unsupported serialized AST version')
+
+    count, index = _read_varint(data, index)
+    strings = []
+
+    for _ in range(count):
+        length, index = _read_varint(data, index)
+        strings.append(
+            data[index:index + length].decode('utf-8', 'surrogatepass'))
+        index += length
+
+    # node classes and serialized attributes by string index
+    classes = [_NODE_CLASSES.get(string) for string in strings]
+
+    stack = []
+    push = stack.append
+    size = len(data)
+    new = object.__new__
+
+    while index < size:
+        tag = data[index]
+
+        if tag == _NODE:
+            value, index = _read_varint(data, index + 1)
+            node_type, fields = classes[value]
+
+            node = new(node_type)
+            split = len(stack) - len(fields)
+
+            for field, value in zip(fields, stack[split:]):
+                setattr(node, field, value)
+
+            del stack[split:]
+
+            start, index = _read_varint(data, index)
+
+            if start == 0:
+                node.start = node.end = node.lines = None
+            else:
+                length, index = _read_varint(data, index)
+                node.start = start - 1 + base
+                node.end = node.start + length
+                node.lines = lines
+
+            push(node)
+        elif tag == _STR:
+            value, index = _read_varint(data, index + 1)
+            push(strings[value])
+        elif tag == _LIST or tag == _TUPLE:
+            value, index = _read_varint(data, index + 1)
+            split = len(stack) - value
+            items = stack[split:]
+            del stack[split:]
+            push(items if tag == _LIST else tuple(items))
+        elif tag == _INT:
+            value, index = _read_varint(data, index + 1)
+            push(value >> 1 if not value & 1 else -(value >> 1) - 1)
+        elif tag == _NONE or tag == _TRUE or tag == _FALSE:
+            push(None if tag == _NONE else tag == _TRUE)
+            index += 1
+        elif tag == _FLOAT:
+            push(_FLOAT_STRUCT.unpack_from(data, index + 1)[0])
+            index += 1 + _FLOAT_STRUCT.size
+        else:
+            raise ValueError('invalid serialized AST')
+
+    if len(stack) != 1:
+        raise ValueError('invalid serialized AST')
+
+    return stack[0]
+
+
+class ASTCache:
+    """
+    Directory of serialized ASTs, named after a hash of their source.
+
+    The cache is only an accelerator: a cache entry which cannot be read or
+    written is parsed again, and never reported as an error.
+    """
+
+    # environment variable naming the default cache directory
+    ENV_VAR = 'POOP_AST_CACHE'
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    @classmethod
+    def from_environment(cls):
+        """
+        Returns the cache in the directory named by the POOP_AST_CACHE
+        environment variable, or None if it is not set.
+        """
+
+        directory = os.environ.get(cls.ENV_VAR)
+        return cls(directory) if directory else None
+
+    def entry_path(self, code):
+        """
+        Returns the path of the entry of a source.
+        """
+
+        digest = hashlib.sha256(code.encode('utf-8', 'surrogatepass'))
+        digest.update(struct.pack('<I', FORMAT_VERSION))
+        return os.path.join(self.directory, digest.hexdigest() + '.past')
+
+    def load(self, code, path=None):
+        """
+        Returns the cached AST of a source, or None if it is not cached.
+        """
+
+        try:
+            with open(self.entry_path(code), 'rb') as entry:
+                program = load_ast(entry.read(), code)
+        except (OSError, ValueError):
+            return None
+
+        program.path = path
+        return program
+
+    def store(self, code, program):
+        """
+        Caches the AST of a source. Returns whether it could be written.
+        """
+
+        target = self.entry_path(code)
+        temp = None
+
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+
+            # a temporary file per writer, in the cache directory so that it
+            # can be renamed to the entry
+            fd, temp = tempfile.mkstemp(
+                '.tmp', os.path.basename(target) + '.', self.directory)
+
+            with open(fd, 'wb') as entry:
+                entry.write(dump_ast(program))
+
+            # readers never see partially written entries
+            os.replace(temp, target)
+        except OSError:
+            if temp is not None:
+                try:
+                    os.remove(temp)
+                except OSError:
+                    pass
+
+            return False
+
+        return True
+
+    def parse(self, code, path=None):
+        """
+        Returns the AST of a source, loaded from the cache, or parsed and
+        cached if it is not in the cache.
+        """
+
+        program = self.load(code, path)
+
+        if program is None:
+            program = Parser(code, path).run()
+            self.store(code, program)
+
+        return program
+
+    def parse_file(self, path):
+        """
+        Returns the AST of the file at `path`, like `parse`.
+        """
+
+        with open(path) as file:
+            return self.parse(file.read(), path)
@@ -7,20 +7,38 @@ snippet as a template:
 
     @Parser.register([NodeType], priority=[n])
     def [rule_name](self):
-        # To consume a token of a given type:
-        expected_token = self.expect([token type])
+        # To consume a token of a given type (None if the next token is not of
+        # that type):
+        expected_token = self.accept([token type])
 
-        node = self.consume([NodeType to consume])
+        # To look at the type of the next token without consuming it:
+        if self.peek() == [token type]:
+            self.advance()
+
+        # To consume a node of a given type (None if it could not be parsed):
+        node = yield [NodeType to consume]
+
+        # Consumers fail by returning None
+        if expected_token is None or node is None:
+            return None
 
         ...  # Processing tokens
 
         return [AST node]
+
+Consumers yielding the node types they consume are run on an explicit stack,
+so that deeply nested code does not hit the recursion limit. Consumers which
+consume no node can be plain functions; plain consumers can also call
+`self.try_consume([NodeType])`, at the cost of one level of recursion per
+nested node.
+
+`expect` and `consume` raise a ParseError instead of returning None, which is
+slower when the parser backtracks.
 """
 
 from poop.parser.parser import Parser
 from poop.parser.lexer import *
 from poop.parser.ast import *
-from poop.parser.types import SourceSpan
 from poop.exception import *
 
 
@@ -29,217 +47,333 @@ def consume_program(self):
     # the program instructions
     instrs = []
 
-    self.expect(TokenType.UNZIP_PANTS)
-    self.expect(TokenType.NEWLINE)
+    if self.accept(TokenType.UNZIP_PANTS) is None:
+        return None
 
-    while self.token_queue:
-        try:
-            # tries to parse an expression from the token queue
-            instr = self.consume(Stmt)
-        except ParseError:
-            raise  # when no expression could be parsed
-        else:
-            # append the instruction to the program
-            instrs.append(instr)
+    if self.accept(TokenType.NEWLINE) is None:
+        return None
+
+    while not self.at_end():
+        # tries to parse an expression from the token queue
+        instr = yield Stmt
+
+        if instr is None:
+            return None  # when no expression could be parsed
+
+        # append the instruction to the program
+        instrs.append(instr)
 
     # returns the resulting Program object.
     prog = Program(instrs, self.path)
-    prog.span = SourceSpan.between(instrs[0], instrs[-1])
+    prog.set_span(instrs[0], instrs[-1])
     return prog
 
 
 @Parser.register(Declaration, priority=1)
 def consume_declaration(self):
-    first = self.expect(TokenType.STINKY)
-    ident = self.expect(TokenType.IDENT)
-    name = ident.value
+    first = self.accept(TokenType.STINKY)
+
+    if first is None:
+        return None
 
-    self.expect(TokenType.IS)
+    ident = self.accept(TokenType.IDENT)
 
-    value = self.consume(Expr)
+    if ident is None or self.accept(TokenType.IS) is None:
+        return None
 
-    last = self.expect(TokenType.NEWLINE)
+    value = yield Expr
 
-    decl = Declaration(name, value)
-    decl.span = SourceSpan.between(first, last)
+    if value is None:
+        return None
+
+    last = self.accept(TokenType.NEWLINE)
+
+    if last is None:
+        return None
+
+    decl = Declaration(ident.value, value)
+    decl.set_span(first, last)
     return decl
 
 
 @Parser.register(Call, priority=1)
 def consume_call(self):
-    func = self.expect(TokenType.IDENT)
-    self.expect(TokenType.LPAREN)
+    func = self.accept(TokenType.IDENT)
+
+    if func is None or self.accept(TokenType.LPAREN) is None:
+        return None
 
     args = []
 
-    try:
-        first = self.consume(Expr)
-    except ParseError:
-        pass
-    else:
+    first = yield Expr
+
+    if first is not None:
         args.append(first)
 
-    while self.token_queue[0].type == TokenType.COMMA:
-        self.token_queue.pop(0)
+    while self.peek() == TokenType.COMMA:
+        self.advance()
+
+        nxt = yield Expr
 
-        try:
-            nxt = self.consume(Expr)
-        except ParseError:
+        if nxt is None:
             break
-        else:
-            args.append(nxt)
 
-    last = self.expect(TokenType.RPAREN)
+        args.append(nxt)
+
+    last = self.accept(TokenType.RPAREN)
+
+    if last is None:
+        return None
 
     call = Call(func.value, args)
-    call.span = SourceSpan.between(func, last)
+    call.set_span(func, last)
     return call
 
 
-@Parser.register(BinOp, priority=2)
-def consume_binop(self):
-    first = self.expect(TokenType.LPAREN)
-    lhs = self.consume(Expr)
-    op = self.expect(TokenType.BIN_OP)
-    rhs = self.consume(Expr)
-    last = self.expect(TokenType.RPAREN)
+# binding power of the arithmetic operators; comparisons bind the loosest
+ARITH_POWERS = {
+    '+': 2, '-': 2,
+    '*': 3, '/': 3,
+    '^': 4,
+}
+
+# operator -> (binding power, right associative, node type)
+OPERATORS = {op: (1, False, CmpOp) for op in CMP_OP}
+OPERATORS.update(
+    (op, (ARITH_POWERS[op], op == '^', BinOp)) for op in BIN_OP
+)
+
+
+def _reduce(operands, operators):
+    """
+    Replaces the last operator and its two operands by their node.
+    """
+
+    op, node_type = operators.pop()
+    rhs = operands.pop()
+    lhs = operands.pop()
+
+    node = node_type(lhs, op, rhs)
+    node.set_span(lhs, rhs)
+    operands.append(node)
+
+
+@Parser.register(Expr, priority=1)
+def consume_expr(self):
+    # operator precedence parsing on explicit operand and operator stacks
+    lhs = yield Atom
+
+    if lhs is None:
+        return None
+
+    operands = [lhs]
+    operators = []
+    powers = []
+
+    while self.peek() in (TokenType.BIN_OP, TokenType.CMP_OP):
+        op = self.tokens.value(self.index)
+        power, right_assoc, node_type = OPERATORS[op]
+
+        # the pending operators binding at least as tightly take their rhs;
+        # right associative operators leave the equal ones pending
+        while powers and (powers[-1] > power or
+                          powers[-1] == power and not right_assoc):
+            powers.pop()
+            _reduce(operands, operators)
+
+        self.advance()
+
+        rhs = yield Atom
+
+        if rhs is None:
+            return None
+
+        operands.append(rhs)
+        operators.append((op, node_type))
+        powers.append(power)
+
+    while operators:
+        _reduce(operands, operators)
 
-    binop = BinOp(lhs, op.value, rhs)
-    binop.span = SourceSpan.between(first, last)
-    return binop
+    return operands[0]
 
 
-@Parser.register(CmpOp, priority=2)
-def consume_binop(self):
-    first = self.expect(TokenType.LPAREN)
-    lhs = self.consume(Expr)
-    op = self.expect(TokenType.CMP_OP)
-    rhs = self.consume(Expr)
-    last = self.expect(TokenType.RPAREN)
+@Parser.register(Atom, priority=1)
+def consume_parens(self):
+    first = self.accept(TokenType.LPAREN)
 
-    cmpop = CmpOp(lhs, op.value, rhs)
-    cmpop.span = SourceSpan.between(first, last)
-    return cmpop
+    if first is None:
+        return None
+
+    expr = yield Expr
+
+    if expr is None:
+        return None
+
+    last = self.accept(TokenType.RPAREN)
+
+    if last is None:
+        return None
+
+    # a parenthesized expression spans its parentheses
+    expr.set_span(first, last)
+    return expr
 
 
 @Parser.register(StmtExpr, priority=1)
 def consume_stmt_expr(self):
-    expr = self.consume(Expr)
-    self.expect(TokenType.NEWLINE)
+    expr = yield Expr
+
+    if expr is None or self.accept(TokenType.NEWLINE) is None:
+        return None
+
     stmt = StmtExpr(expr)
-    stmt.span = expr.span
+    stmt.set_span(expr)
     return stmt
 
 
+def _consume_block(self):
+    """
+    Consumes the statements of a block, as many as possible.
+    """
+
+    stmts = []
+
+    while True:
+        stmt = yield Stmt
+
+        if stmt is None:
+            return stmts
+
+        stmts.append(stmt)
+
+
 @Parser.register(While, priority=2)
 def consume_while(self):
-    first = self.expect(TokenType.CONSTIPATED_WHILE)
-    cond = self.consume(Expr)
-    self.expect(TokenType.NEWLINE)
-    body = []
+    first = self.accept(TokenType.CONSTIPATED_WHILE)
 
-    while True:
-        try:
-            nxt = self.consume(Stmt)
-        except ParseError:
-            break
-        else:
-            body.append(nxt)
+    if first is None:
+        return None
 
-    self.expect(TokenType.SPLOSH)
-    last = self.expect(TokenType.NEWLINE)
+    cond = yield Expr
+
+    if cond is None or self.accept(TokenType.NEWLINE) is None:
+        return None
+
+    body = yield from _consume_block(self)
+
+    if self.accept(TokenType.SPLOSH) is None:
+        return None
+
+    last = self.accept(TokenType.NEWLINE)
+
+    if last is None:
+        return None
 
     while_ = While(cond, body)
-    while_.span = SourceSpan.between(first, last)
+    while_.set_span(first, last)
     return while_
 
 
 @Parser.register(IfStmt, priority=2)
 def consume_while(self):
-    first = self.expect(TokenType.IF)
-    cond = self.consume(Expr)
-    self.expect(TokenType.NEWLINE)
+    first = self.accept(TokenType.IF)
+
+    if first is None:
+        return None
+
+    cond = yield Expr
+
+    if cond is None or self.accept(TokenType.NEWLINE) is None:
+        return None
 
-    body = []
+    body = yield from _consume_block(self)
     else_body = []
 
-    while True:
-        try:
-            nxt = self.consume(Stmt)
-        except ParseError:
-            break
-        else:
-            body.append(nxt)
+    if self.peek() == TokenType.SPLOSH:
+        self.advance()
+    elif self.peek() == TokenType.ELSE:
+        self.advance()
 
-    if self.token_queue[0].type == TokenType.SPLOSH:
-        self.token_queue.pop(0)
-    elif self.token_queue[0].type == TokenType.ELSE:
-        self.token_queue.pop(0)
-        self.expect(TokenType.NEWLINE)
+        if self.accept(TokenType.NEWLINE) is None:
+            return None
 
-        while True:
-            try:
-                nxt = self.consume(Stmt)
-            except ParseError:
-                break
-            else:
-                else_body.append(nxt)
+        else_body = yield from _consume_block(self)
 
-        self.expect(TokenType.SPLOSH)
+        if self.accept(TokenType.SPLOSH) is None:
+            return None
 
-    last = self.expect(TokenType.NEWLINE)
+    last = self.accept(TokenType.NEWLINE)
+
+    if last is None:
+        return None
 
     if_ = IfStmt(cond, body, else_body)
-    if_.span = SourceSpan.between(first, last)
+    if_.set_span(first, last)
     return if_
 
 
 @Parser.register(Variable, priority=2)
 def consume_variable(self):
-    ident = self.expect(TokenType.IDENT)
+    ident = self.accept(TokenType.IDENT)
+
+    if ident is None:
+        return None
 
     var = Variable(ident.value)
-    var.span = ident.span
+    var.set_span(ident)
     return var
 
 
 @Parser.register(IntLiteral, priority=1)
 def consume_int_literal(self):
-    token = self.expect(TokenType.INT_LITERAL)
+    token = self.accept(TokenType.INT_LITERAL)
+
+    if token is None:
+        return None
 
     str_val = token.value.split()[0]
     lit = IntLiteral(int(str_val))
-    lit.span = token.span
+    lit.set_span(token)
     return lit
 
 
 @Parser.register(FloatLiteral, priority=1)
 def consume_float_literal(self):
-    token = self.expect(TokenType.FLOAT_LITERAL)
+    token = self.accept(TokenType.FLOAT_LITERAL)
+
+    if token is None:
+        return None
 
     str_val = token.value.split()[0]
     lit = FloatLiteral(float(str_val))
-    lit.span = token.span
+    lit.set_span(token)
     return lit
 
 
 @Parser.register(CharLiteral, priority=1)
 def consume_char_literal(self):
-    token = self.expect(TokenType.CHAR_LITERAL)
+    token = self.accept(TokenType.CHAR_LITERAL)
+
+    if token is None:
+        return None
     char = token.value.strip("'")
 
     lit = CharLiteral(char)
-    lit.span = token.span
+    lit.set_span(token)
     return lit
 
 
 @Parser.register(StringLiteral, priority=1)
 def consume_string_literal(self):
-    token = self.expect(TokenType.STRING_LITERAL)
+    token = self.accept(TokenType.STRING_LITERAL)
+
+    if token is None:
+        return None
 
     # todo: find another way to unescape strings
     string = token.value.strip('"').encode('latin-1').decode('unicode_escape')
 
     lit = StringLiteral(string)
-    lit.span = token.span
+    lit.set_span(token)
     return lit
@@ -5,14 +5,181 @@
 Defines some types that are used by several modules in the package.
 """
 
+import re
+from array import array
+from bisect import bisect_right
+
+
+class LineIndex:
+	"""
+	Table of the offsets at which the lines of a source string start, used to
+	compute line and column numbers from offsets. The table is built once, the
+	first time a position is looked up.
+
+	An index can be forwarded to the index of an edited version of its source.
+	Its offsets are then moved as by the edit when they are looked up, so that
+	the nodes it locates need not be updated.
+	"""
+
+	def __init__(self, code, first_line=1):
+		self.code = code
+		self.first_line = first_line
+		self._starts = None
+
+		# the index this one is forwarded to, and the offsets from which the
+		# offsets of this index are moved by the matching deltas
+		self._target = None
+		self._thresholds = self._deltas = None
+
+	def forward(self, target, threshold, delta):
+		"""
+		Forwards the index to the index `target` of an edited source, where
+		the offsets from `threshold` on are moved by `delta`.
+		"""
+
+		self._target = target
+		self._thresholds, self._deltas = [threshold], [delta]
+		self.code = self._starts = None
+
+	def _move(self, offset):
+		index = bisect_right(self._thresholds, offset)
+		return offset + self._deltas[index - 1] if index else offset
+
+	def _compress(self):
+		"""
+		Forwards the index directly to the index its target is forwarded to,
+		composing the moves of both.
+		"""
+
+		target = self._target
+		bounds = [None] + self._thresholds + [None]
+		deltas = [0] + self._deltas
+		points = set(self._thresholds)
+
+		# the offsets moved to the thresholds of the target split the segments
+		# of this index
+		for i, delta in enumerate(deltas):
+			low, high = bounds[i], bounds[i + 1]
+
+			for threshold in target._thresholds:
+				point = threshold - delta
+
+				if (low is None or point >= low) and \
+						(high is None or point < high):
+					points.add(point)
+
+		points = sorted(points)
+		self._deltas = [
+			target._move(self._move(point)) - point for point in points
+		]
+		self._thresholds = points
+		self._target = target._target
+
+	def resolve(self, offset):
+		"""
+		Returns the index of the current version of the source, and the offset
+		in it of an offset of this index.
+		"""
+
+		index = self
+
+		while index._target is not None:
+			if index._target._target is not None:
+				index._compress()
+				continue
+
+			return index._target, index._move(offset)
+
+		return index, offset
+
+	@property
+	def starts(self):
+		if self._starts is None:
+			self._starts = array('I', [0])
+			self._starts.extend(m.end() for m in re.finditer('\n', self.code))
+
+		return self._starts
+
+	def locate(self, offset):
+		"""
+		Returns the line and column of an offset in the source.
+		"""
+
+		index, offset = self.resolve(offset)
+		starts = index.starts
+		line = bisect_right(starts, offset) - 1
+		return index.first_line + line, offset - starts[line] + 1
+
+	def absolute(self, offset):
+		"""
+		Returns the offset in the current version of the source of an offset
+		of this index.
+		"""
+
+		return self.resolve(offset)[1]
+
+	def line_text(self, line):
+		"""
+		Returns the text of a line, without its terminator.
+		"""
+
+		lines, _ = self.resolve(0)
+		starts = lines.starts
+		index = line - lines.first_line
+
+		if index + 1 < len(starts):
+			text = lines.code[starts[index]:starts[index + 1] - 1]
+		else:
+			text = lines.code[starts[index]:]
+
+		return text.rstrip('\r')
+
 
 class SourcePos:
 	"""
 	Represents a position in a file.
+
+	A position may also be created from an offset in a source string with
+	`SourcePos.at`, in which case its line and column are only computed when
+	they are first read.
 	"""
 
-	def __init__(self, line, column):
-		self.line, self.column = line, column
+	def __init__(self, line=None, column=None, offset=None, lines=None):
+		self._line, self._column = line, column
+		self.offset = offset
+		self.lines = lines
+
+	@classmethod
+	def at(cls, lines, offset):
+		"""
+		Creates the position of an offset in the source of a LineIndex.
+		"""
+
+		return cls(offset=offset, lines=lines)
+
+	def _locate(self):
+		if self._line is None:
+			self._line, self._column = self.lines.locate(self.offset)
+
+	@property
+	def line(self):
+		self._locate()
+		return self._line
+
+	@line.setter
+	def line(self, line):
+		self._locate()
+		self._line = line
+
+	@property
+	def column(self):
+		self._locate()
+		return self._column
+
+	@column.setter
+	def column(self, column):
+		self._locate()
+		self._column = column
 
 	def __repr__(self):
 		return 'SourcePos(line={pos.line}, col={pos.column})'.format(pos=self)
@@ -34,12 +201,15 @@ class SourcePos:
 			else:
 				self.column += 1
 
+		if self.offset is not None:
+			self.offset += len(string)
+
 	def copy(self):
 		"""
 		Copies the instance to avoid unwanted references.
 		"""
 
-		return SourcePos(line=self.line, column=self.column)
+		return SourcePos(self._line, self._column, self.offset, self.lines)
 
 
 class SourceSpan:
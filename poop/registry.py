@@ -0,0 +1,81 @@
+#!/usr/bin/env python3.4
+# coding: utf-8
+
+"""
+This module defines the registries filled by decorators at import time, such
+as the parser consumers or the compiler translations.
+"""
+
+__all__ = ['Registry', 'RegistryFrozenError']
+
+import threading
+from types import MappingProxyType
+from collections import OrderedDict
+from collections.abc import Mapping
+
+
+class RegistryFrozenError(RuntimeError):
+	"""
+	Raised when an entry is added to a frozen registry.
+	"""
+
+
+class Registry(Mapping):
+	"""
+	Mapping filled by decorators at startup, and frozen the first time it is
+	used: from then on, it cannot be changed and can be read from several
+	threads at once. Entries are kept in the order they were added.
+
+	In a registry of `multiple` values, each key maps to a tuple of the values
+	added for it, in order.
+	"""
+
+	def __init__(self, name, multiple=False):
+		self.name = name
+		self.multiple = multiple
+		self.frozen = False
+		self._entries = OrderedDict()
+		self._lock = threading.Lock()
+
+	def __repr__(self):
+		state = 'frozen' if self.frozen else 'open'
+		return 'Registry({!r}, {}, entries={})'.format(
+			self.name, state, len(self))
+
+	def __getitem__(self, key):
+		return self._entries[key]
+
+	def __iter__(self):
+		return iter(self._entries)
+
+	def __len__(self):
+		return len(self._entries)
+
+	def add(self, key, value):
+		"""
+		Maps a key to a value, or adds the value to those of the key in a
+		registry of multiple values.
+		"""
+
+		with self._lock:
+			if self.frozen:
+				msg = 'the {} registry is frozen: {!r} cannot be added'
+				raise RegistryFrozenError(msg.format(self.name, key))
+
+			if self.multiple:
+				self._entries[key] = self._entries.get(key, ()) + (value,)
+			else:
+				self._entries[key] = value
+
+	def freeze(self):
+		"""
+		Makes the registry immutable, and returns it.
+		"""
+
+		if not self.frozen:
+			with self._lock:
+				if not self.frozen:
+					self._entries = MappingProxyType(self._entries)
+					self.frozen = True
+
+		return self
@@ -11,14 +11,14 @@ import os
 import sys
 import inspect
 import traceback
-from collections import OrderedDict
 
 from poop.repl.command import REPLCommand
 from poop.repl.syntax import parse_repl_line
 from poop.compiler import Compiler
-from poop.parser import Parser
+from poop.parser import Parser, TextEdit, reparse
 from poop.prelude import default_env
 from poop.exception import ParseError
+from poop.registry import Registry
 
 DEFAULT_REPL_HEADER = """
 poop - v{}
@@ -28,12 +28,19 @@ poop - v{}
 class REPL:
     """
     A read-eval-print loop that interactively runs poop code.
+
+    Commands are registered with `REPL.register`; a REPL may also be given its
+    own `commands` and `aliases` tables.
     """
 
-    aliases = {}
-    commands = OrderedDict()
+    # registered commands and aliases, frozen by the first REPL created
+    aliases = Registry('REPL aliases')
+    commands = Registry('REPL commands')
 
-    def __init__(self, path=None, prelude=default_env):
+    def __init__(self, path=None, prelude=default_env, commands=None,
+                 aliases=None):
+        self.commands = REPL.commands.freeze() if commands is None else commands
+        self.aliases = REPL.aliases.freeze() if aliases is None else aliases
         self.path = path
         self.default_env = default_env.copy()
         self.environment = default_env.copy()
@@ -42,17 +49,20 @@ class REPL:
         self.header = DEFAULT_REPL_HEADER
         self.running = False
 
-    @classmethod
-    def get_command(cls, name):
+        # source and AST of the loaded path, reused by `reload`
+        self.source = None
+        self.program = None
+
+    def get_command(self, name):
         """
         Gets the function associated with the command from its name or alias.
         """
 
         try:
-            return cls.commands[name]
+            return self.commands[name]
         except KeyError:
-            realname = cls.aliases[name]
-            return cls.commands[realname]
+            realname = self.aliases[name]
+            return self.commands[realname]
 
     @classmethod
     def register(cls, name, *aliases):
@@ -61,10 +71,10 @@ class REPL:
         """
 
         def _decorator_wrapper(fn):
-            cls.commands[name] = fn
+            cls.commands.add(name, fn)
 
             for alias in aliases:
-                cls.aliases[alias] = name
+                cls.aliases.add(alias, name)
 
             return fn
 
@@ -75,23 +85,42 @@ class REPL:
         Loads a path into the current environment.
         """
 
-        print('Loading file "{}"'.format(path))
-
-        self.environment = self.default_env.copy()
-
         with open(path) as load_file:
-            compiler = Compiler.from_file(path)
-            compiler.load(self.environment)
-            self.path = path
+            source = load_file.read()
+
+        self._load_program(path, source, Parser(source, path).run())
 
     def reload(self):
         """
         Reloads the current path into the environment.
         """
-        if self.path is not None:
+        if self.path is None:
+            print('Error: No module loaded. Type `:load [file]` to load one.')
+        elif self.program is None:
             self.load(self.path)
         else:
-            print('Error: No module loaded. Type `:load [file]` to load one.')
+            with open(self.path) as load_file:
+                source = load_file.read()
+
+            # only the statements touched since the last load are parsed again;
+            # the previous AST is consumed by `reparse`
+            program, self.program = self.program, None
+            edit = TextEdit.diff(self.source, source)
+            self._load_program(self.path, source, reparse(program, source, edit))
+
+    def _load_program(self, path, source, program):
+        """
+        Runs a parsed source in a fresh environment.
+        """
+
+        print('Loading file "{}"'.format(path))
+
+        self.environment = self.default_env.copy()
+        self.path = path
+        self.source, self.program = source, program
+
+        compiler = Compiler(program, path)
+        compiler.load(self.environment)
 
     def read_command(self):
         """
@@ -178,10 +207,11 @@ def help(self, command=None):
     if command is None:
         print('Commands available from the prompt:', end='\n' * 2)
 
-        print(*map(_get_command_desc, self.commands), sep='\n')
+        print(*(_get_command_desc(self, name) for name in self.commands),
+              sep='\n')
     else:
         print('Showing help for command {!r}'.format(command))
-        print(_get_command_desc(command))
+        print(_get_command_desc(self, command))
 
         aliases = []
 
@@ -195,9 +225,9 @@ def help(self, command=None):
             print('Aliases:', ', '.join(map(repr, aliases)))
 
 
-def _get_command_desc(name):
+def _get_command_desc(repl, name):
     try:
-        fn = REPL.get_command(name)
+        fn = repl.get_command(name)
     except KeyError:
         print('Error: command {!r} is not defined.'.format(name))
 
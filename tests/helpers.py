@@ -0,0 +1,69 @@
+"""
+Helpers shared by the tests.
+"""
+
+import os
+import sys
+import subprocess
+
+from poop.parser import Node
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+# a program using every kind of statement, with comments and blank lines
+CODE = (
+    'unzip pants\n'
+    'stinky x is 3 tons of shit // a comment\n'
+    '\n'
+    'stinky s is "a // b\\n"\n'
+    'constipated while x < 10 tons of shit\n'
+    '    if ((x * 2 tons of shit) > 7 tons of shit)\n'
+    '        stinky s is (s + \'c\')\n'
+    '    else\n'
+    '        shitspray(x, /* a comment\n'
+    '           over two lines */ (2.5 tons of shit / x))\n'
+    '    splosh\n'
+    '    stinky x is x + 1 tons of shit\n'
+    'splosh\n'
+    'shitspray(s, tonumericpoop("4"), (x == 10 tons of shit))\n'
+)
+
+
+def shape(node):
+    """
+    Returns the types, values and locations of the nodes of an AST, in
+    preorder.
+    """
+
+    nodes = []
+    stack = [node]
+
+    while stack:
+        item = stack.pop()
+
+        if isinstance(item, (list, tuple)):
+            stack.extend(reversed(item))
+            continue
+        elif not isinstance(item, Node):
+            nodes.append(item)
+            continue
+
+        nodes.append((type(item).__name__, str(item.span)))
+        stack.extend(reversed([getattr(item, field) for field in item._fields]))
+
+    return nodes
+
+
+def run_poop(*args):
+    """
+    Runs the command line with the given arguments, and returns its standard
+    output and error.
+    """
+
+    result = subprocess.run(
+        [sys.executable, '-m', 'poop'] + list(args), cwd=ROOT, check=True,
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+
+    return result.stdout, result.stderr
@@ -0,0 +1,81 @@
+"""
+Hash-consing the expressions of programs.
+"""
+
+from poop.parser import (Parser, NodeInterner, Expr, Stmt, Variable,
+                         iter_child_nodes, expr_spans, structural_hash,
+                         structurally_equal)
+
+from helpers import CODE
+
+
+def expressions(program):
+    """
+    Returns the expressions of the statements of a program, in the order of
+    `expr_spans`: in preorder, statement by statement.
+    """
+
+    exprs = []
+    stack = list(reversed(program.instructions))
+
+    while stack:
+        stmt = stack.pop()
+
+        for field in stmt._fields:
+            value = getattr(stmt, field)
+
+            if isinstance(value, Expr):
+                nodes = [value]
+
+                while nodes:
+                    node = nodes.pop()
+                    exprs.append(node)
+                    nodes.extend(reversed(list(iter_child_nodes(node))))
+
+        for field in reversed(stmt._fields):
+            value = getattr(stmt, field)
+
+            if isinstance(value, (list, tuple)):
+                stack.extend(
+                    item for item in reversed(value) if isinstance(item, Stmt))
+
+    return exprs
+
+
+def test_intern_while_parsing():
+    program = Parser(CODE).run()
+    interner = NodeInterner()
+    interned = Parser(CODE, interner=interner).run()
+
+    # the same expressions, with their locations moved to the program
+    exprs = expressions(program)
+    located = list(expr_spans(interned))
+
+    assert [type(node) for node, start, end in located] == \
+        [type(node) for node in exprs]
+    assert [(start, end) for node, start, end in located] == \
+        [(node.start, node.end) for node in exprs]
+    assert all(node.start is None for node, start, end in located)
+    assert all(node in interner for node, start, end in located)
+
+    assert program.spans is None
+    assert len(interner) < len(exprs)
+
+
+def test_shared_nodes():
+    interner = NodeInterner()
+    code = 'unzip pants\nshitspray(x + 1 tons of shit, x + 1 tons of shit)\n'
+    first = Parser(code, interner=interner).run()
+    second = Parser(code, interner=interner).run()
+
+    lhs, rhs = first.instructions[0].expr.args
+    assert lhs is rhs
+    assert second.instructions[0].expr is first.instructions[0].expr
+    assert lhs.lhs is rhs.lhs and isinstance(lhs.lhs, Variable)
+
+    # structural hashes and equality do not depend on interning
+    plain = Parser(code).run().instructions[0].expr.args[0]
+    assert interner.structural_hash(lhs) == structural_hash(lhs) == \
+        structural_hash(plain)
+    assert structurally_equal(lhs, plain)
+    assert not structurally_equal(lhs, lhs.lhs)
@@ -0,0 +1,81 @@
+"""
+Reparsing edited sources builds the same AST as parsing them again.
+"""
+
+import pytest
+
+from poop.parser import Parser, TextEdit, reparse
+from poop.exception import ParseError
+
+from helpers import CODE, shape
+
+
+def test_reparse():
+    edits = [
+        # inside a statement, in a block, and across statements
+        (CODE.index('3 tons'), CODE.index('3 tons') + 1, '42'),
+        (CODE.index("'c'"), CODE.index("'c'") + 3, '"cd" + s'),
+        (CODE.index('    stinky x is x'), CODE.index('splosh\nshitspray'),
+         '    shitspray(x)\n    stinky x is x + 2 tons of shit\n'),
+        (len(CODE), len(CODE), 'shitspray(x)\n'),
+    ]
+
+    for start, end, text in edits:
+        edit = TextEdit(start, end, text)
+        code = edit.apply(CODE)
+
+        program = reparse(Parser(CODE).run(), code, edit)
+        assert shape(program) == shape(Parser(code).run())
+
+
+def test_successive_edits():
+    """
+    The statements kept by several reparses are located in the last source.
+    """
+
+    code = CODE
+    program = Parser(code).run()
+
+    for old, new in [('3 tons', '42 tons'), ('shitspray(x, ', 'shitspray('),
+                     ('stinky s is "', '\n\nstinky s is "'),
+                     ("(s + ", "('x' + s + "), ('2.5', '2'),
+                     ('x < 10', 'x < 1000')]:
+        edit = TextEdit(code.index(old), code.index(old) + len(old), new)
+        code = edit.apply(code)
+
+        program = reparse(program, code, edit)
+        assert shape(program) == shape(Parser(code).run())
+
+
+def test_untouched_statements():
+    """
+    The statements after an edit are kept as they are.
+    """
+
+    program = Parser(CODE).run()
+    last = program.instructions[-1]
+    start, end = last.start, last.end
+
+    edit = TextEdit(CODE.index('3 tons'), CODE.index('3 tons') + 1, '42')
+    code = edit.apply(CODE)
+    program = reparse(program, code, edit)
+
+    assert program.instructions[-1] is last
+    assert (last.start, last.end) == (start, end)
+    assert code[last.lines.absolute(last.start):].startswith('shitspray(s')
+
+
+def test_failed_reparse():
+    """
+    A reparse failing on an invalid edit leaves the program as it was.
+    """
+
+    program = Parser(CODE).run()
+    expected = shape(program)
+
+    edit = TextEdit(CODE.index('3 tons'), CODE.index('3 tons'), '\n@ ')
+
+    with pytest.raises(ParseError):
+        reparse(program, edit.apply(CODE), edit)
+
+    assert shape(program) == expected
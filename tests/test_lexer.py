@@ -0,0 +1,167 @@
+"""
+Tokenizing sources.
+"""
+
+import io
+
+import pytest
+
+from poop.parser import (Parser, TokenType, TokenStream, tokenize,
+                         tokenize_stream, tokenize_file)
+from poop.exception import ParseError
+
+
+def lex(code):
+    return [(token.type, token.value) for token in tokenize(code)]
+
+
+def test_operators():
+    assert lex('a <= b >= c < d == e != f') == [
+        (TokenType.IDENT, 'a'), (TokenType.CMP_OP, '<='),
+        (TokenType.IDENT, 'b'), (TokenType.CMP_OP, '>='),
+        (TokenType.IDENT, 'c'), (TokenType.CMP_OP, '<'),
+        (TokenType.IDENT, 'd'), (TokenType.CMP_OP, '=='),
+        (TokenType.IDENT, 'e'), (TokenType.CMP_OP, '!='),
+        (TokenType.IDENT, 'f'),
+    ]
+
+    assert lex('a / b ^ c') == [
+        (TokenType.IDENT, 'a'), (TokenType.BIN_OP, '/'),
+        (TokenType.IDENT, 'b'), (TokenType.BIN_OP, '^'),
+        (TokenType.IDENT, 'c'),
+    ]
+
+
+def test_comments():
+    # the newline ending a line comment is a token
+    assert lex('x / y // z / w\nz') == [
+        (TokenType.IDENT, 'x'), (TokenType.BIN_OP, '/'),
+        (TokenType.IDENT, 'y'), (TokenType.NEWLINE, '\n'),
+        (TokenType.IDENT, 'z'),
+    ]
+
+    assert lex('x /* a\n// b */ / y') == [
+        (TokenType.IDENT, 'x'), (TokenType.BIN_OP, '/'),
+        (TokenType.IDENT, 'y'),
+    ]
+
+    # comment delimiters in strings are not comments
+    assert lex('"a // b" "/* c"') == [
+        (TokenType.STRING_LITERAL, '"a // b"'),
+        (TokenType.STRING_LITERAL, '"/* c"'),
+    ]
+
+
+def test_literals_and_keywords():
+    assert lex('stinky x is 1 tons of shit 2.5 tons of shit 1 ton of shit') \
+        == [
+            (TokenType.STINKY, 'stinky'), (TokenType.IDENT, 'x'),
+            (TokenType.IS, 'is'), (TokenType.INT_LITERAL, '1 tons of shit'),
+            (TokenType.FLOAT_LITERAL, '2.5 tons of shit'),
+            (TokenType.INT_LITERAL, '1 ton of shit'),
+        ]
+
+    assert lex("constipated while 'c'\nsplosh") == [
+        (TokenType.CONSTIPATED_WHILE, 'constipated while'),
+        (TokenType.CHAR_LITERAL, "'c'"), (TokenType.NEWLINE, '\n'),
+        (TokenType.SPLOSH, 'splosh'),
+    ]
+
+
+def test_spans():
+    tokens = list(tokenize('a\n  bc /* d\n */ e'))
+
+    assert [(token.start, token.end) for token in tokens] == \
+        [(0, 1), (1, 2), (4, 6), (16, 17)]
+    assert str(tokens[2].span) == 'line 2 from column 3 to column 5'
+    assert str(tokens[3].pos) == 'line 3, column 5'
+
+
+def test_errors():
+    with pytest.raises(ParseError) as error:
+        list(tokenize('a\nb @ c'))
+
+    assert str(error.value.pos) == 'line 2, column 3'
+    assert 'Failed to tokenize code' in str(error.value)
+
+    with pytest.raises(ParseError) as error:
+        list(tokenize('a\n/* b'))
+
+    assert str(error.value.pos) == 'line 2, column 3'
+    assert 'Unterminated comment' in str(error.value)
+
+
+SOURCE = (
+    'unzip pants\n'
+    'stinky s is "a // b" // a comment\n'
+    'constipated while x <= 10 tons of shit /* a comment\n'
+    '   over two lines */\n'
+    '    stinky s is (s + \'c\')\n'
+    'splosh\n'
+    'shitspray(s, 2.5 tons of shit / x)\n'
+)
+
+
+def located(tokens):
+    return [
+        (token.type, token.value, str(token.span)) for token in tokens
+    ]
+
+
+def test_tokenize_stream():
+    expected = located(tokenize(SOURCE))
+
+    for chunk_size in (1, 5, 64, 1 << 16):
+        tokens = tokenize_stream(io.StringIO(SOURCE), chunk_size)
+        assert located(tokens) == expected
+
+        stream = io.BytesIO(SOURCE.encode('utf-8'))
+        assert located(tokenize_stream(stream, chunk_size)) == expected
+
+
+def test_tokenize_file(tmp_path):
+    path = tmp_path / 'source.poop'
+    path.write_text(SOURCE)
+    expected = located(tokenize(SOURCE))
+
+    for chunk_size in (3, 1 << 16):
+        assert located(tokenize_file(str(path), chunk_size)) == expected
+
+        tokens = TokenStream.from_file(str(path), chunk_size)
+        assert tokens.code == SOURCE
+        assert located(tokens) == expected
+
+    empty = tmp_path / 'empty.poop'
+    empty.write_text('')
+    assert list(tokenize_file(str(empty))) == []
+    assert len(TokenStream.from_file(str(empty))) == 0
+
+
+def test_parser_from_file(tmp_path):
+    path = tmp_path / 'source.poop'
+    path.write_text(SOURCE)
+
+    parser = Parser.from_file(str(path))
+    assert located(parser.tokens) == located(tokenize(SOURCE))
+    assert repr(parser.run()) == repr(Parser(SOURCE, str(path)).run())
+
+
+def test_token_stream():
+    code = 'stinky name is name\nshitspray(name)'
+    tokens = TokenStream.from_code(code)
+
+    assert len(tokens) == 9
+    assert located(tokens) == located(tokenize(code))
+    assert [token.value for token in tokens[-4:]] == \
+        ['shitspray', '(', 'name', ')']
+    assert tokens[-1].value == ')'
+
+    # keywords and identifiers are interned
+    assert tokens.value(1) is tokens.value(3) is tokens.value(7)
+    assert tokens.type(0) is TokenType.STINKY
+    assert str(tokens.pos(5)) == 'line 2, column 1'
+
+    # part of a source
+    tokens = TokenStream.from_code(code, code.index('shitspray'),
+                                   code.index('('))
+    assert [token.value for token in tokens] == ['shitspray']
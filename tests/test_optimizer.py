@@ -0,0 +1,397 @@
+"""
+Programs behave the same at every optimization level.
+"""
+
+import io
+import ast
+
+import pytest
+
+from poop.parser import Parser
+from poop.compiler import (Compiler, StringAccumulatorLowering,
+                           LoopInvariantHoisting, CounterLoopLowering)
+from poop.compiler.compiler import fix_locations
+from poop.compiler.invariants import INVARIANT_PREFIX
+from poop.prelude import default_env
+from poop.exception import CompileError
+
+from helpers import run_poop
+
+
+LEVELS = (0, 1, 2)
+
+PROGRAMS = [
+    # a counter loop building a string and computing an invariant
+    'unzip pants\n'
+    'stinky n is 5 tons of shit\n'
+    'stinky s is ""\n'
+    'stinky i is 0 tons of shit\n'
+    'constipated while i < n\n'
+    '  stinky s is s + "x"\n'
+    '  stinky k is (n * 2 tons of shit) - 1 tons of shit\n'
+    '  shitspray(i, k)\n'
+    '  stinky i is i + 1 tons of shit\n'
+    'splosh\n'
+    'shitspray(i, s)\n',
+
+    # counters and bounds which are not integers
+    'unzip pants\n'
+    'stinky i is 0.5 tons of shit\n'
+    'constipated while i <= 3 tons of shit\n'
+    '  shitspray(i)\n'
+    '  stinky i is i + 1 tons of shit\n'
+    'splosh\n'
+    'stinky j is 0 tons of shit\n'
+    'stinky n is 2.5 tons of shit\n'
+    'constipated while j < n\n'
+    '  stinky j is j + 1 tons of shit\n'
+    'splosh\n'
+    'shitspray(i, j)\n',
+
+    # nested loops, the inner one bounded by the outer counter
+    'unzip pants\n'
+    'stinky total is 0 tons of shit\n'
+    'stinky i is 0 tons of shit\n'
+    'constipated while i < 4 tons of shit\n'
+    '  stinky j is 0 tons of shit\n'
+    '  constipated while j <= i\n'
+    '    stinky total is total + (i * j)\n'
+    '    stinky j is j + 1 tons of shit\n'
+    '  splosh\n'
+    '  stinky i is i + 1 tons of shit\n'
+    'splosh\n'
+    'shitspray(total)\n',
+
+    # nested loops whose bounds are checked before the outer loops
+    'unzip pants\n'
+    'stinky n is 3 tons of shit\n'
+    'stinky m is (n + 0.5 tons of shit)\n'
+    'stinky p is n\n'
+    'stinky total is 0 tons of shit\n'
+    'stinky i is 0 tons of shit\n'
+    'constipated while i < 3 tons of shit\n'
+    '  stinky j is i\n'
+    '  constipated while j < m\n'
+    '    stinky total is total + j\n'
+    '    stinky j is j + 1 tons of shit\n'
+    '  splosh\n'
+    '  stinky k is 0 tons of shit\n'
+    '  constipated while k <= p\n'
+    '    stinky total is total + (k * 10 tons of shit)\n'
+    '    stinky k is k + 1 tons of shit\n'
+    '  splosh\n'
+    '  stinky i is i + 1 tons of shit\n'
+    'splosh\n'
+    'shitspray(total, i, j, k)\n',
+
+    # invariants which raise, in loops which do not compute them first
+    'unzip pants\n'
+    'stinky z is 0 tons of shit\n'
+    'stinky i is 5 tons of shit\n'
+    'constipated while i < 3 tons of shit\n'
+    '  shitspray(1 tons of shit / z)\n'
+    '  stinky i is i + 1 tons of shit\n'
+    'splosh\n'
+    'stinky i is 0 tons of shit\n'
+    'constipated while i < 3 tons of shit\n'
+    '  shitspray(i)\n'
+    '  if (i == 1 tons of shit)\n'
+    '    shitspray(1 tons of shit / z)\n'
+    '  splosh\n'
+    '  stinky i is i + 1 tons of shit\n'
+    'splosh\n',
+
+    # a program binding the names read by the generated code
+    'unzip pants\n'
+    'stinky range is 3 tons of shit\n'
+    'stinky Exception is 2 tons of shit\n'
+    'stinky i is 0 tons of shit\n'
+    'constipated while i < range\n'
+    '  shitspray(i, (range * Exception))\n'
+    '  stinky i is i + 1 tons of shit\n'
+    'splosh\n',
+
+    # constant conditions, and variables assigned and never read
+    'unzip pants\n'
+    'stinky a is 1 tons of shit\n'
+    'stinky b is (2 tons of shit * 3 tons of shit)\n'
+    'if (1 tons of shit < 2 tons of shit)\n'
+    '  stinky a is a + b\n'
+    'else\n'
+    '  stinky a is 0 tons of shit\n'
+    'splosh\n'
+    'stinky c is "unused"\n'
+    'shitspray(a)\n',
+
+    # comparisons folded to booleans
+    'unzip pants\n'
+    'stinky a is (1 tons of shit < 2 tons of shit)\n'
+    'shitspray(a, (2.5 tons of shit == 3 tons of shit))\n',
+
+    # a loop raising midway through a string
+    'unzip pants\n'
+    'stinky s is ""\n'
+    'stinky i is 0 tons of shit\n'
+    'constipated while i < 5 tons of shit\n'
+    '  stinky s is s + "x"\n'
+    '  if (i == 3 tons of shit)\n'
+    '    stinky s is s + i\n'
+    '  splosh\n'
+    '  stinky i is i + 1 tons of shit\n'
+    'splosh\n',
+]
+
+
+def new_env():
+    """
+    Returns an environment, and the list of what the program prints in it.
+    """
+
+    printed = []
+    env = dict(default_env, shitspray=lambda *args: printed.append(args))
+    return env, printed
+
+
+def outcome(env, printed, error):
+    """
+    Returns what a program printed, the error it raised, and the variables it
+    left in the environment.
+    """
+
+    variables = {
+        name: value for name, value in env.items()
+        if name not in default_env and not name.startswith('__')
+    }
+
+    if error is not None:
+        error = type(error), str(error)
+
+    return printed, error, variables
+
+
+def run(code, **options):
+    env, printed = new_env()
+    error = None
+
+    try:
+        Compiler(Parser(code).run(), **options).load(env)
+    except Exception as exc:
+        error = exc
+
+    return outcome(env, printed, error)
+
+
+def run_stream(code, **options):
+    env, printed = new_env()
+    error = None
+
+    try:
+        Compiler.execute_stream(io.StringIO(code), prelude=env, mute_env=True,
+                                **options)
+    except Exception as exc:
+        error = exc
+
+    return outcome(env, printed, error)
+
+
+def test_levels():
+    for code in PROGRAMS:
+        expected = run(code, optimize=0)
+
+        for optimize in LEVELS:
+            assert run(code, optimize=optimize) == expected
+            assert run(code, optimize=optimize, fast_locals=True) == expected
+            assert run(code, optimize=optimize, prelude=default_env) == \
+                expected
+
+
+def test_stream():
+    for code in PROGRAMS:
+        expected = run(code, optimize=0)
+
+        for optimize in LEVELS:
+            assert run_stream(code, optimize=optimize) == expected
+
+
+def test_environment_range():
+    """
+    The lowered loops do not read the `range` of the environment.
+    """
+
+    code = PROGRAMS[0]
+    expected = run(code, optimize=0)
+
+    for optimize in LEVELS:
+        env, printed = new_env()
+        env['range'] = 3
+        Compiler(Parser(code).run(), optimize=optimize).load(env)
+
+        printed, error, variables = outcome(env, printed, None)
+        del variables['range']
+        assert (printed, error, variables) == expected
+
+
+def test_exports():
+    """
+    The exported variables are left in the environment; the others may not.
+    """
+
+    code = PROGRAMS[0]
+    printed, error, variables = run(code, optimize=0)
+
+    for optimize in LEVELS:
+        for fast_locals in (False, True):
+            result = run(code, optimize=optimize, fast_locals=fast_locals,
+                         exports=['s'])
+
+            assert result[:2] == (printed, error)
+            assert result[2]['s'] == variables['s']
+            assert set(result[2]) <= set(variables)
+
+
+def test_command_line(tmp_path):
+    """
+    The programs run from the command line leave no variable, so that their
+    unread variables are removed.
+    """
+
+    path = tmp_path / 'source.poop'
+    path.write_text(
+        'unzip pants\n'
+        'stinky a is 1 tons of shit\n'
+        'stinky unused is a + 1 tons of shit\n'
+        'shitspray(a)\n')
+
+    output, report = run_poop('-O', '1', '--report-passes', '--exec',
+                              str(path))
+    assert output == run_poop('--exec', str(path))[0]
+
+    line, = [line for line in report.splitlines()
+             if 'DeadStoreElimination' in line]
+    assert int(line.split()[-2]) > 0
+
+
+def test_python_passes():
+    """
+    The passes on the Python AST are reported, and can be selected.
+    """
+
+    code = (
+        'unzip pants\n'
+        'stinky i is 0 tons of shit\n'
+        'constipated while i < 3 tons of shit\n'
+        '  stinky i is i + 1 tons of shit\n'
+        'splosh\n'
+    )
+
+    report = io.StringIO()
+    compiled = Compiler(Parser(code).run(), optimize=2, fast_locals=False,
+                        report=report).compile()
+    assert '__poop_range__' in compiled.co_names
+
+    rewrites = {
+        line.split()[0]: int(line.split()[-2])
+        for line in report.getvalue().splitlines()[1:]
+    }
+    assert rewrites['StringAccumulatorLowering'] == 0
+    assert rewrites['LoopInvariantHoisting'] == 0
+    assert rewrites['CounterLoopLowering'] == 1
+
+    compiled = Compiler(Parser(code).run(), passes=[CounterLoopLowering]) \
+        .compile()
+    assert '__poop_range__' in compiled.co_names
+
+    compiled = Compiler(Parser(code).run(), optimize=2, fast_locals=False,
+                        passes=[StringAccumulatorLowering,
+                                LoopInvariantHoisting]).compile()
+    assert '__poop_range__' not in compiled.co_names
+
+
+def test_nested_counter_loops():
+    """
+    The types of nested counter loops are checked once, so that the original
+    loops are only compiled once.
+    """
+
+    lines = ['m{} = n'.format(level) for level in range(8)]
+
+    for level in range(8):
+        lines += [
+            '    ' * level + 'i{} = 0'.format(level),
+            '    ' * level + 'while i{0} < m{0}:'.format(level),
+        ]
+
+    lines += [
+        '    ' * level + '    i{0} = i{0} + 1'.format(level)
+        for level in reversed(range(8))
+    ]
+
+    module = CounterLoopLowering().transform(ast.parse('\n'.join(lines)))
+    loops = [type(node) for node in ast.walk(module)
+             if isinstance(node, (ast.For, ast.While))]
+
+    assert loops.count(ast.For) == 8
+    assert loops.count(ast.While) == 8
+
+
+def test_nested_invariants():
+    """
+    The invariants of nested loops are hoisted without copying the loops.
+    """
+
+    lines = ['m = n']
+
+    for level in range(4):
+        lines += [
+            '    ' * level + 'i{} = 0'.format(level),
+            '    ' * level + 'while i{} < (m * 2):'.format(level),
+        ]
+
+    lines.append('    ' * 4 + 'x = (m * 3) - 1')
+    lines += [
+        '    ' * level + '    i{0} = i{0} + 1'.format(level)
+        for level in reversed(range(4))
+    ]
+
+    module = LoopInvariantHoisting().transform(ast.parse('\n'.join(lines)))
+    loops = [node for node in ast.walk(module) if isinstance(node, ast.While)]
+
+    # the bounds are read from temporaries, computed once per loop
+    assert len(loops) == 4
+    assert all(loop.test.comparators[0].id.startswith(INVARIANT_PREFIX)
+               for loop in loops)
+
+    env = {'n': 2}
+    fix_locations(module)
+    exec(compile(module, '<test>', 'exec'), env)
+    assert env['x'] == 5 and env['i0'] == 4
+    assert not any(name.startswith(INVARIANT_PREFIX) for name in env)
+
+
+def nested_loops(depth):
+    lines = ['unzip pants', 'stinky i is 0 tons of shit']
+    lines += [
+        '  ' * level + 'constipated while i < 1 tons of shit'
+        for level in range(depth)
+    ]
+    lines.append('  ' * depth + 'stinky i is i + 1 tons of shit')
+    lines += ['  ' * level + 'splosh' for level in reversed(range(depth))]
+    return '\n'.join(lines) + '\n'
+
+
+def test_nested_loops():
+    """
+    CPython compiles at most 20 nested blocks: deeper loops are rejected.
+    """
+
+    for optimize in LEVELS:
+        assert run(nested_loops(20), optimize=optimize) == \
+            ([], None, {'i': 1})
+
+        program = Parser(nested_loops(21)).run()
+
+        with pytest.raises(CompileError) as error:
+            Compiler(program, optimize=optimize).compile()
+
+        assert str(error.value.pos) == 'line 23, column 41'
+        assert 'Too many nested loops' in str(error.value)
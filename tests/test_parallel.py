@@ -0,0 +1,28 @@
+"""
+Parsing programs in several processes.
+"""
+
+from poop.parser import Parser, parse_parallel
+from poop.parser import parallel
+
+from helpers import CODE, shape, run_poop
+
+
+def test_parse_parallel(monkeypatch):
+    code = CODE + CODE.split('\n', 1)[1] * 40
+    monkeypatch.setattr(parallel, 'MIN_CHUNK_SIZE', 256)
+
+    assert shape(parse_parallel(code, workers=2)) == \
+        shape(Parser(code).run())
+
+
+def test_jobs_option(tmp_path):
+    """
+    `--jobs` parses the input file in several processes.
+    """
+
+    path = tmp_path / 'source.poop'
+    path.write_text(CODE + CODE.split('\n', 1)[1] * 600)
+
+    assert run_poop('--jobs', '2', '--parse', str(path)) == \
+        run_poop('--parse', str(path))
@@ -0,0 +1,142 @@
+"""
+Parsing programs.
+"""
+
+from poop.parser import Parser, Stmt, Expr, TokenType
+
+from helpers import CODE, shape
+
+
+def test_packrat():
+    expected = shape(Parser(CODE).run())
+
+    parser = Parser(CODE, packrat=True)
+    assert shape(parser.run()) == expected
+    assert parser.memo_stats()['hits'] == 0
+
+
+def test_packrat_backtracking():
+    """
+    The memo is hit by consumers backtracking over the same nodes.
+    """
+
+    def consume_comparison(self):
+        # fails after consuming the expression of a statement
+        expr = yield Expr
+
+        if expr is None or self.accept(TokenType.IS) is None:
+            return None
+
+        return expr
+
+    grammar = Parser.default_grammar().extended(Stmt, consume_comparison)
+    expected = shape(Parser(CODE).run())
+
+    parser = Parser(CODE, grammar=grammar)
+    assert shape(parser.run()) == expected
+
+    parser = Parser(CODE, packrat=True, grammar=grammar)
+    assert shape(parser.run()) == expected
+    assert parser.memo_stats()['hits'] > 0
+
+
+def test_first_sets():
+    grammar = Parser.default_grammar()
+    consumers, table = grammar.get_dispatch_table(Stmt)
+    firsts = [grammar.firsts[consumer] for consumer in consumers]
+
+    assert frozenset([TokenType.STINKY]) in firsts
+    assert frozenset([TokenType.CONSTIPATED_WHILE]) in firsts
+    assert frozenset([TokenType.IF]) in firsts
+
+    # only the consumers which can start with a token are tried on it
+    for token_type in [None] + list(TokenType):
+        assert table[token_type] == tuple(
+            consumer for consumer, first in zip(consumers, firsts)
+            if token_type in first
+        )
+
+    assert table[None] == ()
+    assert len(table[TokenType.CONSTIPATED_WHILE]) == 1
+
+
+def test_dispatch_without_lookahead():
+    parser = Parser(CODE)
+    parser.lookahead = False
+
+    assert shape(parser.run()) == shape(Parser(CODE).run())
+
+
+def test_inferred_and_given_first_sets():
+    def consume_nothing(self):
+        return Stmt()
+
+    def consume_wipe(self):
+        return self.accept(TokenType.WIPE) and Stmt()
+
+    grammar = Parser.default_grammar()
+    extended = grammar.extended(Stmt, consume_wipe)
+    consumer = extended.get_consumer_queue(Stmt)[0]
+    assert extended.firsts[consumer] == frozenset([TokenType.WIPE])
+
+    extended = grammar.extended(Stmt, consume_wipe, first=[TokenType.READ])
+    consumer = extended.get_consumer_queue(Stmt)[0]
+    assert extended.firsts[consumer] == frozenset([TokenType.READ])
+
+    # consumers which may consume nothing are always tried
+    extended = grammar.extended(Stmt, consume_nothing)
+    consumer = extended.get_consumer_queue(Stmt)[0]
+    assert extended.firsts[consumer] is None
+
+    for token_type in [None] + list(TokenType):
+        consumers = extended.get_dispatch_table(Stmt)[1][token_type]
+        assert consumer in consumers
+
+
+def grouped(node):
+    """
+    Returns an expression with every operation parenthesized.
+    """
+
+    if hasattr(node, 'op'):
+        return '({} {} {})'.format(grouped(node.lhs), node.op, grouped(node.rhs))
+    elif hasattr(node, 'name'):
+        return node.name
+
+    return str(node.value)
+
+
+def parse_expr(code):
+    program = Parser('unzip pants\n' + code + '\n').run()
+    return program.instructions[0].expr
+
+
+def test_precedence():
+    cases = {
+        'a + b * c': '(a + (b * c))',
+        'a * b + c': '((a * b) + c)',
+        'a - b - c': '((a - b) - c)',
+        'a / b / c': '((a / b) / c)',
+        'a + b ^ c * d': '(a + ((b ^ c) * d))',
+        'a < b + c': '(a < (b + c))',
+        'a + b == c * d': '((a + b) == (c * d))',
+        'a < b == c': '((a < b) == c)',
+        '(a + b) * c': '((a + b) * c)',
+    }
+
+    for code, expected in cases.items():
+        assert grouped(parse_expr(code)) == expected
+
+
+def test_right_associative_power():
+    assert grouped(parse_expr('a ^ b ^ c')) == '(a ^ (b ^ c))'
+    assert grouped(parse_expr('a ^ b ^ c * d')) == '((a ^ (b ^ c)) * d)'
+    assert grouped(parse_expr('(a ^ b) ^ c')) == '((a ^ b) ^ c)'
+
+
+def test_operation_spans():
+    expr = parse_expr('a + (b * c) - d')
+
+    assert str(expr.span) == 'line 2 from column 1 to column 16'
+    assert str(expr.lhs.span) == 'line 2 from column 1 to column 12'
+    assert str(expr.lhs.rhs.span) == 'line 2 from column 5 to column 12'
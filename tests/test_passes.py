@@ -0,0 +1,115 @@
+"""
+The pass manager, and the transformer on which passes are built.
+"""
+
+import io
+
+import pytest
+
+from poop.parser import (Parser, Declaration, StmtExpr, IntLiteral, Literal,
+                         walk)
+from poop.optimizer import (PassManager, NodeTransformer, ConstantFolding,
+                            DeadBranchElimination, DeadStoreElimination,
+                            replace)
+
+
+CODE = (
+    'unzip pants\n'
+    'stinky x is 1 tons of shit\n'
+    'shitspray(x + 2 tons of shit)\n'
+    'constipated while x < 3 tons of shit\n'
+    '  stinky x is x + 1 tons of shit\n'
+    'splosh\n'
+)
+
+
+class DoubleInts(NodeTransformer):
+    """
+    Doubles the integer literals.
+    """
+
+    def visit_Literal(self, node):
+        if not isinstance(node, IntLiteral):
+            return node
+
+        self.rewrites += 1
+        return replace(node, value=node.value * 2)
+
+
+class SplitDeclarations(NodeTransformer):
+    """
+    Removes the expression statements, and declares each variable twice.
+    """
+
+    def visit_StmtExpr(self, node):
+        return None
+
+    def visit_Declaration(self, node):
+        return [node, node]
+
+
+def ints(node):
+    return sorted(
+        item.value for item in walk(node) if isinstance(item, IntLiteral))
+
+
+def test_transformer():
+    program = Parser(CODE).run()
+    transformer = DoubleInts()
+    result = transformer.transform(program)
+
+    # the visit methods are found along the MRO, once per node type
+    assert transformer.get_visitor(IntLiteral) == transformer.visit_Literal
+    assert IntLiteral in transformer._dispatch
+    assert Literal not in transformer._dispatch
+
+    # the tree is copied, not modified
+    assert ints(result) == [2 * value for value in ints(program)]
+    assert transformer.rewrites == len(ints(program))
+    assert result is not program and ints(program) == [1, 1, 2, 3]
+
+
+def test_statement_lists():
+    program = SplitDeclarations().transform(Parser(CODE).run())
+    instrs = program.instructions
+
+    assert [type(stmt) for stmt in instrs] == \
+        [Declaration, Declaration, type(instrs[2])]
+    assert not any(isinstance(node, StmtExpr) for node in walk(program))
+    assert len(instrs[2].body) == 2
+
+
+def test_deep_tree():
+    code = 'unzip pants\nshitspray(' + '(' * 3000 + '1 tons of shit' + \
+        ' + 1 tons of shit)' * 3000 + ')\n'
+
+    program = DoubleInts().transform(Parser(code).run())
+    assert set(ints(program)) == {2}
+
+
+def test_levels():
+    assert PassManager(0).pipeline == ()
+    assert PassManager(1).pipeline[:3] == \
+        (ConstantFolding, DeadBranchElimination, DeadStoreElimination)
+    assert set(PassManager(1).pipeline) <= set(PassManager(2).pipeline)
+
+    with pytest.raises(ValueError):
+        PassManager(3)
+
+
+def test_passes_and_report():
+    manager = PassManager(1, passes=[DoubleInts, DoubleInts])
+    program = manager.run(Parser(CODE).run())
+
+    assert ints(program) == [4, 4, 8, 12]
+    assert [(stats.name, stats.rewrites) for stats in manager.stats] == \
+        [('DoubleInts', 4), ('DoubleInts', 4)]
+
+    report = io.StringIO()
+    manager.report(report)
+    lines = report.getvalue().splitlines()
+
+    assert lines[0] == 'Optimization level 1:'
+    assert [line.split()[0] for line in lines[1:]] == \
+        ['DoubleInts', 'DoubleInts']
+    assert all(line.endswith('4 rewrites') for line in lines[1:])
@@ -0,0 +1,71 @@
+"""
+Serializing ASTs, and caching them.
+"""
+
+import os
+import threading
+
+from poop.parser import Parser, Stmt, ASTCache, dump_ast, load_ast
+
+from helpers import CODE, shape
+
+
+def test_dump_and_load():
+    program = Parser(CODE).run()
+
+    assert shape(load_ast(dump_ast(program), CODE)) == shape(program)
+
+
+def test_load_part():
+    """
+    The nodes of a part of a source are located in the whole source.
+    """
+
+    start = CODE.index('constipated')
+    stmts = Parser(CODE[start:]).many(Stmt)
+
+    loaded = load_ast(dump_ast(stmts), CODE, base=start)
+    assert shape(loaded) == shape(Parser(CODE).run().instructions[2:])
+
+
+def test_cache(tmp_path):
+    cache = ASTCache(str(tmp_path / 'cache'))
+    expected = shape(Parser(CODE).run())
+
+    assert cache.load(CODE) is None
+    assert shape(cache.parse(CODE)) == expected
+    assert shape(cache.load(CODE)) == expected
+
+    # invalid entries are parsed again
+    with open(cache.entry_path(CODE), 'wb') as entry:
+        entry.write(b'PAST\x01\x05')
+
+    assert cache.load(CODE) is None
+    assert shape(cache.parse(CODE)) == expected
+
+
+def test_cache_threads(tmp_path):
+    """
+    Entries stored at once by several threads are written whole.
+    """
+
+    cache = ASTCache(str(tmp_path))
+    program = Parser(CODE).run()
+    stored = []
+
+    def store():
+        for _ in range(20):
+            stored.append(cache.store(CODE, program))
+
+    threads = [threading.Thread(target=store) for _ in range(8)]
+
+    for thread in threads:
+        thread.start()
+
+    for thread in threads:
+        thread.join()
+
+    assert all(stored)
+    assert os.listdir(str(tmp_path)) == \
+        [os.path.basename(cache.entry_path(CODE))]
+    assert shape(cache.load(CODE)) == shape(program)
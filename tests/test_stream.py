@@ -0,0 +1,64 @@
+"""
+Parsing programs from streams, statement by statement.
+"""
+
+import io
+
+from poop.parser import Parser
+
+from helpers import CODE, shape
+
+
+def test_parse_stream():
+    expected = shape(Parser(CODE).run().instructions)
+
+    for chunk_size in (1, 7, 64, 4096):
+        stream = io.StringIO(CODE)
+        stmts = list(Parser.parse_stream(stream, chunk_size=chunk_size))
+        assert shape(stmts) == expected
+
+        stream = io.BufferedReader(io.BytesIO(CODE.encode('utf-8')))
+        stmts = list(Parser.parse_stream(stream, chunk_size=chunk_size))
+        assert shape(stmts) == expected
+
+
+class LineStream:
+    """
+    Binary stream returning one line per read, as a pipe written to line by
+    line.
+    """
+
+    def __init__(self, code):
+        self.lines = code.encode('utf-8').splitlines(keepends=True)
+        self.reads = 0
+
+    def read1(self, size):
+        if self.reads == len(self.lines):
+            return b''
+
+        self.reads += 1
+        return self.lines[self.reads - 1]
+
+    read = read1
+
+
+def test_parse_stream_without_lookahead():
+    """
+    The statements are yielded once their last line is read.
+    """
+
+    stream = LineStream(CODE)
+    expected = Parser(CODE).run().instructions
+
+    stmts = []
+
+    for stmt in Parser.parse_stream(stream):
+        last_line = CODE[:expected[len(stmts)].end].rstrip('\n').count('\n')
+        assert stream.reads == last_line + 1
+        stmts.append(stmt)
+
+    # only the spans of the statements differ, not including blank lines
+    assert len(stmts) == len(expected)
+
+    for stmt, full_stmt in zip(stmts, expected):
+        assert shape(stmt)[1:] == shape(full_stmt)[1:]
@@ -0,0 +1,80 @@
+"""
+Parsers and compilers running in several threads at once.
+"""
+
+import gc
+import sys
+import threading
+
+from poop.parser import Parser, dump_ast, load_ast
+from poop.compiler import Compiler
+from poop.prelude import default_env
+
+
+DEEP = 3000
+
+PROGRAMS = [
+    'unzip pants\n'
+    'stinky i is 0 tons of shit\n'
+    'stinky s is ""\n'
+    'constipated while i < 20 tons of shit\n'
+    '  stinky s is s + "x"\n'
+    '  stinky i is i + 1 tons of shit\n'
+    'splosh\n'
+    'shitspray(i, s)\n',
+
+    'unzip pants\n'
+    'stinky k is 1 tons of shit\n'
+    'shitspray(' + '(' * DEEP + 'k' + ' + k)' * DEEP + ')\n',
+
+    'unzip pants\n'
+    'stinky k is 2 tons of shit\n'
+    'shitspray(' + '(' * 400 + 'k' + ' * 1 tons of shit)' * 400 + ')\n',
+]
+
+
+def run(code, optimize):
+    """
+    Parses, compiles and runs a program, and returns what it printed.
+    """
+
+    printed = []
+    env = dict(default_env, shitspray=lambda *args: printed.append(args))
+
+    program = Parser(code).run()
+    program = load_ast(dump_ast(program), code)
+    Compiler(program, optimize=optimize).load(env)
+
+    return printed
+
+
+def test_parse_and_compile_in_threads():
+    expected = {
+        (code, optimize): run(code, optimize)
+        for code in PROGRAMS for optimize in (0, 2)
+    }
+
+    limit = sys.getrecursionlimit()
+    gc_enabled = gc.isenabled()
+    failures = []
+
+    def work(index):
+        try:
+            for round in range(3):
+                for code, optimize in expected:
+                    if run(code, optimize) != expected[code, optimize]:
+                        failures.append((index, 'different output'))
+        except Exception as exc:
+            failures.append((index, exc))
+
+    threads = [threading.Thread(target=work, args=(i,)) for i in range(8)]
+
+    for thread in threads:
+        thread.start()
+
+    for thread in threads:
+        thread.join()
+
+    assert failures == []
+    assert sys.getrecursionlimit() == limit
+    assert gc.isenabled() == gc_enabled